@@ -0,0 +1,46 @@
+""" Compare event-loop time spent on battery reading: old blocking probe loop vs. one tick of background sampler.
+
+Run on device:  import benchmarks.battery
+"""
+from slider.Battery import Battery
+from slider.Config import Config
+import utime
+
+ROUNDS = 20
+
+
+def blocking_read(adc, probes: int) -> int:
+    """ Battery reading as it was done on every display refresh
+    """
+
+    probe = i = 0
+    while i < probes:
+        probe = probe + adc.read()
+        i = i + 1
+
+    return int(probe / probes)
+
+
+def measure(fn, rounds: int = ROUNDS) -> float:
+    start = utime.ticks_us()
+    for _ in range(rounds):
+        fn()
+    return utime.ticks_diff(utime.ticks_us(), start) / rounds
+
+
+battery = Battery(Config.adc(), Config.battery_max_voltage, Config.battery_min_voltage, Config.battery_buffer_size,
+                  Config.battery_samples_per_tick, Config.battery_sample_interval_ms)
+battery.sample(Config.battery_buffer_size)
+
+blocking_us = measure(lambda: blocking_read(Config.adc(), Config.battery_probes_amount))
+sampler_us = measure(battery.sample)
+
+# display refreshes every 10 ms, sampler ticks every battery_sample_interval_ms
+blocking_per_second = blocking_us * 100
+sampler_per_second = sampler_us * (1000 / Config.battery_sample_interval_ms)
+
+print('blocking read:  %8.1f us/call  %10.1f us/s of loop time' % (blocking_us, blocking_per_second))
+print('sampler tick:   %8.1f us/call  %10.1f us/s of loop time' % (sampler_us, sampler_per_second))
+print('saved:          %10.1f us/s (%.1f%% of event loop)' % (
+    blocking_per_second - sampler_per_second, (blocking_per_second - sampler_per_second) / 10000))
+print('level:', battery.level())
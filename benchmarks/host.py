@@ -0,0 +1,349 @@
+""" Micro-benchmarks of slider hot paths, run on the host against simulated hardware. Reports operations per second and
+heap bytes per operation (peak of traced allocations while one operation runs) and compares them with saved baseline.
+Exits with 1 when any benchmark is slower or allocates more than threshold allows.
+
+Speed is compared as ratio to a fixed reference workload timed in turns with every benchmark, so the baseline holds on
+other machines and under other load. Allocations are compared only with baseline of the same Python version. Host
+numbers don't tell how fast the chip is, only whether a change made the code faster or slower.
+
+Baseline is saved from the median of SAVE_RUNS runs of the suite and benchmark which looks regressed is run again,
+it fails only if the median of its runs regressed too. So single noisy run neither moves the baseline nor fails.
+
+Usage:  python3 -m benchmarks.host [--save] [--threshold 0.25] [--baseline benchmarks/baseline.json] [name ...]
+"""
+import argparse
+import gc
+import json
+import os
+import socket
+import struct
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == '__main__':
+    sys.path.insert(0, ROOT)
+
+from sim import hardware
+from sim.stack import Stack
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+""" Every benchmark runs at least this long (seconds), best of REPEATS is taken
+"""
+MIN_TIME = 0.1
+REPEATS = 7
+
+""" Runs of the suite for saved baseline, median of them is stored
+"""
+SAVE_RUNS = 5
+
+""" More runs of benchmark which regressed, it fails if the median of all its runs regressed
+"""
+CONFIRM_RUNS = 2
+
+""" Allocation growth below this amount of bytes is noise of the interpreter, not a regression
+"""
+ALLOC_SLACK = 16
+
+""" Grid of Motor.calculate: distances in mm and times in s, slow creeps and too fast moves included
+"""
+DISTANCES = (1, 10, 50, 100, 250, 500, 1000)
+TIMES = (1, 10, 60, 600, 3600, 28800)
+
+
+class Connection:
+    """ Connection which hands one queued message to client and keeps only the last reply
+    """
+
+    def __init__(self):
+        self.message = None
+        self.reply = None
+
+    def read(self):
+        msg = self.message
+        self.message = None
+        return msg
+
+    def write(self, msg, binary: bool = False):
+        self.reply = msg
+
+    def is_closed(self) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+
+def reference():
+    """ Fixed pure Python work (calls, arithmetic, dict, string), speed of the interpreter on this machine
+    """
+
+    values = {}
+    for i in range(64):
+        values[i & 7] = values.get(i & 7, 0) + i * 3 // 2
+    return '%d' % sum(values.values())
+
+
+def mask(payload: bytes) -> bytes:
+    """ Masked text frame as sent by browser
+    """
+
+    key = b'\x12\x34\x56\x78'
+    return (struct.pack('!BB', 0x81, 0x80 | len(payload)) + key +
+            bytes(b ^ key[i & 3] for i, b in enumerate(payload)))
+
+
+def benchmarks(stack: Stack) -> dict:
+    """ Benchmarks by name: (operation, list of argument tuples), every tuple is one operation
+    """
+
+    from slider.MotorDriver import MotorDriver
+    from slider.Protocol import Protocol
+    from slider.StatusFrame import StatusFrame
+    from slider_socket import SliderClient
+    from uwebsocket import WebSocketConnection
+
+    motor = stack.motor
+    status = stack.status
+    loop = stack.loop
+
+    stack.battery.sample(len(stack.battery.buffer))
+
+    def calculate(distance, time):
+        try:
+            motor.calculate(distance, time)
+        except RuntimeError:
+            pass
+
+    # display frame is rendered while the dolly moves, clock goes on by one frame between renders
+    loop.create_task(motor.move(MotorDriver.RIGHT, 500, 3600))
+    while not motor.driver.running:
+        loop.run_once()
+
+    display = status.display_status()
+    display.send(None)
+    frame_us = stack.display.frame_ms * 1000
+
+    def display_frame():
+        hardware.clock.wait(frame_us)
+        display.send(None)
+
+    json_frame = StatusFrame(StatusFrame.ALL)
+    binary_frame = StatusFrame(StatusFrame.ALL, True)
+
+    def status_json():
+        status.collect()
+        return json_frame.encode(status.values)
+
+    def status_binary():
+        status.collect()
+        return binary_frame.encode(status.values)
+
+    connection = Connection()
+    client = SliderClient(connection, stack.slider)
+
+    def process(msg):
+        connection.message = msg
+        client.process()
+
+    messages = [
+        (b'{"action": "envelope", "distance": 500}',),
+        (b'{"action": "resolution", "value": 4}',),
+        (b'[{"action": "driver", "value": 8, "direction": "left"}, {"action": "envelope", "distance": 100}]',),
+        (b'{"action": "move"}',),
+        (Protocol.encode(Protocol.ENVELOPE, 500),),
+        (Protocol.encode(Protocol.SUBSCRIBE, StatusFrame.ALL, 0),),
+    ]
+
+    server, peer = socket.socketpair()
+    ws = WebSocketConnection('bench', server, None)
+    command = mask(b'{"action": "envelope", "distance": 500}')
+    frame = status_json()
+
+    def ws_read():
+        peer.send(command)
+        return ws.read()
+
+    def ws_write():
+        ws.write(frame)
+        peer.recv(4096)
+
+    return {
+        'motor_calculate': (calculate, [(d, t) for d in DISTANCES for t in TIMES]),
+        'battery_level': (status.battery_level, [()]),
+        'display_frame': (display_frame, [()]),
+        'status_json': (status_json, [()]),
+        'status_binary': (status_binary, [()]),
+        'client_process': (process, messages),
+        'ws_read': (ws_read, [()]),
+        'ws_write': (ws_write, [()]),
+    }
+
+
+def measure(operation, cases: list, rounds: int) -> float:
+    """ Seconds of rounds over cases, garbage collection doesn't run meanwhile (like in timeit)
+    """
+
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for args in cases:
+                operation(*args)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def calibrate(operation, cases: list) -> int:
+    """ Rounds over cases which take at least MIN_TIME
+    """
+
+    rounds = 1
+    while True:
+        elapsed = measure(operation, cases, rounds)
+        if elapsed >= MIN_TIME:
+            return rounds
+        rounds *= 2 if elapsed * 4 < MIN_TIME else 1.5
+        rounds = int(rounds)
+
+
+def timing(operation, cases: list) -> tuple:
+    """ Operations per second and ratio of it to operations of reference workload per second, best of repeats. Both
+    are timed in turns, so the ratio doesn't move with speed and load of the machine.
+    """
+
+    rounds = calibrate(operation, cases)
+    reference_rounds = calibrate(reference, [()])
+
+    best = reference_best = None
+    for _ in range(REPEATS):
+        elapsed = measure(reference, [()], reference_rounds)
+        reference_best = elapsed if reference_best is None else min(reference_best, elapsed)
+        elapsed = measure(operation, cases, rounds)
+        best = elapsed if best is None else min(best, elapsed)
+
+    ops_per_s = rounds * len(cases) / best
+    return ops_per_s, ops_per_s / (reference_rounds / reference_best)
+
+
+def allocations(operation, cases: list) -> float:
+    """ Mean of heap bytes which single operation needs at its peak
+    """
+
+    total = 0
+    tracemalloc.start()
+    try:
+        for args in cases:
+            operation(*args)
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            operation(*args)
+            total += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+
+    return total / len(cases)
+
+
+def compare(results: dict, baseline: dict, threshold: float, heap: bool = True) -> list:
+    """ Names of benchmarks which regressed against baseline, speed is compared relative to reference workload
+    """
+
+    regressed = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if 'relative' in base and result['relative'] < base['relative'] * (1 - threshold):
+            regressed.append(name)
+        elif heap and result['bytes_per_op'] > base['bytes_per_op'] * (1 + threshold) + ALLOC_SLACK:
+            regressed.append(name)
+    return regressed
+
+
+def run(names: list = None) -> dict:
+    stack = Stack(hardware.VirtualClock())
+    suite = benchmarks(stack)
+
+    results = {}
+    for name, (operation, cases) in suite.items():
+        if names and name not in names:
+            continue
+        ops_per_s, relative = timing(operation, cases)
+        results[name] = {
+            'ops_per_s': ops_per_s,
+            'relative': relative,
+            'bytes_per_op': allocations(operation, cases),
+        }
+    return results
+
+
+def median(runs: list) -> dict:
+    """ Result of run with median speed ratio for every benchmark
+    """
+
+    results = {}
+    for name in runs[0]:
+        ordered = sorted((run[name] for run in runs), key=lambda result: result['relative'])
+        results[name] = ordered[len(ordered) // 2]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks.host', description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file')
+    parser.add_argument('--save', action='store_true', help='save results as new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown and allocation growth')
+    args = parser.parse_args()
+
+    results = median([run(args.names) for _ in range(SAVE_RUNS)]) if args.save else run(args.names)
+
+    python = '.'.join(sys.version.split('.')[:2])
+    baseline = {}
+    same_python = True
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved['results']
+        same_python = saved['python'] == python
+
+    print('%-16s %12s %10s %8s %12s %8s' % ('benchmark', 'ops/s', 'relative', 'change', 'bytes/op', 'change'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        speed = alloc = ''
+        if base:
+            if 'relative' in base:
+                speed = '%+.1f%%' % ((result['relative'] / base['relative'] - 1) * 100)
+            alloc = '%+d' % round(result['bytes_per_op'] - base['bytes_per_op'])
+        print('%-16s %12.0f %10.4f %8s %12.0f %8s' % (name, result['ops_per_s'], result['relative'], speed,
+                                                      result['bytes_per_op'], alloc))
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': python, 'results': baseline}, f, indent=2, sort_keys=True)
+        print('Baseline saved:', args.baseline)
+        return
+
+    if not same_python:
+        print('Baseline is from Python %s, allocations are not compared' % saved['python'])
+
+    regressed = compare(results, baseline, args.threshold, same_python)
+    if regressed:
+        print('Running again:', ', '.join(regressed))
+        runs = [results] + [run(regressed) for _ in range(CONFIRM_RUNS)]
+        confirmed = median([{name: result[name] for name in regressed} for result in runs])
+        regressed = compare(confirmed, baseline, args.threshold, same_python)
+
+    if regressed:
+        print('Regressed over %d%%:' % (args.threshold * 100), ', '.join(regressed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+""" Measure command latency and idle wakeups of slider web server from a computer connected to slider WiFi.
+
+Usage:  python3 benchmarks/latency.py [host] [commands] [idle seconds]
+"""
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+
+def connect(host: str, port: int = 80) -> socket.socket:
+    sock = socket.create_connection((host, port))
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall(('GET / HTTP/1.1\r\nHost: %s\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                  'Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n' % (host, key)).encode())
+
+    response = b''
+    while b'\r\n\r\n' not in response:
+        response += sock.recv(1)
+    if b' 101 ' not in response.split(b'\r\n')[0]:
+        raise RuntimeError('Handshake failed: %r' % response)
+
+    return sock
+
+
+def send(sock: socket.socket, command: dict):
+    payload = json.dumps(command).encode()
+    mask = os.urandom(4)
+    masked = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+    sock.sendall(struct.pack('!BB', 0x81, 0x80 | len(payload)) + mask + masked)
+
+
+def receive(sock: socket.socket) -> bytes:
+    header = recv_exactly(sock, 2)
+    length = header[1] & 0x7f
+    if length == 126:
+        length = struct.unpack('!H', recv_exactly(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', recv_exactly(sock, 8))[0]
+    return recv_exactly(sock, length)
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def request(sock: socket.socket, command: dict, key: str) -> dict:
+    """ Send command and wait for JSON response which contains key, skipping status frames
+    """
+
+    send(sock, command)
+    while True:
+        msg = json.loads(receive(sock))
+        if key in msg:
+            return msg
+
+
+def main(host: str = '192.168.4.1', commands: int = 200, idle: float = 10):
+    sock = connect(host)
+
+    latencies = []
+    for _ in range(commands):
+        start = time.perf_counter()
+        request(sock, {'action': 'envelope', 'distance': 100}, 'speed')
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    print('round trip ms: min %.2f  p50 %.2f  p90 %.2f  p99 %.2f  max %.2f' % (
+        latencies[0], latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.9)],
+        latencies[int(len(latencies) * 0.99)], latencies[-1]))
+
+    before = request(sock, {'action': 'stats'}, 'wakeups')
+    time.sleep(idle)
+    after = request(sock, {'action': 'stats'}, 'wakeups')
+
+    wakeups = after['wakeups'] - before['wakeups'] - 1
+    elapsed = (after['uptime_ms'] - before['uptime_ms']) / 1000
+    print('idle wakeups:  %d in %.1f s (%.1f/s)' % (wakeups, elapsed, wakeups / elapsed))
+    print('processing us: avg %d  max %d' % (after['latency_avg_us'], after['latency_max_us']))
+
+
+if __name__ == '__main__':
+    main(*[t(v) for t, v in zip((str, int, float), sys.argv[1:])])
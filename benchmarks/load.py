@@ -0,0 +1,439 @@
+""" Load test of slider web server on the host: SliderServer runs on simulated hardware, swarms of WebSocket and HTTP
+clients (threads of a separate process) connect to it on localhost, send commands, reconnect and load pages.
+
+Reports latency from sending move command to motor start, status frames delivered to clients from those sent by
+server, connections rejected with 503 and heap high-water mark of the server above its idle state.
+
+Usage:  python3 -m benchmarks.load [--ws 4] [--http 2] [--seconds 10] [--think 0.5] [--reconnect 0.05] [--polled]
+"""
+import argparse
+import base64
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.latency import receive, send
+
+""" Commands sent by WebSocket clients and their weights, every move is followed by stop after a while
+"""
+ACTIONS = ('move', 'envelope', 'stats', 'resolution', 'subscribe')
+WEIGHTS = (25, 35, 15, 15, 10)
+
+""" Pages loaded by HTTP clients
+"""
+PAGES = ('/', '/index.html', '/index.html', '/missing.js')
+
+""" Handshake headers in order of mobile browser, Upgrade isn't at the beginning of request
+"""
+HANDSHAKE = ('GET / HTTP/1.1\r\nHost: 127.0.0.1:%d\r\nConnection: Upgrade\r\nPragma: no-cache\r\n'
+             'Cache-Control: no-cache\r\nUser-Agent: Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 '
+             '(KHTML, like Gecko) Chrome/118.0.0.0 Mobile Safari/537.36\r\nUpgrade: websocket\r\n'
+             'Origin: http://127.0.0.1:%d\r\nSec-WebSocket-Version: 13\r\nAccept-Encoding: gzip, deflate\r\n'
+             'Accept-Language: en-US,en;q=0.9\r\nSec-WebSocket-Key: %s\r\n'
+             'Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n\r\n')
+
+""" First field of every status group, status frame contains at least one of them
+"""
+STATUS_FIELDS = ('running', 'total', 'position', 'voltage', 'segment')
+
+""" Seconds to wait for server before request counts as failed
+"""
+TIMEOUT = 5
+
+
+class Rejected(Exception):
+    pass
+
+
+def move_key(n: int) -> tuple:
+    """ Distance (mm) and time (s) of n-th move, the pair identifies move on server side. All of them are in allowed
+    speed range.
+    """
+
+    return 5 + n % 40, 2 + (n // 40) % 400
+
+
+def read_response(sock: socket.socket) -> bytes:
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = sock.recv(1)
+        if not chunk:
+            break
+        response += chunk
+    return response
+
+
+def status_code(response: bytes) -> int:
+    parts = response.split(b' ', 2)
+    return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+
+
+def connect(port: int) -> socket.socket:
+    sock = socket.create_connection(('127.0.0.1', port), TIMEOUT)
+    try:
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock.sendall((HANDSHAKE % (port, port, key)).encode())
+
+        code = status_code(read_response(sock))
+        if code == 503:
+            raise Rejected()
+        if code != 101:
+            raise OSError('Handshake failed with %d' % code)
+    except Exception:
+        sock.close()
+        raise
+
+    sock.settimeout(None)
+    return sock
+
+
+def read_frames(sock: socket.socket, result: dict):
+    """ Count status frames and replies till connection is closed
+    """
+
+    while True:
+        try:
+            payload = receive(sock)
+        except (EOFError, OSError):
+            return
+
+        try:
+            msg = json.loads(payload)
+        except ValueError:
+            result['errors'] += 1
+            continue
+
+        if isinstance(msg, dict) and any(field in msg for field in STATUS_FIELDS):
+            result['status_frames'] += 1
+        else:
+            result['replies'] += 1
+
+
+def ws_client(port: int, deadline: float, think: float, reconnect: float, seed: int, sequence, moves: dict) -> dict:
+    rng = random.Random(seed)
+    result = dict(connects=0, rejected=0, failed=0, commands=0, status_frames=0, replies=0, errors=0, connected_s=0.0)
+
+    while time.perf_counter() < deadline:
+        try:
+            sock = connect(port)
+        except Rejected:
+            result['rejected'] += 1
+            time.sleep(rng.uniform(0.1, 0.5))
+            continue
+        except OSError:
+            result['failed'] += 1
+            time.sleep(rng.uniform(0.1, 0.5))
+            continue
+
+        result['connects'] += 1
+        connected = time.perf_counter()
+        reader = threading.Thread(target=read_frames, args=(sock, result))
+        reader.start()
+
+        try:
+            send(sock, {'action': 'subscribe'})
+            while time.perf_counter() < deadline:
+                time.sleep(rng.expovariate(1 / think))
+                if rng.random() < reconnect:
+                    break
+
+                action = rng.choices(ACTIONS, WEIGHTS)[0]
+                result['commands'] += 1
+
+                if action == 'move':
+                    key = move_key(next(sequence))
+                    moves[key] = time.perf_counter()
+                    send(sock, {'action': 'move', 'distance': key[0], 'time': key[1],
+                                'direction': rng.choice(('left', 'right'))})
+                    time.sleep(rng.uniform(0.2, 1.0))
+                    send(sock, {'action': 'stop'})
+                    result['commands'] += 1
+                elif action == 'envelope':
+                    send(sock, {'action': 'envelope', 'distance': rng.randint(1, 1000)})
+                elif action == 'resolution':
+                    send(sock, {'action': 'resolution', 'value': rng.choice((1, 2, 4, 8, 16))})
+                elif action == 'subscribe':
+                    send(sock, {'action': 'subscribe', 'fields': rng.sample(('motor', 'time', 'position'), 2)})
+                else:
+                    send(sock, {'action': action})
+        except OSError:
+            result['failed'] += 1
+        finally:
+            with contextlib.suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+            reader.join()
+            result['connected_s'] += time.perf_counter() - connected
+
+    return result
+
+
+def http_client(port: int, deadline: float, think: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    result = dict(requests=0, failed=0, bytes=0, codes={}, latency_ms=[])
+    etags = {}
+
+    while time.perf_counter() < deadline:
+        time.sleep(rng.expovariate(1 / think))
+        page = rng.choice(PAGES)
+
+        request = 'GET %s HTTP/1.1\r\nHost: 127.0.0.1:%d\r\nAccept-Encoding: gzip, deflate\r\n' % (page, port)
+        if page in etags and rng.random() < 0.5:
+            request += 'If-None-Match: %s\r\n' % etags[page]
+
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(('127.0.0.1', port), TIMEOUT) as sock:
+                sock.sendall((request + '\r\n').encode())
+                response = b''
+                while True:
+                    chunk = sock.recv(4096)
+                    if not chunk:
+                        break
+                    response += chunk
+        except OSError:
+            result['failed'] += 1
+            continue
+
+        result['requests'] += 1
+        result['latency_ms'].append((time.perf_counter() - start) * 1000)
+        result['bytes'] += len(response)
+
+        code = status_code(response)
+        result['codes'][code] = result['codes'].get(code, 0) + 1
+        for line in response.split(b'\r\n\r\n')[0].split(b'\r\n'):
+            if line.lower().startswith(b'etag:'):
+                etags[page] = line[5:].strip().decode()
+
+    return result
+
+
+def swarm(port: int, options: dict, pipe):
+    """ Run all clients in threads till deadline and send their results through pipe
+    """
+
+    deadline = time.perf_counter() + options['seconds']
+    sequence = itertools.count()
+    moves = {}
+    results = []
+
+    def run(target, *args):
+        results.append(target(*args))
+
+    threads = [threading.Thread(target=run, args=(ws_client, port, deadline, options['think'], options['reconnect'],
+                                                  i, sequence, moves))
+               for i in range(options['ws'])]
+    threads += [threading.Thread(target=run, args=(http_client, port, deadline, options['think'], 1000 + i))
+                for i in range(options['http'])]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    pipe.send((results, moves))
+
+
+class Probe:
+    """ Server side of measurements: time when motor starts each traced move and amount of status frames sent
+    """
+
+    def __init__(self, stack):
+        self.loop = stack.loop
+        self.motor = stack.motor
+        self.keys = {}
+        self.started = {}
+        self.frames = 0
+
+        self.motor.listeners.append(self.motor_changed)
+
+        move = self.motor.move
+
+        def traced(direction: int, distance: int = None, time: int = None, token: int = None):
+            return self.traced((distance, time), move(direction, distance, time, token))
+
+        self.motor.move = traced
+
+        status = stack.status
+        collect = status.collect
+
+        def counted():
+            # status is collected once per broadcast and sent to every socket
+            self.frames += len(status.sockets)
+            collect()
+
+        status.collect = counted
+
+    def traced(self, key: tuple, generator):
+        """ Remember key of move for the task which runs it
+        """
+
+        task = self.loop.current
+        self.keys[task] = key
+        try:
+            return (yield from generator)
+        finally:
+            self.keys.pop(task, None)
+
+    def motor_changed(self):
+        key = self.keys.pop(self.loop.current, None)
+        if key is not None and self.motor.driver.running:
+            self.started[key] = time.perf_counter()
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(len(values) * q))], 2)
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': round(values[-1], 2)}
+
+
+def load(ws: int = 4, http: int = 2, seconds: float = 10, think: float = 0.5, reconnect: float = 0.05,
+         polled: bool = False, port: int = 0) -> dict:
+    """ Run server under load of clients for seconds, returns report
+    """
+
+    from sim.stack import Stack
+
+    stack = Stack()
+
+    from slider_socket import SliderServer
+    import uasyncio as asyncio
+
+    probe = Probe(stack)
+
+    if not port:
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+
+    server = SliderServer(stack.slider)
+    loop = stack.loop
+
+    # firmware prints every connection, keep report readable
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        stack.start(False)
+        if polled:
+            server.start(port)
+            loop.call_soon(server.process_all())
+        else:
+            # accept loop never returns, it listens after its first step
+            loop.create_task(server.serve(port))
+            while server.ready_ms is None:
+                loop.run_once()
+
+        receiver, sender = multiprocessing.Pipe(False)
+        options = {'ws': ws, 'http': http, 'seconds': seconds, 'think': think, 'reconnect': reconnect}
+        process = multiprocessing.Process(target=swarm, args=(port, options, sender))
+        process.start()
+
+        # only server process is traced, heap of simulator is included
+        tracemalloc.start()
+        idle = tracemalloc.get_traced_memory()[0]
+
+        def wait():
+            while not receiver.poll():
+                yield from asyncio.sleep_ms(50)
+            return receiver.recv()
+
+        results, moves = stack.run(wait())
+        process.join()
+
+        heap, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        server.stop()
+
+    ws_results = [result for result in results if 'connects' in result]
+    http_results = [result for result in results if 'requests' in result]
+    total = lambda results, key: sum(result[key] for result in results)
+
+    latencies = [(probe.started[key] - sent) * 1000 for key, sent in moves.items() if key in probe.started]
+    frames = total(ws_results, 'status_frames')
+    connected_s = total(ws_results, 'connected_s')
+
+    codes = {}
+    for result in http_results:
+        for code, count in result['codes'].items():
+            codes[code] = codes.get(code, 0) + count
+
+    stats = server.stats()
+    return {
+        'core': 'polled' if polled else 'event-driven',
+        'seconds': seconds,
+        'websocket': {
+            'clients': ws,
+            'connects': total(ws_results, 'connects'),
+            'rejected': total(ws_results, 'rejected'),
+            'failed': total(ws_results, 'failed'),
+            'commands': total(ws_results, 'commands'),
+            'replies': total(ws_results, 'replies'),
+            'errors': total(ws_results, 'errors'),
+        },
+        'moves': {
+            'sent': len(moves),
+            'started': len(latencies),
+            'latency_ms': percentiles(latencies),
+        },
+        'status': {
+            'sent': probe.frames,
+            'received': frames,
+            'delivery': round(frames / probe.frames, 3) if probe.frames else None,
+            'per_client_second': round(frames / connected_s, 2) if connected_s else None,
+        },
+        'http': {
+            'clients': http,
+            'requests': total(http_results, 'requests'),
+            'failed': total(http_results, 'failed'),
+            'codes': codes,
+            'latency_ms': percentiles([ms for result in http_results for ms in result['latency_ms']]),
+        },
+        'server': {
+            'commands': stats['commands'],
+            'processing_avg_us': stats['latency_avg_us'],
+            'processing_max_us': stats['latency_max_us'],
+            'lock': stack.slider.lock.stats(),
+        },
+        'loop': {
+            'max_ms': stack.monitor.max_ms,
+            'p99_ms': stack.monitor.percentile(),
+            'stalls': stack.monitor.stalls,
+            'steps_max_us': stack.monitor.steps_max_us,
+        },
+        'heap': {
+            'high_water_bytes': peak - idle,
+            'end_bytes': heap - idle,
+        },
+        'loop_errors': len(loop.errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks.load', description=__doc__.split('\n')[0])
+    parser.add_argument('--ws', type=int, default=4, help='WebSocket clients')
+    parser.add_argument('--http', type=int, default=2, help='HTTP clients')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of test')
+    parser.add_argument('--think', type=float, default=0.5, help='mean pause of client between commands in s')
+    parser.add_argument('--reconnect', type=float, default=0.05, help='chance of reconnect after every command')
+    parser.add_argument('--polled', action='store_true', help='use polled server core instead of event-driven')
+    parser.add_argument('--port', type=int, default=0, help='port of server, free one by default')
+    args = parser.parse_args()
+
+    report = load(args.ws, args.http, args.seconds, args.think, args.reconnect, args.polled, args.port)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
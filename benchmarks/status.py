@@ -0,0 +1,104 @@
+""" Compare status encoding: nested placeholder dictionary dumped to JSON vs. StatusFrame JSON and binary frames.
+Reports bytes per frame and heap bytes allocated per frame.
+
+Run on device:  import benchmarks.status
+On the host (after sim.install()) heap is the peak of traced allocations while one frame is built.
+"""
+import gc
+import ujson
+import ustruct
+import utime
+from slider.StatusFrame import StatusFrame
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+ROUNDS = 200
+
+
+def legacy() -> str:
+    """ Status as it was built before StatusFrame
+    """
+
+    status = {
+        'errors': None,
+        'motor': {
+            'locked': True,
+            'speed': 12,
+            'frequency': 1000,
+            'microsteps': 4,
+            'start_time': 121345,
+            'current_time': 123423,
+            'direction': 'left',
+        },
+        'slider': {
+            'duration': {
+                'set': 3600,
+                'nice': '01:00:00',
+                'left': 2560
+            },
+            'distance': {
+                'set': 1000,
+                'left': 532
+            }
+        },
+        'battery': {
+            'voltage': 12.4,
+            'percent': 100
+        }
+    }
+    return ujson.dumps(status)
+
+
+def allocations(fn, rounds: int) -> int:
+    """ Heap bytes per frame. On device collector is disabled meanwhile, so gc.mem_alloc() counts every allocation.
+    """
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        current = tracemalloc.get_traced_memory()[0]
+        fn()
+        allocated = tracemalloc.get_traced_memory()[1] - current
+        tracemalloc.stop()
+        return allocated
+
+    gc.collect()
+    gc.disable()
+    heap = gc.mem_alloc()
+    for _ in range(rounds):
+        fn()
+    allocated = gc.mem_alloc() - heap
+    gc.enable()
+    return allocated // rounds
+
+
+def measure(name: str, fn, rounds: int = ROUNDS):
+    size = len(fn())
+
+    start = utime.ticks_us()
+    for _ in range(rounds):
+        fn()
+    elapsed = utime.ticks_diff(utime.ticks_us(), start)
+
+    print('%-16s %5d bytes/frame  %6d heap bytes/frame  %7.1f us/frame' % (
+        name, size, allocations(fn, rounds), elapsed / rounds))
+
+
+# every field gets a value which fits its width in binary frame
+values = StatusFrame.values()
+for i in range(len(values)):
+    code = StatusFrame.FIELDS[i][2]
+    values[i] = min(1000 * i + 7, (1 << (8 * ustruct.calcsize(code) - 1)) - 1)
+
+json_all = StatusFrame(StatusFrame.ALL)
+json_motor = StatusFrame(StatusFrame.MOTOR | StatusFrame.TIME)
+binary_all = StatusFrame(StatusFrame.ALL, True)
+binary_battery = StatusFrame(StatusFrame.BATTERY, True)
+
+measure('legacy json', legacy)
+measure('frame json', lambda: json_all.encode(values))
+measure('frame json m+t', lambda: json_motor.encode(values))
+measure('frame binary', lambda: binary_all.encode(values))
+measure('frame binary bat', lambda: binary_battery.encode(values))
@@ -0,0 +1,73 @@
+import builtins
+import gc
+import sys
+import utime
+
+
+class ImportProfiler:
+    """ Boot profiling: measure time and heap of every module imported while installed. Time and heap of nested
+    imports are included in the module which imports them, heap is negative when collector ran meanwhile.
+    """
+
+    def __init__(self):
+        self.modules = []
+        self.depth = 0
+        self.original = None
+
+    @staticmethod
+    def boot(path: str = 'config.json'):
+        """ Profiler installed when boot_profile is set in settings stored on flash, otherwise None. Flag is read here,
+        not from Config, because importing slider.Config loads the whole package before profiler could be installed.
+        """
+
+        profiler = ImportProfiler().install()
+
+        try:
+            with open(path) as file:
+                import ujson
+                enabled = ujson.load(file).get('boot_profile') is True
+        except (OSError, ValueError):
+            enabled = False
+
+        if not enabled:
+            profiler.uninstall()
+            return None
+
+        return profiler
+
+    def install(self):
+        self.original = builtins.__import__
+        builtins.__import__ = self.load
+        return self
+
+    def uninstall(self):
+        builtins.__import__ = self.original
+
+    def load(self, name, *args):
+        if name in sys.modules:
+            return self.original(name, *args)
+
+        depth = self.depth
+        self.depth += 1
+        heap = gc.mem_alloc()
+        start = utime.ticks_us()
+
+        try:
+            return self.original(name, *args)
+        finally:
+            self.modules.append((name, utime.ticks_diff(utime.ticks_us(), start), gc.mem_alloc() - heap, depth))
+            self.depth = depth
+
+    def report(self):
+        """ Print modules in order of import finish, nested ones indented
+        """
+
+        total_us = total_heap = 0
+        for name, us, heap, depth in self.modules:
+            print('%-32s %8d us %8d B' % ('  ' * depth + name, us, heap))
+            if not depth:
+                total_us += us
+                total_heap += heap
+
+        print('%-32s %8d us %8d B' % ('total', total_us, total_heap))
+        print('setup done %d ms after boot' % utime.ticks_ms())
@@ -1,5 +1,24 @@
-from slider import *
+from import_profiler import ImportProfiler
+
+# report import time and heap of every module, installed before anything of slider is imported
+profiler = ImportProfiler.boot()
+
 from slider.Config import Config
+
+# settings changed over WebSocket are stored on flash
+Config.load()
+
+from slider import Slider
+from slider.Battery import Battery
+from slider.Calibration import Calibration
+from slider.Dolly import Dolly
+from slider.Homing import Homing
+from slider.LoopMonitor import LoopMonitor
+from slider.Motor import Motor
+from slider.MotorDriver import MotorDriver
+from slider.Status import Status
+from machine import Pin
+import network
 import slider_socket
 import uasyncio as asyncio
 
@@ -9,19 +28,41 @@ ap.active(True)
 ap.config(essid=b"SliderMCU", authmode=network.AUTH_WPA_WPA2_PSK, password=b"GoProSlider")
 
 # build slider object
-driver = MotorDriver(Config.pin_step, Config.pin_dir, Config.pin_ms1, Config.pin_ms2, Config.pin_ms3, Config.pin_edge)
-motor = Motor(driver)
-status = Status(motor, Dolly(), Config.display)
-slider = Slider(motor, status)
+driver = MotorDriver(Config.pin('step', Pin.OUT), Config.pin('dir', Pin.OUT), Config.pin('ms1', Pin.OUT),
+                     Config.pin('ms2', Pin.OUT), Config.pin('ms3', Pin.OUT), Config.pin('edge', Pin.IN, Pin.PULL_UP),
+                     Config.motor_timer)
+dolly = Dolly()
+motor = Motor(driver, Config.motor_resolution, Config.motor_pulley, Config.motor_profile, Config.motor_acceleration,
+              Config.motor_jerk, Config.motor_update_ms, Config.motor_exact_steps, Config.motor_lightsleep_ms, dolly)
+battery = Battery(Config.adc(), Config.battery_max_voltage, Config.battery_min_voltage, Config.battery_buffer_size,
+                  Config.battery_samples_per_tick, Config.battery_sample_interval_ms)
+monitor = LoopMonitor(Config.monitor_interval_ms, Config.monitor_stall_ms, Config.monitor_active)
+status = Status(motor, dolly, Config.display(), battery, Config.status_heartbeat_ms, Config.status_moving_ms,
+                Config.status_poll_ms, monitor, Config.display_debug)
+homing = Homing(motor, Config.homing_fast_speed, Config.homing_slow_speed, Config.homing_slow_resolution)
+calibration = Calibration(motor, homing, Config.rail_length, Config.calibration_speed)
+calibration.load()
+slider = Slider(motor, status, homing, calibration)
 
 server = slider_socket.SliderServer(slider)
-server.start()
 
-# initialize asyncio loop
+if profiler is not None:
+    profiler.uninstall()
+    profiler.report()
+
+# initialize asyncio loop, server goes first so it accepts connections as soon as possible
 loop = asyncio.get_event_loop()
 
-loop.call_soon(status.splash_screen())
-loop.call_soon(server.process_all())
+if Config.server_event_driven:
+    loop.create_task(monitor.watch('server', server.serve(Config.server_port)))
+else:
+    server.start(Config.server_port)
+    loop.call_soon(monitor.watch('server', server.process_all()))
+
+loop.call_soon(monitor.watch('battery', battery.run()))
+loop.call_soon(monitor.watch('display', status.splash_screen()))
+loop.call_soon(monitor.watch('status', status.send_status()))
+loop.call_soon(monitor.run())
 
 loop.run_forever()
 
@@ -0,0 +1,76 @@
+""" Simulator of slider hardware for running slider, uwebsocket and main.py on the host (CPython). install() puts
+stand-ins of MicroPython modules into sys.modules, so the code runs without any change:
+
+    import sim
+    sim.install()
+    rail = sim.Rail(12, 14, (4, 16, 17), 0, length_mm=1000)
+
+With sim.install(sim.VirtualClock()) simulated time jumps to the next deadline instead of waiting for it. Run the whole
+firmware with: python3 -m sim --port 8080
+"""
+import gc
+import importlib
+import socket
+import sys
+import tracemalloc
+from sim import hardware
+from sim.hardware import VirtualClock
+from sim.battery import Pack
+from sim.rail import Rail
+
+""" Modules of MicroPython which are simulated
+"""
+STANDINS = ('framebuf', 'machine', 'micropython', 'network', 'ssd1306', 'uasyncio', 'utime', 'websocket',
+            'websocket_helper')
+
+""" Modules of MicroPython which are the same as CPython ones
+"""
+ALIASES = {
+    'uarray': 'array',
+    'ubinascii': 'binascii',
+    'ucollections': 'collections',
+    'uerrno': 'errno',
+    'uhashlib': 'hashlib',
+    'uio': 'io',
+    'ujson': 'json',
+    'uos': 'os',
+    'uselect': 'select',
+    'ustruct': 'struct',
+}
+
+""" Heap of ESP32 port without SPIRAM, gc.mem_free() counts from it
+"""
+HEAP_SIZE = 111168
+
+
+def mem_alloc() -> int:
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def mem_free() -> int:
+    return HEAP_SIZE - mem_alloc()
+
+
+def install(clock: hardware.Clock = None):
+    """ Register stand-in modules, fresh simulated chip is created with given clock (real time by default)
+    """
+
+    hardware.reset(clock)
+
+    for name, module in ALIASES.items():
+        sys.modules[name] = importlib.import_module(module)
+
+    for name in STANDINS:
+        sys.modules[name] = importlib.import_module('sim.' + name)
+
+    sys.modules['uasyncio.core'] = sys.modules['uasyncio'].core
+    sys.modules['uasyncio'].new_event_loop()
+    sys.modules['network'].WLAN.interfaces.clear()
+    sys.modules['machine'].ADC.source = None
+
+    # heap counters are taken from tracemalloc when it traces allocations
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = mem_free
+
+    # sockets of MicroPython are streams
+    socket.socket.write = socket.socket.send
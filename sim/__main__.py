@@ -0,0 +1,61 @@
+""" Run main.py on simulated hardware, connect to ws://127.0.0.1:<port> with the web app or benchmarks/latency.py.
+
+Usage:  python3 -m sim [--port 8080] [--rail 1000] [--position 500] [--flash DIR]
+
+Settings (config.json) are stored in flash directory, a temporary one is used by default.
+"""
+import argparse
+import os
+import runpy
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m sim', description='Run slider firmware on simulated hardware')
+    parser.add_argument('--port', type=int, default=8080, help='port of web server')
+    parser.add_argument('--rail', type=float, default=1000, help='length of rail between endstops in mm')
+    parser.add_argument('--position', type=float, default=None, help='start position of dolly in mm')
+    parser.add_argument('--steps-per-mm', type=float, default=None, help='true full steps per mm of motor and pulley')
+    parser.add_argument('--bounce', type=int, default=0, help='extra edges sent by endstop when it is pressed')
+    parser.add_argument('--battery', type=float, default=8, help='hours of simulated battery')
+    parser.add_argument('--flash', default=None, help='directory with config.json')
+    args = parser.parse_args()
+
+    # firmware sees flash directory as its root, web files are linked into it
+    flash = args.flash or tempfile.mkdtemp(prefix='slider-flash-')
+    if not os.path.exists(os.path.join(flash, 'www')):
+        os.symlink(os.path.join(ROOT, 'www'), os.path.join(flash, 'www'))
+    os.chdir(flash)
+    sys.path.insert(0, ROOT)
+
+    import sim
+    sim.install()
+
+    # only Config is loaded here, main.py imports the rest of slider package itself like on boot (import profiler
+    # sees it then), Config keeps the port set below
+    package = types.ModuleType('slider')
+    package.__path__ = [os.path.join(ROOT, 'slider')]
+    sys.modules['slider'] = package
+    from slider.Config import Config
+    del sys.modules['slider']
+
+    from math import pi
+
+    Config.load()
+    Config.server_port = args.port
+
+    steps_per_mm = args.steps_per_mm or Config.motor_resolution / (pi * Config.motor_pulley)
+    sim.Rail(Config.pin_step, Config.pin_dir, (Config.pin_ms1, Config.pin_ms2, Config.pin_ms3), Config.pin_edge,
+             args.rail, steps_per_mm, args.position, bounce=args.bounce)
+    sim.Pack(hours=args.battery).install()
+
+    print('Flash directory:', flash)
+    runpy.run_path(os.path.join(ROOT, 'main.py'), run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
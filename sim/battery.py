@@ -0,0 +1,32 @@
+""" Simulated LiPo pack which discharges with time, read by machine.ADC
+"""
+from sim import hardware
+from sim.machine import ADC
+
+""" Open-circuit voltage of one cell by used fraction of capacity
+"""
+CURVE = ((0.0, 4.20), (0.05, 4.10), (0.2, 3.95), (0.5, 3.80), (0.8, 3.70), (0.9, 3.60), (0.97, 3.45), (1.0, 3.30))
+
+
+class Pack:
+
+    def __init__(self, cells: int = 3, hours: float = 8, used: float = 0.0):
+        """ Pack is empty after hours of simulated time, used is fraction of capacity drained at start
+        """
+
+        self.cells = cells
+        self.hours = hours
+        self.used = used
+
+    def install(self) -> 'Pack':
+        ADC.source = self.voltage
+        return self
+
+    def voltage(self) -> float:
+        used = self.used + hardware.clock.now_us() / 3600000000 / self.hours
+        if used >= 1:
+            return CURVE[-1][1] * self.cells
+
+        for (u0, v0), (u1, v1) in zip(CURVE, CURVE[1:]):
+            if used <= u1:
+                return (v0 + (v1 - v0) * (used - u0) / (u1 - u0)) * self.cells
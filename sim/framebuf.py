@@ -0,0 +1,167 @@
+""" Stand-in of MicroPython framebuf module for monochrome formats. Text is drawn by placeholder glyphs of the same
+8x8 cell (derived from character code), so drawn areas match the real font but shapes don't.
+"""
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+
+glyphs = {}
+
+
+def glyph(char: str) -> bytes:
+    """ 8 columns of 8 pixels (LSB is top row), blank for space
+    """
+
+    if char in glyphs:
+        return glyphs[char]
+
+    code = ord(char)
+    columns = [0] * 8
+    if code != 32:
+        for x in range(1, 6):
+            columns[x] = 0x41 | (code * (x + 3) * 37 >> 2) & 0x3e
+        columns[1] = columns[5] = 0x7f
+
+    glyphs[char] = bytes(columns)
+    return glyphs[char]
+
+
+class FrameBuffer:
+
+    def __init__(self, buffer, width: int, height: int, format: int, stride: int = None):
+        self.buf = buffer
+        self.width = width
+        self.height = height
+        self.format = format
+        self.stride = width if stride is None else stride
+
+    def _index(self, x: int, y: int) -> tuple:
+        if self.format == MONO_VLSB:
+            return (y >> 3) * self.stride + x, y & 7
+        offset = (y * self.stride + x) >> 3
+        return offset, 7 - (x & 7) if self.format == MONO_HLSB else x & 7
+
+    def pixel(self, x: int, y: int, color: int = None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return
+
+        index, bit = self._index(x, y)
+        if color is None:
+            return self.buf[index] >> bit & 1
+        if color:
+            self.buf[index] |= 1 << bit
+        else:
+            self.buf[index] &= ~(1 << bit) & 0xff
+
+    def fill(self, color: int):
+        value = 0xff if color else 0
+        for i in range(len(self.buf)):
+            self.buf[i] = value
+
+    def fill_rect(self, x: int, y: int, w: int, h: int, color: int):
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        if self.format == MONO_VLSB:
+            # whole column of page at once
+            for page in range(y0 >> 3, ((y1 - 1) >> 3) + 1):
+                top = max(y0 - page * 8, 0)
+                bottom = min(y1 - page * 8, 8)
+                self._or_column(page, x0, x1, (1 << bottom) - (1 << top), color)
+            return
+
+        for py in range(y0, y1):
+            for px in range(x0, x1):
+                self.pixel(px, py, color)
+
+    def hline(self, x: int, y: int, w: int, color: int):
+        self.fill_rect(x, y, w, 1, color)
+
+    def vline(self, x: int, y: int, h: int, color: int):
+        self.fill_rect(x, y, 1, h, color)
+
+    def rect(self, x: int, y: int, w: int, h: int, color: int):
+        self.hline(x, y, w, color)
+        self.hline(x, y + h - 1, w, color)
+        self.vline(x, y, h, color)
+        self.vline(x + w - 1, y, h, color)
+
+    def line(self, x1: int, y1: int, x2: int, y2: int, color: int):
+        if x1 == x2 or y1 == y2:
+            self.fill_rect(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1, abs(y2 - y1) + 1, color)
+            return
+
+        dx, dy = abs(x2 - x1), -abs(y2 - y1)
+        sx, sy = 1 if x1 < x2 else -1, 1 if y1 < y2 else -1
+        error = dx + dy
+        while True:
+            self.pixel(x1, y1, color)
+            if x1 == x2 and y1 == y2:
+                return
+            e2 = 2 * error
+            if e2 >= dy:
+                error += dy
+                x1 += sx
+            if e2 <= dx:
+                error += dx
+                y1 += sy
+
+    def _or_column(self, page: int, x0: int, x1: int, mask: int, color: int):
+        buf = self.buf
+        row = page * self.stride
+        if color:
+            for i in range(row + x0, row + x1):
+                buf[i] |= mask
+        else:
+            mask = ~mask & 0xff
+            for i in range(row + x0, row + x1):
+                buf[i] &= mask
+
+    def text(self, string: str, x: int, y: int, color: int = 1):
+        if self.format == MONO_VLSB:
+            buf = self.buf
+            width = self.width
+            shift = y & 7
+            pages = (self.height + 7) >> 3
+            upper = (y >> 3) * self.stride if 0 <= y >> 3 < pages else None
+            lower = ((y >> 3) + 1) * self.stride if shift and 0 <= (y >> 3) + 1 < pages else None
+
+            for char in string:
+                for column, bits in enumerate(glyph(char)):
+                    px = x + column
+                    if not bits or px < 0 or px >= width:
+                        continue
+                    if upper is not None:
+                        mask = bits << shift & 0xff
+                        buf[upper + px] = buf[upper + px] | mask if color else buf[upper + px] & ~mask & 0xff
+                    if lower is not None:
+                        mask = bits >> (8 - shift)
+                        buf[lower + px] = buf[lower + px] | mask if color else buf[lower + px] & ~mask & 0xff
+                x += 8
+            return
+
+        for char in string:
+            for column, bits in enumerate(glyph(char)):
+                for row in range(8):
+                    if bits >> row & 1:
+                        self.pixel(x + column, y + row, color)
+            x += 8
+
+    def blit(self, fbuf: 'FrameBuffer', x: int, y: int, key: int = -1):
+        for sy in range(fbuf.height):
+            for sx in range(fbuf.width):
+                color = fbuf.pixel(sx, sy)
+                if color != key:
+                    self.pixel(x + sx, y + sy, color)
+
+    def scroll(self, xstep: int, ystep: int):
+        pixels = [[self.pixel(x, y) for x in range(self.width)] for y in range(self.height)]
+        for y in range(self.height):
+            for x in range(self.width):
+                sx, sy = x - xstep, y - ystep
+                if 0 <= sx < self.width and 0 <= sy < self.height:
+                    self.pixel(x, y, pixels[sy][sx])
@@ -0,0 +1,233 @@
+""" Simulated chip shared by the stand-in modules: clock, pin levels, hardware timers, PWM channels and the queue of
+callbacks passed to micropython.schedule(). Events are fired in order of their time by run(), event loop calls it
+between tasks and blocking sleeps call it while they wait.
+"""
+import time
+
+
+class Clock:
+    """ Real time in microseconds since simulator start
+    """
+
+    virtual = False
+
+    def __init__(self):
+        self.start = time.perf_counter()
+
+    def now_us(self) -> float:
+        return (time.perf_counter() - self.start) * 1000000
+
+    def wait(self, us: float):
+        """ Block for specified time, events are fired by caller afterwards
+        """
+
+        if us > 0:
+            time.sleep(us / 1000000)
+
+    def reach(self, us: float):
+        """ Event which is due at this time is going to be fired, real clock is there already
+        """
+
+    def spend(self):
+        """ Task step took real time already
+        """
+
+
+class VirtualClock(Clock):
+    """ Simulated time which doesn't pass by itself: waits jump straight to their end and event loop jumps to the next
+    deadline, so hours of slider work take seconds. Code runs in no time, unless step_us is charged for every task step
+    to model CPU load of the chip.
+    """
+
+    virtual = True
+
+    def __init__(self, step_us: float = 0):
+        self.now = 0.0
+        self.step_us = step_us
+        self.skipped_us = 0.0
+
+    def now_us(self) -> float:
+        return self.now
+
+    def wait(self, us: float):
+        if us > 0:
+            self.now += us
+            self.skipped_us += us
+
+    def reach(self, us: float):
+        if us > self.now:
+            self.now = us
+
+    def spend(self):
+        """ Charge one task step
+        """
+
+        self.now += self.step_us
+
+
+class PinState:
+    """ Level of one GPIO, shared by all Pin objects created for the same id. Watchers get rising edges of output
+    (step pulses), IRQ handler gets edges driven from outside (endstop switch).
+    """
+
+    def __init__(self, pin_id):
+        self.id = pin_id
+        self.level = 0
+        self.mode = None
+        self.pull = None
+        self.watchers = []
+        self.trigger = 0
+        self.handler = None
+        self.handler_pin = None
+        self.driven = False
+        self.edges = 0
+
+    def set(self, level: int):
+        """ Level set by code (output), rising edge is one pulse for watchers
+        """
+
+        level = 1 if level else 0
+        rising = level and not self.level
+        self.level = level
+        if rising:
+            self.pulse(1)
+
+    def drive(self, level: int):
+        """ Level forced by simulated outside world (input), fires IRQ on matching edge
+        """
+
+        from sim.machine import Pin
+
+        level = 1 if level else 0
+        self.driven = True
+        if level == self.level:
+            return
+
+        self.level = level
+        self.edges += 1
+        edge = Pin.IRQ_RISING if level else Pin.IRQ_FALLING
+        if self.handler is not None and self.trigger & edge:
+            self.handler(self.handler_pin)
+
+    def pulse(self, count: int) -> int:
+        """ Hand pulses over to watchers, returns how many of them were taken before an event stopped the rest
+        """
+
+        taken = count
+        for watcher in self.watchers:
+            taken = min(taken, watcher.pulses(self, count))
+        return taken
+
+    def pulses_to_event(self):
+        """ Amount of pulses after which some watcher changes the outside world, None if there is no such
+        """
+
+        result = None
+        for watcher in self.watchers:
+            pulses = watcher.pulses_to_event(self)
+            if pulses is not None and (result is None or pulses < result):
+                result = pulses
+        return result
+
+
+clock = Clock()
+pins = {}
+timers = []
+pwms = []
+scheduled = []
+
+""" Depth of micropython.schedule() queue on ESP32
+"""
+schedule_depth = 8
+
+# counters
+events = 0
+lightsleep_ms = 0
+
+
+def pin(pin_id) -> PinState:
+    if pin_id not in pins:
+        pins[pin_id] = PinState(pin_id)
+    return pins[pin_id]
+
+
+def schedule(func, arg):
+    if len(scheduled) >= schedule_depth:
+        raise RuntimeError('schedule queue full')
+    scheduled.append((func, arg))
+
+
+def drain():
+    """ Run scheduled callbacks, on chip they run between bytecodes as soon as IRQ returns
+    """
+
+    while scheduled:
+        func, arg = scheduled.pop(0)
+        func(arg)
+
+
+def next_event():
+    """ Earliest (time, source) of timers and PWM channels, (None, None) if nothing is pending
+    """
+
+    first = None
+    source = None
+    for item in timers + pwms:
+        due = item.next_event()
+        if due is not None and (first is None or due < first):
+            first = due
+            source = item
+    return first, source
+
+
+def next_deadline():
+    return next_event()[0]
+
+
+def run():
+    """ Fire all events due till now in order of their time, then bring PWM outputs up to date
+    """
+
+    global events
+
+    while True:
+        due, source = next_event()
+        if source is None or due > clock.now_us():
+            break
+        clock.reach(due)
+        source.fire(due)
+        events += 1
+        drain()
+
+    now = clock.now_us()
+    for pwm in list(pwms):
+        pwm.advance(now)
+    drain()
+
+
+def wait(us: float):
+    """ Blocking wait (utime.sleep, lightsleep), timers and PWM keep running meanwhile
+    """
+
+    until = clock.now_us() + us
+    while True:
+        run()
+        now = clock.now_us()
+        if now >= until:
+            return
+        due = next_deadline()
+        clock.wait(min(until, due if due is not None else until) - now)
+
+
+def reset(new_clock: Clock = None):
+    """ Forget all hardware state, for running several simulations in one process
+    """
+
+    global clock, events, lightsleep_ms
+
+    clock = Clock() if new_clock is None else new_clock
+    pins.clear()
+    del timers[:]
+    del pwms[:]
+    del scheduled[:]
+    events = lightsleep_ms = 0
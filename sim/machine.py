@@ -0,0 +1,279 @@
+""" Stand-in of MicroPython machine module: pins, PWM which counts step pulses, hardware timers, ADC reading simulated
+battery and I2C bus which only counts traffic.
+"""
+import random
+from sim import hardware
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+
+    PULL_UP = 2
+    PULL_DOWN = 1
+
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode: int = -1, pull: int = -1, value: int = None):
+        self.id = id
+        self.state = hardware.pin(id)
+        self.init(mode, pull, value)
+
+    def init(self, mode: int = -1, pull: int = -1, value: int = None):
+        state = self.state
+        if mode != -1:
+            state.mode = mode
+        if pull != -1:
+            state.pull = pull
+            if pull == self.PULL_UP and not state.driven:
+                state.level = 1
+        if value is not None:
+            state.set(value)
+
+    def value(self, value: int = None):
+        if value is None:
+            return self.state.level
+        self.state.set(value)
+
+    def __call__(self, value: int = None):
+        return self.value(value)
+
+    def on(self):
+        self.state.set(1)
+
+    def off(self):
+        self.state.set(0)
+
+    def irq(self, handler=None, trigger: int = IRQ_FALLING | IRQ_RISING):
+        self.state.handler = handler
+        self.state.handler_pin = self
+        self.state.trigger = trigger
+
+    def __repr__(self):
+        return 'Pin(%s)' % self.id
+
+
+class PWM:
+    """ PWM channel, pulses are counted from its frequency and handed to watchers of the pin in bulk. Time of the next
+    pulse which changes something outside (endstop) is predicted, so it's fired exactly.
+    """
+
+    def __init__(self, pin: Pin, freq: int = None, duty: int = None):
+        self.pin = pin
+        self.state = pin.state
+        self._freq = 5000
+        self._duty = 512
+        self.active = False
+        self.last = 0
+        self.phase = 0.0
+        self.pulses = 0
+
+        if freq is not None or duty is not None:
+            self.init(freq, duty)
+
+    def init(self, freq: int = None, duty: int = None):
+        if self.active:
+            self.advance(hardware.clock.now_us())
+        if freq is not None:
+            self._freq = freq
+        if duty is not None:
+            self._duty = duty
+
+        if not self.active:
+            self.active = True
+            self.last = hardware.clock.now_us()
+            self.phase = 0.0
+            hardware.pwms.append(self)
+
+    def deinit(self):
+        if not self.active:
+            return
+        self.advance(hardware.clock.now_us())
+        self.active = False
+        hardware.pwms.remove(self)
+
+    def freq(self, freq: int = None):
+        if freq is None:
+            return self._freq
+        if self.active:
+            self.advance(hardware.clock.now_us())
+        self._freq = freq
+
+    def duty(self, duty: int = None):
+        if duty is None:
+            return self._duty
+        if self.active:
+            self.advance(hardware.clock.now_us())
+        self._duty = duty
+
+    @property
+    def pulsing(self) -> bool:
+        return self.active and self._freq > 0 and 0 < self._duty < 1024
+
+    def next_event(self):
+        if not self.pulsing:
+            return None
+
+        pulses = self.state.pulses_to_event()
+        if pulses is None:
+            return None
+        return self.last + (max(pulses, 1) - self.phase) * 1000000 / self._freq
+
+    def fire(self, due: float):
+        """ Send pulses till the one predicted by next_event()
+        """
+
+        pulses = max(self.state.pulses_to_event() or 1, 1)
+        self.last = due
+        self.phase = 0.0
+        self.deliver(pulses)
+
+    def advance(self, now: float):
+        if now <= self.last:
+            return
+
+        if not self.pulsing:
+            self.last = now
+            return
+
+        total = self.phase + (now - self.last) * self._freq / 1000000
+        pulses = int(total)
+        self.phase = total - pulses
+        self.last = now
+        self.deliver(pulses)
+
+    def deliver(self, pulses: int):
+        # endstop IRQ can stop the channel in the middle, rest of pulses is never sent then
+        while pulses > 0 and self.active:
+            taken = self.state.pulse(pulses)
+            self.pulses += taken
+            pulses -= taken
+            if not taken:
+                break
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id: int = -1):
+        self.id = id
+        self.callback = None
+        self.mode = self.PERIODIC
+        self.period_us = 0
+        self.start = 0
+        self.count = 0
+        self.active = False
+
+    def init(self, mode: int = PERIODIC, freq: float = None, period: int = None, callback=None):
+        self.deinit()
+        self.mode = mode
+        self.period_us = 1000000 / freq if freq is not None else period * 1000
+        self.callback = callback
+        self.start = hardware.clock.now_us()
+        self.count = 0
+        self.active = True
+        hardware.timers.append(self)
+
+    def deinit(self):
+        if self.active:
+            self.active = False
+            # timer of chip which was simulated before reset() isn't registered any more
+            if self in hardware.timers:
+                hardware.timers.remove(self)
+
+    def next_event(self):
+        return self.start + (self.count + 1) * self.period_us if self.active else None
+
+    def fire(self, due: float):
+        self.count += 1
+        if self.mode == self.ONE_SHOT:
+            self.deinit()
+        if self.callback is not None:
+            self.callback(self)
+
+
+class ADC:
+    """ Reads voltage of simulated battery behind the divider, full scale of 12-bit value is full_scale volts
+    """
+
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+
+    WIDTH_9BIT = 0
+    WIDTH_10BIT = 1
+    WIDTH_11BIT = 2
+    WIDTH_12BIT = 3
+
+    """ Source of voltage, replaced by sim.battery.Pack.install()
+    """
+    source = None
+    full_scale = 12.4
+    noise = 8
+    random = random.Random(1)
+
+    def __init__(self, pin: Pin):
+        self.pin = pin
+        self.attenuation = self.ATTN_0DB
+        self.reads = 0
+
+    def atten(self, attenuation: int):
+        self.attenuation = attenuation
+
+    def width(self, width: int):
+        pass
+
+    def read(self) -> int:
+        self.reads += 1
+        if ADC.source is None:
+            return 0
+
+        value = ADC.source() / ADC.full_scale * 4095 + ADC.random.randint(-ADC.noise, ADC.noise)
+        return 0 if value < 0 else 4095 if value > 4095 else int(value)
+
+
+class I2C:
+    def __init__(self, id: int = -1, scl: Pin = None, sda: Pin = None, freq: int = 400000):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.devices = {}
+        self.transfers = self.bytes = 0
+
+    def scan(self) -> list:
+        return sorted(self.devices)
+
+    def writeto(self, addr: int, buf, stop: bool = True) -> int:
+        self.transfers += 1
+        self.bytes += len(buf)
+        if addr in self.devices:
+            self.devices[addr](bytes(buf))
+        return 1
+
+    def writevto(self, addr: int, vector, stop: bool = True) -> int:
+        return self.writeto(addr, b''.join(bytes(buf) for buf in vector), stop)
+
+
+def lightsleep(time_ms: int = None):
+    hardware.lightsleep_ms += time_ms or 0
+    hardware.wait((time_ms or 0) * 1000)
+
+
+def idle():
+    pass
+
+
+def freq(hz: int = None):
+    return 240000000 if hz is None else None
+
+
+def unique_id() -> bytes:
+    return b'\x53\x4c\x49\x44\x45\x52'
+
+
+def reset():
+    raise SystemExit('machine.reset()')
@@ -0,0 +1,31 @@
+""" Stand-in of micropython module, scheduled callbacks are run by simulated chip between tasks
+"""
+from sim import hardware
+
+
+def schedule(func, arg):
+    hardware.schedule(func, arg)
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size: int):
+    pass
+
+
+def opt_level(level: int = None):
+    return 0 if level is None else None
+
+
+def mem_info(verbose: bool = False):
+    import gc
+    print('mem: total=%d, current=%d' % (gc.mem_alloc() + gc.mem_free(), gc.mem_alloc()))
+
+
+def native(func):
+    return func
+
+
+viper = native
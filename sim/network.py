@@ -0,0 +1,50 @@
+""" Stand-in of MicroPython network module, interfaces are always up on loopback
+"""
+
+STA_IF = 0
+AP_IF = 1
+
+AUTH_OPEN = 0
+AUTH_WEP = 1
+AUTH_WPA_PSK = 2
+AUTH_WPA2_PSK = 3
+AUTH_WPA_WPA2_PSK = 4
+
+
+class WLAN:
+    interfaces = {}
+
+    def __new__(cls, interface: int = STA_IF):
+        # same object for the same interface, like on chip
+        if interface not in cls.interfaces:
+            wlan = super().__new__(cls)
+            wlan.interface = interface
+            wlan.enabled = False
+            wlan.settings = {}
+            cls.interfaces[interface] = wlan
+        return cls.interfaces[interface]
+
+    def active(self, active: bool = None):
+        if active is None:
+            return self.enabled
+        self.enabled = bool(active)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self.settings.get(args[0])
+        self.settings.update(kwargs)
+
+    def ifconfig(self, config: tuple = None):
+        return '127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1'
+
+    def isconnected(self) -> bool:
+        return self.enabled
+
+    def connect(self, ssid: str = None, password: str = None):
+        self.enabled = True
+
+    def disconnect(self):
+        pass
+
+    def scan(self) -> list:
+        return []
@@ -0,0 +1,119 @@
+""" Simulated rail: carriage driven by step pulses, with one endstop switch at each end wired to the same input pin.
+Switch pulls the pin low when carriage reaches it, so Motor.endstop() is fired through the IRQ path.
+"""
+from sim import hardware
+
+""" Microsteps by levels of MS1, MS2, MS3 pins of A4988 driver
+"""
+MICROSTEPS = {(0, 0, 0): 1, (1, 0, 0): 2, (0, 1, 0): 4, (1, 1, 0): 8, (1, 1, 1): 16}
+
+""" Position is counted in 1/16 of step, so every microstep is whole number
+"""
+UNIT = 16
+
+
+class Rail:
+
+    def __init__(self, step, direction, microsteps: tuple, endstop, length_mm: float = 1000,
+                 steps_per_mm: float = 6.24, position_mm: float = None, overtravel_mm: float = 5, bounce: int = 0):
+        """ Pins are given by their ids, steps_per_mm are full steps of the real motor and pulley (true value which
+        calibration should find), bounce is amount of extra edges sent by switch when it's pressed
+        """
+
+        self.step = hardware.pin(step)
+        self.direction = hardware.pin(direction)
+        self.microsteps = [hardware.pin(pin) for pin in microsteps]
+        self.endstop = hardware.pin(endstop)
+
+        self.steps_per_mm = steps_per_mm
+        self.length = round(length_mm * steps_per_mm * UNIT)
+        self.overtravel = round(overtravel_mm * steps_per_mm * UNIT)
+        self.bounce = bounce
+
+        position_mm = length_mm / 2 if position_mm is None else position_mm
+        self.position = round(position_mm * steps_per_mm * UNIT)
+
+        # counters
+        self.received = self.hits = self.stalled = 0
+
+        self.step.watchers.append(self)
+        self.endstop.drive(not self.pressed)
+
+    @property
+    def position_mm(self) -> float:
+        return self.position / (self.steps_per_mm * UNIT)
+
+    @property
+    def length_mm(self) -> float:
+        return self.length / (self.steps_per_mm * UNIT)
+
+    @property
+    def pressed(self) -> bool:
+        return self.position <= 0 or self.position >= self.length
+
+    def increment(self) -> int:
+        """ Signed move of one pulse in position units, by current direction and microsteps
+        """
+
+        levels = tuple(pin.level for pin in self.microsteps)
+        size = UNIT // MICROSTEPS.get(levels, 1)
+        return size if self.direction.level else -size
+
+    def pulses_to_event(self, pin) -> int:
+        """ Pulses till carriage presses or releases a switch
+        """
+
+        increment = self.increment()
+        if self.pressed:
+            inside = self.position <= 0 and increment > 0 or self.position >= self.length and increment < 0
+            if not inside:
+                return None
+            target = 1 if increment > 0 else self.length - 1
+        else:
+            target = 0 if increment < 0 else self.length
+
+        return max(1, -(-abs(target - self.position) // abs(increment)))
+
+    def pulses(self, pin, count: int) -> int:
+        """ Move carriage by pulses till switch changes, returns amount of pulses taken
+        """
+
+        increment = self.increment()
+        was_pressed = self.pressed
+
+        event = self.pulses_to_event(pin)
+        taken = count if event is None else min(count, event)
+
+        position = self.position + taken * increment
+        low = -self.overtravel
+        high = self.length + self.overtravel
+        if position < low or position > high:
+            # carriage stands at the end of the rail, motor loses steps
+            self.stalled += abs(position - (low if position < low else high)) // abs(increment)
+            position = low if position < low else high
+
+        self.position = position
+        self.received += taken
+
+        if self.pressed and not was_pressed:
+            self.press()
+        elif was_pressed and not self.pressed:
+            self.endstop.drive(1)
+
+        return taken
+
+    def press(self):
+        self.hits += 1
+        self.endstop.drive(0)
+        for _ in range(self.bounce):
+            self.endstop.drive(1)
+            self.endstop.drive(0)
+
+    def stats(self) -> dict:
+        return {
+            'position_mm': self.position_mm,
+            'pulses': self.received,
+            'hits': self.hits,
+            'stalled': self.stalled,
+            'pressed': self.pressed,
+        }
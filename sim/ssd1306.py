@@ -0,0 +1,134 @@
+""" Stand-in of ssd1306 driver with the same API as the MicroPython one. Commands and data sent over simulated I2C are
+applied to in-memory display RAM, so what the panel would show can be checked against the frame buffer.
+"""
+from sim import framebuf
+
+SET_CONTRAST = 0x81
+SET_DISP = 0xae
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+
+""" Amount of argument bytes of commands which change addressing or contrast
+"""
+ARGUMENTS = {SET_COL_ADDR: 2, SET_PAGE_ADDR: 2, SET_CONTRAST: 1}
+
+
+class SSD1306(framebuf.FrameBuffer):
+
+    def __init__(self, width: int, height: int, external_vcc: bool):
+        self.width = width
+        self.height = height
+        self.external_vcc = external_vcc
+        self.pages = self.height // 8
+        self.buffer = bytearray(self.pages * self.width)
+        super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
+
+        # display RAM and addressing window of the controller
+        self.ram = bytearray(self.pages * 128)
+        self.col0, self.col1 = 0, 127
+        self.page0, self.page1 = 0, self.pages - 1
+        self.col, self.page = 0, 0
+        self.command = []
+        self.on = False
+        self.contrast_level = 0x7f
+
+        self.init_display()
+
+    def init_display(self):
+        self.poweron()
+        self.fill(0)
+        self.show()
+
+    def poweroff(self):
+        self.write_cmd(SET_DISP | 0x00)
+
+    def poweron(self):
+        self.write_cmd(SET_DISP | 0x01)
+
+    def contrast(self, contrast: int):
+        self.write_cmd(SET_CONTRAST)
+        self.write_cmd(contrast)
+
+    def invert(self, invert: bool):
+        self.write_cmd(0xa6 | (invert & 1))
+
+    def show(self):
+        x0 = 0
+        x1 = self.width - 1
+        if self.width == 64:
+            # displays with width of 64 pixels are shifted by 32
+            x0 += 32
+            x1 += 32
+        self.write_cmd(SET_COL_ADDR)
+        self.write_cmd(x0)
+        self.write_cmd(x1)
+        self.write_cmd(SET_PAGE_ADDR)
+        self.write_cmd(0)
+        self.write_cmd(self.pages - 1)
+        self.write_data(self.buffer)
+
+    def receive_command(self, byte: int):
+        """ Controller side: collect command with its arguments and apply it
+        """
+
+        command = self.command
+        command.append(byte)
+        if len(command) <= ARGUMENTS.get(command[0], 0):
+            return
+
+        code = command[0]
+        if code == SET_COL_ADDR:
+            self.col0, self.col1 = command[1], command[2]
+            self.col = self.col0
+        elif code == SET_PAGE_ADDR:
+            self.page0, self.page1 = command[1], command[2]
+            self.page = self.page0
+        elif code == SET_CONTRAST:
+            self.contrast_level = command[1]
+        elif code & 0xfe == SET_DISP:
+            self.on = bool(code & 1)
+        self.command = []
+
+    def receive_data(self, data: bytes):
+        """ Controller side: write into display RAM in horizontal addressing mode
+        """
+
+        for byte in data:
+            self.ram[self.page * 128 + self.col] = byte
+            if self.col < self.col1:
+                self.col += 1
+                continue
+            self.col = self.col0
+            self.page = self.page + 1 if self.page < self.page1 else self.page0
+
+    def screen(self) -> bytes:
+        """ Content of display RAM in the layout of frame buffer
+        """
+
+        offset = (128 - self.width) // 2
+        return b''.join(bytes(self.ram[page * 128 + offset:page * 128 + offset + self.width])
+                        for page in range(self.pages))
+
+
+class SSD1306_I2C(SSD1306):
+
+    def __init__(self, width: int, height: int, i2c, addr: int = 0x3c, external_vcc: bool = False):
+        self.i2c = i2c
+        self.addr = addr
+        self.temp = bytearray(2)
+        i2c.devices[addr] = self.receive
+        super().__init__(width, height, external_vcc)
+
+    def write_cmd(self, cmd: int):
+        self.temp[0] = 0x80
+        self.temp[1] = cmd
+        self.i2c.writeto(self.addr, self.temp)
+
+    def write_data(self, buf):
+        self.i2c.writevto(self.addr, (b'\x40', buf))
+
+    def receive(self, message: bytes):
+        if message[0] == 0x80:
+            self.receive_command(message[1])
+        elif message[0] == 0x40:
+            self.receive_data(message[1:])
@@ -0,0 +1,97 @@
+""" Slider built the same way as in main.py on simulated hardware, without web server. For scripts which drive the
+slider directly (timelapse, benchmarks).
+"""
+from math import pi
+import sim
+from sim import hardware
+
+
+class Recorder:
+    """ Connection which only collects frames sent to it, for subscribing to status
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def write(self, msg, binary: bool = False):
+        self.frames.append(msg)
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class Stack:
+
+    def __init__(self, clock: hardware.Clock = None, rail_mm: float = 1000, position_mm: float = None,
+                 steps_per_mm: float = None, battery_hours: float = 8, display: bool = True, config: str = None):
+        """ Fresh simulated chip and firmware objects, config is path to settings file (None keeps defaults)
+        """
+
+        sim.install(clock)
+
+        from slider.Config import Config
+        from slider import Slider
+        from slider.Battery import Battery
+        from slider.Calibration import Calibration
+        from slider.Dolly import Dolly
+        from slider.Homing import Homing
+        from slider.LoopMonitor import LoopMonitor
+        from slider.Motor import Motor
+        from slider.MotorDriver import MotorDriver
+        from slider.Status import Status
+        from machine import Pin
+
+        Config.hardware.clear()
+        if config is not None:
+            Config.path = config
+            Config.load()
+        Config.display_active = display
+
+        steps_per_mm = steps_per_mm or Config.motor_resolution / (pi * Config.motor_pulley)
+        self.rail = sim.Rail(Config.pin_step, Config.pin_dir, (Config.pin_ms1, Config.pin_ms2, Config.pin_ms3),
+                             Config.pin_edge, rail_mm, steps_per_mm, position_mm)
+        self.pack = sim.Pack(hours=battery_hours).install()
+
+        self.driver = MotorDriver(Config.pin('step', Pin.OUT), Config.pin('dir', Pin.OUT), Config.pin('ms1', Pin.OUT),
+                                  Config.pin('ms2', Pin.OUT), Config.pin('ms3', Pin.OUT),
+                                  Config.pin('edge', Pin.IN, Pin.PULL_UP), Config.motor_timer)
+        self.dolly = Dolly()
+        self.motor = Motor(self.driver, Config.motor_resolution, Config.motor_pulley, Config.motor_profile,
+                           Config.motor_acceleration, Config.motor_jerk, Config.motor_update_ms,
+                           Config.motor_exact_steps, Config.motor_lightsleep_ms, self.dolly)
+        self.battery = Battery(Config.adc(), Config.battery_max_voltage, Config.battery_min_voltage,
+                               Config.battery_buffer_size, Config.battery_samples_per_tick,
+                               Config.battery_sample_interval_ms)
+        self.display = Config.display()
+        self.monitor = LoopMonitor(Config.monitor_interval_ms, Config.monitor_stall_ms, Config.monitor_active)
+        self.status = Status(self.motor, self.dolly, self.display, self.battery, Config.status_heartbeat_ms,
+                             Config.status_moving_ms, Config.status_poll_ms, self.monitor, Config.display_debug)
+        self.homing = Homing(self.motor, Config.homing_fast_speed, Config.homing_slow_speed,
+                             Config.homing_slow_resolution)
+        self.calibration = Calibration(self.motor, self.homing, Config.rail_length, Config.calibration_speed)
+        self.slider = Slider(self.motor, self.status, self.homing, self.calibration)
+
+        import uasyncio
+        self.loop = uasyncio.get_event_loop()
+
+    def start(self, subscribe: bool = True) -> Recorder:
+        """ Start background tasks of main.py, returns connection subscribed to status
+        """
+
+        recorder = Recorder()
+        if subscribe:
+            self.status.add_socket(recorder)
+
+        watch = self.monitor.watch
+        self.loop.call_soon(watch('battery', self.battery.run()))
+        self.loop.call_soon(watch('display', self.status.display_status()))
+        self.loop.call_soon(watch('status', self.status.send_status()))
+        self.loop.call_soon(self.monitor.run())
+        return recorder
+
+    def run(self, generator):
+        return self.loop.run_until_complete(generator)
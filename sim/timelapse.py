@@ -0,0 +1,86 @@
+""" Simulate a whole timelapse move in virtual time and report its accuracy (steps, position, timing drift) and cost
+(real time and task steps per hour of shooting).
+
+Usage:  python3 -m sim.timelapse [--distance 500] [--hours 8] [--step-us 0] [--no-display]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim import hardware
+from sim.stack import Stack
+
+
+def timelapse(distance: float = 500, hours: float = 8, step_us: float = 0, display: bool = True,
+              rail_mm: float = 1000) -> dict:
+    """ Home the dolly, then move it right by distance (mm) in hours, returns report
+    """
+
+    clock = hardware.VirtualClock(step_us)
+    stack = Stack(clock, rail_mm, rail_mm / 4, display=display)
+    recorder = stack.start()
+
+    from slider.MotorDriver import MotorDriver
+
+    motor = stack.motor
+    rail = stack.rail
+    loop = stack.loop
+
+    stack.run(stack.homing.run(True))
+    start_mm = rail.position_mm
+    pulses = rail.received
+    frames = len(recorder.frames)
+    display_frames = stack.display.frames if display else 0
+
+    real = time.perf_counter()
+    cpu = time.process_time()
+    virtual = clock.now_us()
+    steps = loop.steps
+
+    time_s = round(hours * 3600)
+    stack.run(motor.move(MotorDriver.RIGHT, distance, time_s))
+
+    virtual_s = (clock.now_us() - virtual) / 1000000
+    real_s = time.perf_counter() - real
+    microsteps = motor.microsteps
+
+    return {
+        'mode': motor.mode,
+        'microsteps': microsteps,
+        'steps_expected': motor.steps,
+        'steps_sent': rail.received - pulses,
+        'distance_mm': rail.position_mm - start_mm,
+        'position_error_mm': stack.dolly.get_position() - rail.position_mm,
+        'duration_s': virtual_s,
+        'drift_ms': (virtual_s - time_s) * 1000,
+        'status_frames': len(recorder.frames) - frames,
+        'display_frames': (stack.display.frames if display else 0) - display_frames,
+        'battery': stack.battery.level(),
+        'real_s': real_s,
+        'cpu_s': time.process_time() - cpu,
+        'speedup': virtual_s / real_s if real_s else None,
+        'task_steps': loop.steps - steps,
+        'task_steps_per_hour': (loop.steps - steps) * 3600 / virtual_s,
+        'errors': len(loop.errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m sim.timelapse', description=__doc__.split('\n')[0])
+    parser.add_argument('--distance', type=float, default=500, help='distance of move in mm')
+    parser.add_argument('--hours', type=float, default=8, help='duration of move')
+    parser.add_argument('--step-us', type=float, default=0, help='simulated CPU time of every task step')
+    parser.add_argument('--no-display', action='store_true', help='run without display')
+    args = parser.parse_args()
+
+    report = timelapse(args.distance, args.hours, args.step_us, not args.no_display)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
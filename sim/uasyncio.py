@@ -0,0 +1,469 @@
+""" Stand-in of uasyncio v2 which the firmware runs on: tasks are generators (yield from sleep_ms) or coroutines
+(await sleep_ms), cancel() throws CancelledError into the task like pend_throw() on chip, task which yields another
+coroutine schedules it, task which yields False waits till call_soon() wakes it (core.cur_task is the running task).
+Streams and start_server() have the API of v2 only: StreamReader(polls) and
+StreamWriter(s, extra) with awrite() and aclose() generators, readexactly() returns less data when peer disconnects,
+start_server() is an accept loop which never returns. Simulated hardware (timers, PWM, scheduled callbacks) is run
+between tasks, sockets are waited for by select().
+"""
+from collections import deque
+import heapq
+import select
+import socket
+import sys
+import time
+import traceback
+import types
+from sim import hardware
+
+
+class CancelledError(Exception):
+    pass
+
+
+class TimeoutError(CancelledError):
+    pass
+
+
+class SleepMs:
+    def __init__(self, ms: float):
+        self.ms = ms
+
+    def __iter__(self):
+        yield self
+
+    __await__ = __iter__
+
+
+class IORead:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def __iter__(self):
+        yield self
+
+    __await__ = __iter__
+
+
+class IOWrite(IORead):
+    pass
+
+
+class IOReadDone(IORead):
+    """ Stream is done with socket, registration in poller is dropped
+    """
+
+
+class IOWriteDone(IORead):
+    pass
+
+
+class Call:
+    """ Plain callback scheduled by call_soon() or call_later()
+    """
+
+    def __init__(self, callback, args: tuple):
+        self.callback = callback
+        self.args = args
+
+
+""" Core module of v2, it holds the running task
+"""
+core = types.ModuleType('uasyncio.core')
+core.cur_task = None
+
+
+def is_task(item) -> bool:
+    return hasattr(item, 'send') and hasattr(item, 'throw')
+
+
+class EventLoop:
+
+    def __init__(self):
+        self.runq = deque()
+        self.waitq = []
+        self.sequence = 0
+
+        # live tasks, tasks waiting for time (sequence of their sleep) or socket, exceptions pending to be thrown
+        self.tasks = set()
+        self.sleeping = {}
+        self.readers = {}
+        self.writers = {}
+        self.pending = {}
+
+        self.current = None
+        self.stopped = False
+        self.main = None
+        self.result = None
+
+        # tasks which died on exception, and counters (busy_s is real time spent in tasks)
+        self.errors = []
+        self.iterations = self.steps = 0
+        self.busy_s = 0.0
+
+    def call_soon(self, callback, *args):
+        if is_task(callback):
+            self.tasks.add(callback)
+            self.runq.append(callback)
+        else:
+            self.runq.append(Call(callback, args))
+        return callback
+
+    def call_later_ms(self, delay: float, callback, *args):
+        item = callback if is_task(callback) else Call(callback, args)
+        if is_task(callback):
+            self.tasks.add(callback)
+        self.sleep(item, delay)
+
+    def call_later(self, delay: float, callback, *args):
+        self.call_later_ms(delay * 1000, callback, *args)
+
+    def create_task(self, coro):
+        return self.call_soon(coro)
+
+    def sleep(self, item, ms: float):
+        self.sequence += 1
+        self.sleeping[item] = self.sequence
+        heapq.heappush(self.waitq, (hardware.clock.now_us() + ms * 1000, self.sequence, item))
+
+    def cancel(self, task) -> bool:
+        if task not in self.tasks:
+            return False
+
+        self.pending[task] = CancelledError()
+        if self.wake(task):
+            self.runq.append(task)
+        return True
+
+    def wake(self, task) -> bool:
+        """ Take task out of time and socket queues, returns False if it wasn't waiting
+        """
+
+        if self.sleeping.pop(task, None) is not None:
+            return True
+
+        for queue in (self.readers, self.writers):
+            for sock, waiting in queue.items():
+                if waiting is task:
+                    del queue[sock]
+                    return True
+        return False
+
+    def step(self, task):
+        self.current = core.cur_task = task
+        self.steps += 1
+        try:
+            exception = self.pending.pop(task, None)
+            request = task.throw(exception) if exception is not None else task.send(None)
+        except StopIteration as e:
+            self.finish(task, e.value)
+            return
+        except CancelledError:
+            self.finish(task)
+            return
+        except Exception as e:
+            self.errors.append((task, e))
+            sys.stderr.write('Task %r died: ' % task)
+            traceback.print_exc()
+            self.finish(task)
+            return
+        finally:
+            self.current = None
+
+        if task in self.pending:
+            # cancelled while it was running
+            self.runq.append(task)
+        elif request is None:
+            self.runq.append(task)
+        elif request is False:
+            # parked till call_soon(), cancel() doesn't wake it either
+            pass
+        elif isinstance(request, SleepMs):
+            self.sleep(task, request.ms)
+        elif is_task(request):
+            # yielded coroutine is scheduled, the task goes on
+            self.call_soon(request)
+            self.runq.append(task)
+        elif isinstance(request, (IOReadDone, IOWriteDone)):
+            # tasks wait for one event only, there is no registration left
+            self.runq.append(task)
+        elif isinstance(request, IOWrite):
+            self.writers[request.sock] = task
+        elif isinstance(request, IORead):
+            self.readers[request.sock] = task
+        else:
+            self.pending[task] = TypeError('Unknown request %r' % (request,))
+            self.runq.append(task)
+
+    def finish(self, task, result=None):
+        self.tasks.discard(task)
+        self.pending.pop(task, None)
+        if task is self.main:
+            self.result = result
+            self.main = None
+
+    def run_item(self, item):
+        if isinstance(item, Call):
+            try:
+                item.callback(*item.args)
+            except Exception as e:
+                self.errors.append((item.callback, e))
+                traceback.print_exc()
+        elif item in self.tasks:
+            self.step(item)
+
+    def next_deadline(self):
+        """ Earliest time of sleeping task or hardware event, None if nothing waits for time
+        """
+
+        waitq = self.waitq
+        while waitq and self.sleeping.get(waitq[0][2]) != waitq[0][1]:
+            heapq.heappop(waitq)
+
+        due = waitq[0][0] if waitq else None
+        hardware_due = hardware.next_deadline()
+        if due is None or hardware_due is not None and hardware_due < due:
+            return hardware_due
+        return due
+
+    def wait_io(self, timeout_us):
+        """ Wait for sockets or till timeout (None means forever), ready tasks are put into run queue. Virtual clock
+        jumps to the timeout if no socket is ready.
+        """
+
+        readers = self.drop_closed(self.readers)
+        writers = self.drop_closed(self.writers)
+
+        if hardware.clock.virtual:
+            if readers or writers:
+                self.select(readers, writers, 0)
+            if self.runq:
+                return
+            if timeout_us is None:
+                if not readers and not writers:
+                    raise RuntimeError('Nothing to wait for')
+                self.select(readers, writers, None)
+                return
+            hardware.clock.wait(timeout_us)
+            return
+
+        if not readers and not writers:
+            if not self.runq:
+                hardware.clock.wait(1000000 if timeout_us is None else timeout_us)
+            return
+
+        self.select(readers, writers, 0 if self.runq else None if timeout_us is None else max(0, timeout_us))
+
+    def select(self, readers: list, writers: list, timeout_us):
+        readable, writable, _ = select.select(readers, writers, [], None if timeout_us is None else timeout_us / 1000000)
+        for sock in readable:
+            self.runq.append(self.readers.pop(sock))
+        for sock in writable:
+            self.runq.append(self.writers.pop(sock))
+
+    def drop_closed(self, queue: dict) -> list:
+        """ Wake tasks waiting for closed sockets, they get error from socket themselves
+        """
+
+        for sock in [sock for sock in queue if sock.fileno() < 0]:
+            self.runq.append(queue.pop(sock))
+        return list(queue)
+
+    def run_once(self):
+        self.iterations += 1
+        hardware.run()
+
+        now = hardware.clock.now_us()
+        waitq = self.waitq
+        while waitq and waitq[0][0] <= now:
+            due, sequence, item = heapq.heappop(waitq)
+            if self.sleeping.get(item) == sequence:
+                del self.sleeping[item]
+                self.runq.append(item)
+
+        if self.runq:
+            if self.readers or self.writers:
+                self.wait_io(0)
+        else:
+            deadline = self.next_deadline()
+            self.wait_io(None if deadline is None else deadline - hardware.clock.now_us())
+            return
+
+        start = time.perf_counter()
+        for _ in range(len(self.runq)):
+            self.run_item(self.runq.popleft())
+            hardware.clock.spend()
+            hardware.drain()
+        self.busy_s += time.perf_counter() - start
+
+    def run_forever(self):
+        self.stopped = False
+        while not self.stopped:
+            self.run_once()
+
+    def run_until_complete(self, coro):
+        self.main = coro
+        self.result = None
+        self.call_soon(coro)
+        while coro in self.tasks and not self.stopped:
+            self.run_once()
+        return self.result
+
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        pass
+
+
+_loop = None
+
+
+def get_event_loop(runq_len: int = 16, waitq_len: int = 16) -> EventLoop:
+    global _loop
+    if _loop is None:
+        _loop = EventLoop()
+    return _loop
+
+
+def new_event_loop() -> EventLoop:
+    global _loop
+    _loop = EventLoop()
+    return _loop
+
+
+def sleep_ms(ms: float) -> SleepMs:
+    return SleepMs(ms)
+
+
+def sleep(seconds: float) -> SleepMs:
+    return SleepMs(seconds * 1000)
+
+
+def cancel(task) -> bool:
+    return get_event_loop().cancel(task)
+
+
+class StreamReader:
+    """ Reader of uasyncio v2, it reads only what the caller asks for, nothing is buffered
+    """
+
+    def __init__(self, polls, ios=None):
+        self.polls = polls
+        self.ios = polls if ios is None else ios
+
+    @types.coroutine
+    def recv(self, size: int, flags: int = 0) -> bytes:
+        while True:
+            yield IORead(self.polls)
+            try:
+                return self.ios.recv(size, flags)
+            except BlockingIOError:
+                pass
+
+    @types.coroutine
+    def read(self, n: int = -1) -> bytes:
+        res = yield from self.recv(4096 if n < 0 else n)
+        if not res:
+            yield IOReadDone(self.polls)
+        return res
+
+    @types.coroutine
+    def readexactly(self, n: int) -> bytes:
+        buf = b''
+        while n:
+            res = yield from self.recv(n)
+            if not res:
+                # peer closed connection, caller gets less than it asked for
+                yield IOReadDone(self.polls)
+                break
+            buf += res
+            n -= len(res)
+        return buf
+
+    @types.coroutine
+    def readline(self) -> bytes:
+        buf = b''
+        while True:
+            # line is taken from socket without anything behind it, like readline() of socket on chip
+            res = yield from self.recv(1024, socket.MSG_PEEK)
+            if not res:
+                yield IOReadDone(self.polls)
+                break
+            end = res.find(b'\n')
+            buf += self.ios.recv(len(res) if end < 0 else end + 1)
+            if end >= 0:
+                break
+        return buf
+
+    @types.coroutine
+    def aclose(self):
+        yield IOReadDone(self.polls)
+        self.ios.close()
+
+
+class StreamWriter:
+    """ Writer of uasyncio v2, there is no buffered write() and no close(), only awrite() and aclose() generators
+    """
+
+    def __init__(self, s, extra: dict):
+        self.s = s
+        self.extra = extra
+
+    @types.coroutine
+    def awrite(self, buf, off: int = 0, sz: int = -1):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        view = memoryview(buf)[off:] if sz < 0 else memoryview(buf)[off:off + sz]
+
+        while view:
+            try:
+                sent = self.s.send(view)
+            except BlockingIOError:
+                yield IOWrite(self.s)
+                continue
+            view = view[sent:]
+
+    @types.coroutine
+    def awriteiter(self, iterable):
+        for line in iterable:
+            yield from self.awrite(line)
+
+    @types.coroutine
+    def aclose(self):
+        yield IOWriteDone(self.s)
+        self.s.close()
+
+    def get_extra_info(self, name: str, default=None):
+        return self.extra.get(name, default)
+
+
+@types.coroutine
+def start_server(client_coro, host: str, port: int, backlog: int = 10):
+    """ Accept loop of v2, never returns, every client coroutine is scheduled by yielding it
+    """
+
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setblocking(False)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(socket.getaddrinfo(host, port)[0][-1])
+    s.listen(backlog)
+    while True:
+        yield IORead(s)
+        try:
+            s2, client_addr = s.accept()
+        except BlockingIOError:
+            continue
+        s2.setblocking(False)
+        yield client_coro(StreamReader(s2), StreamWriter(s2, {'peername': client_addr}))
+
+
+@types.coroutine
+def open_connection(host: str, port: int) -> tuple:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setblocking(False)
+    try:
+        s.connect(socket.getaddrinfo(host, port)[0][-1])
+    except BlockingIOError:
+        yield IOWrite(s)
+    return StreamReader(s), StreamWriter(s, {'peername': (host, port)})
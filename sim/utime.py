@@ -0,0 +1,59 @@
+""" Stand-in of MicroPython utime module on simulated clock. Ticks wrap around like on ESP32, so code which doesn't use
+ticks_diff() breaks in simulation too.
+"""
+import time as _time
+from sim import hardware
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+""" Seconds between Unix epoch and MicroPython epoch (2000-01-01)
+"""
+EPOCH = 946684800
+
+""" Wall clock at simulator start, in seconds since MicroPython epoch
+"""
+boot_time = int(_time.time()) - EPOCH
+
+
+def ticks_us() -> int:
+    return int(hardware.clock.now_us()) & TICKS_MAX
+
+
+def ticks_ms() -> int:
+    return int(hardware.clock.now_us() // 1000) & TICKS_MAX
+
+
+def ticks_cpu() -> int:
+    return ticks_us()
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1: int, ticks2: int) -> int:
+    return ((ticks1 - ticks2 + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+
+def sleep_us(us: int):
+    hardware.wait(us)
+
+
+def sleep_ms(ms: int):
+    hardware.wait(ms * 1000)
+
+
+def sleep(seconds: float):
+    hardware.wait(seconds * 1000000)
+
+
+def time() -> int:
+    return boot_time + int(hardware.clock.now_us() // 1000000)
+
+
+def localtime(seconds: int = None) -> tuple:
+    t = _time.gmtime(EPOCH + (time() if seconds is None else seconds))
+    return t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday - 1
+
@@ -0,0 +1,144 @@
+""" Stand-in of MicroPython websocket module: server side of frame layer over a socket. Like on chip, read() of
+non-blocking socket returns None when whole frame isn't there yet and b'' when client closed the connection.
+"""
+import select
+import struct
+
+FRAME_TXT = 0x1
+FRAME_BIN = 0x2
+FRAME_CLOSE = 0x8
+FRAME_PING = 0x9
+FRAME_PONG = 0xa
+
+""" ioctl request which sets type of written frames
+"""
+SET_DATA_OPCODE = 9
+
+""" Seconds to wait for client which doesn't read (socket buffer is full) before write fails
+"""
+WRITE_TIMEOUT = 1
+
+
+class websocket:
+
+    def __init__(self, sock, blocking: bool = False):
+        self.s = sock
+        self.blocking = blocking
+        self.opcode = FRAME_TXT
+        self.buffer = bytearray()
+        self.eof = False
+
+    def parse(self):
+        """ Take one complete frame from buffer, returns (opcode, payload) or None
+        """
+
+        buffer = self.buffer
+        if len(buffer) < 2:
+            return None
+
+        length = buffer[1] & 0x7f
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return None
+            length = struct.unpack_from('>H', buffer, 2)[0]
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return None
+            length = struct.unpack_from('>Q', buffer, 2)[0]
+            offset = 10
+
+        mask = None
+        if buffer[1] & 0x80:
+            mask = buffer[offset:offset + 4]
+            offset += 4
+
+        if len(buffer) < offset + length:
+            return None
+
+        payload = bytearray(buffer[offset:offset + length])
+        if mask:
+            for i in range(length):
+                payload[i] ^= mask[i & 3]
+
+        opcode = buffer[0] & 0x0f
+        del buffer[:offset + length]
+        return opcode, bytes(payload)
+
+    def receive(self) -> bool:
+        """ Read what is available on socket, returns False if nothing came
+        """
+
+        try:
+            data = self.s.recv(4096)
+        except BlockingIOError:
+            return False
+
+        if not data:
+            self.eof = True
+            return False
+
+        self.buffer += data
+        return True
+
+    def read(self, size: int = -1):
+        while True:
+            frame = self.parse()
+            if frame is None:
+                if self.eof:
+                    return b''
+                if not self.receive():
+                    return b'' if self.eof else None
+                continue
+
+            opcode, payload = frame
+            if opcode == FRAME_CLOSE:
+                self.eof = True
+                return b''
+            if opcode == FRAME_PING:
+                self.send(FRAME_PONG, payload)
+                continue
+            if opcode == FRAME_PONG:
+                continue
+            return payload
+
+    def readinto(self, buffer) -> int:
+        payload = self.read()
+        if payload is None:
+            return None
+        buffer[:len(payload)] = payload
+        return len(payload)
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        self.send(self.opcode, data)
+        return len(data)
+
+    def send(self, opcode: int, payload: bytes):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+
+        view = memoryview(header + bytes(payload))
+        while view:
+            try:
+                sent = self.s.send(view)
+            except BlockingIOError:
+                if not select.select([], [self.s], [], WRITE_TIMEOUT)[1]:
+                    raise OSError(11, 'EAGAIN')
+                continue
+            view = view[sent:]
+
+    def ioctl(self, request: int, arg: int = 0) -> int:
+        if request == SET_DATA_OPCODE:
+            self.opcode = arg
+        return 0
+
+    def close(self):
+        self.s.close()
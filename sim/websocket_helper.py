@@ -0,0 +1,29 @@
+""" Stand-in of websocket_helper from micropython-lib (server side only)
+"""
+import binascii
+import hashlib
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def server_handshake(sock):
+    clr = sock.makefile('rwb', 0)
+    clr.readline()
+
+    webkey = None
+    while True:
+        line = clr.readline()
+        if not line:
+            raise OSError('EOF in headers')
+        if line == b'\r\n':
+            break
+        header, value = [x.strip() for x in line.split(b':', 1)]
+        if header == b'Sec-WebSocket-Key':
+            webkey = value
+
+    if not webkey:
+        raise OSError('Not a websocket request')
+
+    respkey = binascii.b2a_base64(hashlib.sha1(webkey + GUID).digest())[:-1]
+    sock.send(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+              b'Sec-WebSocket-Accept: ' + respkey + b'\r\n\r\n')
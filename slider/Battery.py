@@ -0,0 +1,81 @@
+from array import array
+from machine import ADC
+import uasyncio as asyncio
+import utime
+
+
+class Battery:
+    """ Background battery sampler. Takes a few ADC probes per tick into a fixed-size ring buffer and keeps a running
+    average, so the display and socket code can read the cached level without touching the ADC.
+    """
+
+    """ Maximum raw value returned by 12-bit ADC
+    """
+    ADC_MAX = 4095
+
+    def __init__(self, adc: ADC, max_voltage: float, min_voltage: float, size: int = 64, per_tick: int = 4,
+                 interval_ms: int = 100):
+        self.adc = adc
+        self.max_voltage = max_voltage
+        self.min_voltage = min_voltage
+        self.per_tick = per_tick
+        self.interval_ms = interval_ms
+
+        self.buffer = array('H', [0] * size)
+        self.index = self.count = self.total = 0
+
+        self.voltage = 0.0
+        self.percent = 0
+
+        # time spent inside the event loop on sampling, for comparison with the old blocking loop
+        self.busy_us = self.ticks = 0
+
+    def sample(self, amount: int = None):
+        """ Take specified amount of probes into ring buffer and refresh cached level
+        """
+
+        start = utime.ticks_us()
+        size = len(self.buffer)
+
+        for _ in range(self.per_tick if amount is None else amount):
+            value = self.adc.read()
+            self.total += value - self.buffer[self.index]
+            self.buffer[self.index] = value
+            self.index = (self.index + 1) % size
+            if self.count < size:
+                self.count += 1
+
+        self.update()
+
+        self.busy_us += utime.ticks_diff(utime.ticks_us(), start)
+        self.ticks += 1
+
+    def update(self):
+        """ Convert running average into voltage and percent
+        """
+
+        if not self.count:
+            return
+
+        adc_value = self.total // self.count
+        self.voltage = adc_value / self.ADC_MAX * self.max_voltage
+
+        battery_range = self.max_voltage - self.min_voltage
+        percent = int((self.voltage - self.min_voltage) / battery_range * 100)
+        self.percent = 0 if percent < 0 else 100 if percent > 100 else percent
+
+    def level(self) -> tuple:
+        """ Get cached (voltage, percent) tuple
+        """
+
+        return self.voltage, self.percent
+
+    async def run(self):
+        """ Sample battery in background, fill whole buffer at start to show correct level immediately
+        """
+
+        self.sample(len(self.buffer))
+
+        while True:
+            await asyncio.sleep_ms(self.interval_ms)
+            self.sample()
@@ -0,0 +1,90 @@
+from slider.Config import Config
+from slider.Homing import Homing
+from slider.Lock import *
+from slider.Motor import Motor
+from slider.MotorDriver import MotorDriver
+import uasyncio as asyncio
+import utime
+
+
+class Calibration:
+    """ Measure rail: home at left edge, run to the right edge by exact steps and count them. With nominal rail length
+    (mm between endstops) effective steps per mm is derived, otherwise rail length is computed from steps per mm.
+
+    Result is stored in Config on flash and loaded on boot instead of measuring again.
+    """
+
+    """ Longest rail (mm) searched for right endstop when its length isn't known yet
+    """
+    max_length = 3000
+
+    def __init__(self, motor: Motor, homing: Homing, rail_length: float = None, speed: float = 50,
+                 resolution: int = 4):
+        self.motor = motor
+        self.homing = homing
+        self.rail_length = rail_length
+        self.speed = speed
+        self.resolution = resolution
+
+        self.result = None
+
+    def load(self) -> bool:
+        """ Apply stored calibration, returns False if there is none
+        """
+
+        if Config.calibrated_steps_per_mm is None:
+            return False
+
+        self.result = {'steps_per_mm': Config.calibrated_steps_per_mm, 'rail_length': Config.calibrated_rail_length}
+        self.apply()
+        return True
+
+    def save(self):
+        Config.set('calibrated_steps_per_mm', self.result['steps_per_mm'])
+        Config.set('calibrated_rail_length', self.result['rail_length'])
+        Config.save()
+
+    def apply(self):
+        self.motor.calibrate(self.result['steps_per_mm'], self.result['rail_length'])
+
+    def run(self, token: int = None):
+        """ Measure the rail, store and apply the result
+        """
+
+        motor = self.motor
+        owned = token is None
+        if owned:
+            token = yield from motor.lock.acquire('calibration', Lock.HOMING)
+        elif not motor.lock.owns(token):
+            raise LockedProcessException('Motor is working!')
+
+        try:
+            start = utime.ticks_ms()
+            yield from self.homing.home()
+            yield from asyncio.sleep_ms(motor.endstop_debounce_ms)
+
+            # full steps between both switches: back-off from the left one and the run to the right one
+            limit = 2 * motor.rail_length if motor.rail_length else self.max_length
+            steps = yield from motor.find_edge(MotorDriver.RIGHT, self.resolution,
+                                               round(self.speed * motor.steps_per_mm * self.resolution), limit)
+            steps = steps / self.resolution + motor.backoff_steps() / motor.backoff_resolution
+
+            if self.rail_length:
+                steps_per_mm = steps / self.rail_length
+            else:
+                steps_per_mm = motor.steps_per_mm
+
+            self.result = {
+                'steps_per_mm': steps_per_mm,
+                'rail_length': steps / steps_per_mm,
+                'time_ms': utime.ticks_diff(utime.ticks_ms(), start),
+            }
+            self.apply()
+            self.save()
+
+            # dolly stands at right edge after back-off
+            motor.dolly.set_position(motor.rail_length - motor.backoff_distance())
+            motor.notify()
+        finally:
+            if owned:
+                motor.lock.release(token)
@@ -0,0 +1,61 @@
+from slider.Protocol import Protocol
+
+
+class Commands:
+    """ Registry of commands: action name (and optional binary opcode) mapped to handler with argument schema.
+
+    Schema is a tuple of (field, converter) for required and (field, converter, default) for optional arguments.
+    Motion handlers return generator which moves the dolly and take owner token of motor lock as last argument,
+    others return response or None. Priority of motion is one of Lock priorities.
+    """
+
+    def __init__(self):
+        self.actions = {}
+        self.opcodes = {}
+
+    def register(self, action: str, handler, schema: tuple = (), opcode: int = None, binary=None,
+                 motion: bool = False, priority: int = 0):
+        """ Register handler, binary is function converting decoded opcode fields (and whole frame) into arguments
+        """
+
+        self.actions[action] = (handler, schema, motion, priority)
+        if opcode is not None:
+            self.opcodes[opcode] = (action, binary)
+
+    def parse(self, command: dict) -> tuple:
+        """ Validate JSON command and convert it into (action, arguments), raise KeyError or ValueError
+        """
+
+        action = command['action']
+        schema = self.actions[action][1]
+
+        args = []
+        for field in schema:
+            if field[0] in command:
+                args.append(field[1](command[field[0]]))
+            elif len(field) > 2:
+                args.append(field[2])
+            else:
+                raise KeyError(field[0])
+
+        return action, tuple(args)
+
+    def parse_binary(self, msg) -> tuple:
+        """ Decode binary command into (action, arguments)
+        """
+
+        opcode, fields = Protocol.decode(msg)
+        if opcode not in self.opcodes:
+            raise ValueError('Unknown opcode!')
+
+        action, binary = self.opcodes[opcode]
+        return action, fields if binary is None else binary(fields, msg)
+
+    def is_motion(self, action: str) -> bool:
+        return self.actions[action][2]
+
+    def priority(self, action: str) -> int:
+        return self.actions[action][3]
+
+    def call(self, target, action: str, args: tuple):
+        return self.actions[action][0](target, *args)
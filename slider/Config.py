@@ -1,42 +1,287 @@
-from machine import Pin, ADC, I2C
-from ssd1306 import SSD1306_I2C
+from machine import Pin
 
 
 class Config:
-    """ Configuration file for slider.
+    """ Configuration of slider. Settings below are defaults, changed ones are stored in JSON file on flash and loaded
+    on boot. Hardware objects are created on first use, so importing slider doesn't touch any of them.
     """
 
+    path = 'config.json'
+
     # default settings
     display_active = True
     display_width = 128
     display_height = 64
+    display_fps = 10
+
+    # show event loop lag on display instead of move progress
+    display_debug = False
 
     max_pin_voltage = 3.11
     battery_max_voltage = 12.4
     battery_min_voltage = 10.5
     battery_probes_amount = 2000
+    battery_buffer_size = 64
+    battery_samples_per_tick = 4
+    battery_sample_interval_ms = 100
+
+    # motor size (steps by rotation) and diameter of pulley in mm
+    motor_resolution = 200
+    motor_pulley = 10.2
+
+    # motion profile: none, trapezoid or scurve; acceleration in mm/s^2, jerk in mm/s^3
+    motor_profile = 'trapezoid'
+    motor_acceleration = 100
+    motor_jerk = 1000
+    motor_update_ms = 20
+
+    # homing: fast approach with acceleration ramp, then slow approach with microstepping (speeds in mm/s)
+    homing_fast_speed = 150
+    homing_slow_speed = 5
+    homing_slow_resolution = 16
+
+    # rail calibration: nominal length in mm between endstops (None keeps steps per mm of pulley), speed in mm/s
+    rail_length = None
+    calibration_speed = 50
+
+    # result of last calibration, set by Calibration
+    calibrated_rail_length = None
+    calibrated_steps_per_mm = None
+
+    # send exact amount of steps from hardware timer
+    motor_exact_steps = True
+    motor_timer = 0
+
+    # very slow moves are done by single steps, chip can go into light sleep between them if there is more time than
+    # specified in ms (0 disables, light sleep pauses WiFi and event loop)
+    motor_lightsleep_ms = 0
+
+    # status is pushed to clients on every change, otherwise every heartbeat (moving while motor runs)
+    status_heartbeat_ms = 2000
+    status_moving_ms = 500
+    status_poll_ms = 20
+
+    # wake up web server only when data arrives instead of polling sockets every 10 ms
+    server_event_driven = True
+    server_port = 80
+
+    # event loop monitor wakes up every interval, lag of wakeup above stall_ms is logged with the task which caused it
+    monitor_active = True
+    monitor_interval_ms = 100
+    monitor_stall_ms = 50
+
+    # print import time and heap of every module on boot, time when server is ready is in 'stats'; main.py reads the
+    # stored value before the package is imported, so only value set by config command counts
+    boot_profile = False
+
+    # pins for display
+    pin_display_scl = 4
+    pin_display_sda = 5
+
+    # status led (on-board led)
+    pin_status_led = 2
+
+    # motor control pins
+    pin_edge = 0
+    pin_step = 12
+    pin_dir = 14
+
+    # motor driver step motor size pins
+    pin_ms1 = 4
+    pin_ms2 = 16
+    pin_ms3 = 17
+
+    # battery voltage
+    pin_adc = 36
+
+    # hardware objects created on first use
+    hardware = {}
+
+    # settings changed against defaults, these are stored in file
+    changes = {}
+
+    # types of settings which are None by default (None turns them off again)
+    types = {
+        'rail_length': float,
+        'calibrated_rail_length': float,
+        'calibrated_steps_per_mm': float,
+    }
+
+    # allowed values of string settings
+    choices = {
+        'motor_profile': ('none', 'trapezoid', 'scurve'),
+    }
+
+    # (min, max) of numeric settings, None is open end
+    limits = {
+        'display_width': (1, 128),
+        'display_height': (1, 64),
+        'display_fps': (1, 60),
+        'max_pin_voltage': (0.1, 3.6),
+        'battery_max_voltage': (1, 60),
+        'battery_min_voltage': (0, 60),
+        'battery_probes_amount': (1, 100000),
+        'battery_buffer_size': (1, 1024),
+        'battery_samples_per_tick': (1, 64),
+        'battery_sample_interval_ms': (1, 60000),
+        'motor_resolution': (1, 10000),
+        'motor_pulley': (0.1, 1000),
+        'motor_acceleration': (0, None),
+        'motor_jerk': (0, None),
+        'motor_update_ms': (1, 1000),
+        'homing_fast_speed': (0.1, 1000),
+        'homing_slow_speed': (0.1, 1000),
+        'homing_slow_resolution': (1, 16),
+        'rail_length': (1, 100000),
+        'calibration_speed': (0.1, 1000),
+        'calibrated_rail_length': (1, 100000),
+        'calibrated_steps_per_mm': (0.001, 100000),
+        'motor_timer': (0, 3),
+        'motor_lightsleep_ms': (0, None),
+        'status_heartbeat_ms': (1, None),
+        'status_moving_ms': (1, None),
+        'status_poll_ms': (1, None),
+        'server_port': (1, 65535),
+        'monitor_interval_ms': (1, 60000),
+        'monitor_stall_ms': (1, None),
+        'pin_display_scl': (0, 39),
+        'pin_display_sda': (0, 39),
+        'pin_status_led': (0, 39),
+        'pin_edge': (0, 39),
+        'pin_step': (0, 39),
+        'pin_dir': (0, 39),
+        'pin_ms1': (0, 39),
+        'pin_ms2': (0, 39),
+        'pin_ms3': (0, 39),
+        'pin_adc': (0, 39),
+    }
+
+    @staticmethod
+    def settings() -> dict:
+        """ All settings with current values
+        """
+
+        result = {}
+        for name in dir(Config):
+            value = getattr(Config, name)
+            if name[0] != '_' and name != 'path' and (value is None or isinstance(value, (bool, int, float, str))):
+                result[name] = value
+        return result
+
+    @staticmethod
+    def check(name: str, value):
+        """ Validated value of setting, raise KeyError for unknown setting and ValueError for value of wrong type or out
+        of its range
+        """
+
+        expected = Config.types.get(name) or type(Config.settings()[name])
+
+        if value is None:
+            if name not in Config.types:
+                raise ValueError('Wrong value of %s!' % name)
+            return value
+
+        if expected is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        elif type(value) != expected:
+            raise ValueError('Wrong value of %s!' % name)
+
+        if name in Config.choices and value not in Config.choices[name]:
+            raise ValueError('Wrong value of %s!' % name)
+
+        if name in Config.limits:
+            low, high = Config.limits[name]
+            if (low is not None and value < low) or (high is not None and value > high):
+                raise ValueError('Value of %s out of range!' % name)
+
+        return value
+
+    @staticmethod
+    def set(name: str, value):
+        """ Change setting, raise KeyError for unknown setting and ValueError for wrong value
+        """
+
+        value = Config.check(name, value)
+        setattr(Config, name, value)
+        Config.changes[name] = value
+
+    @staticmethod
+    def load(path: str = None) -> bool:
+        """ Apply settings stored on flash, unknown and invalid ones are skipped
+        """
+
+        try:
+            with open(path or Config.path) as file:
+                # JSON is loaded only when there are stored settings
+                import ujson
+                changes = ujson.load(file)
+        except (OSError, ValueError):
+            return False
+
+        for name in changes:
+            try:
+                Config.set(name, changes[name])
+            except (KeyError, ValueError) as e:
+                print(e)
+
+        return True
+
+    @staticmethod
+    def save(path: str = None):
+        import ujson
+
+        with open(path or Config.path, 'w') as file:
+            ujson.dump(Config.changes, file)
+
+    @staticmethod
+    def pin(name: str, mode: int = None, pull: int = None) -> Pin:
+        """ Pin by its name in settings (without pin_ prefix), created once
+        """
+
+        key = 'pin_' + name
+        if key not in Config.hardware:
+            number = getattr(Config, key)
+            if mode is None:
+                Config.hardware[key] = Pin(number)
+            elif pull is None:
+                Config.hardware[key] = Pin(number, mode)
+            else:
+                Config.hardware[key] = Pin(number, mode, pull)
+        return Config.hardware[key]
+
+    @staticmethod
+    def adc():
+        """ ADC which reads battery voltage
+        """
+
+        if 'adc' not in Config.hardware:
+            from machine import ADC
+
+            adc = ADC(Config.pin('adc'))
+            adc.atten(ADC.ATTN_11DB)
+            Config.hardware['adc'] = adc
+        return Config.hardware['adc']
 
-    # define pins for display
-    display_scl = Pin(4)
-    display_sda = Pin(5)
+    @staticmethod
+    def i2c():
+        if 'i2c' not in Config.hardware:
+            from machine import I2C
 
-    # define status led (on-board led)
-    status_led = Pin(2, Pin.OUT)
+            Config.hardware['i2c'] = I2C(scl=Config.pin('display_scl'), sda=Config.pin('display_sda'))
+        return Config.hardware['i2c']
 
-    # define motor control pins
-    pin_edge = Pin(0, Pin.IN, Pin.PULL_UP)
-    pin_step = Pin(12, Pin.OUT)
-    pin_dir = Pin(14, Pin.OUT)
+    @staticmethod
+    def display():
+        """ OLED display, None if it isn't active
+        """
 
-    # define motor driver step motor size pins
-    pin_ms1 = Pin(4, Pin.OUT)
-    pin_ms2 = Pin(16, Pin.OUT)
-    pin_ms3 = Pin(17, Pin.OUT)
+        if not Config.display_active:
+            return None
 
-    # read battery voltage to show in status
-    adc = ADC(Pin(36))
-    adc.atten(ADC.ATTN_11DB)
+        if 'display' not in Config.hardware:
+            from slider.Display import Display
+            from ssd1306 import SSD1306_I2C
 
-    # setup oled display
-    i2c = I2C(scl=display_scl, sda=display_sda)
-    display = None if not display_active else SSD1306_I2C(display_width, display_height, i2c)
+            Config.hardware['display'] = Display(
+                SSD1306_I2C(Config.display_width, Config.display_height, Config.i2c()), Config.display_fps)
+        return Config.hardware['display']
@@ -0,0 +1,173 @@
+import utime
+
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+
+""" Value in dirty range which means that page is clean
+"""
+CLEAN = 0xff
+
+
+class Display:
+    """ SSD1306 wrapper which keeps track of changed pages and columns, so show() sends over I2C only bytes which are
+    different from the last flushed frame.
+    """
+
+    def __init__(self, display: 'SSD1306_I2C', fps: int = 10):
+        self.display = display
+        self.width = display.width
+        self.height = display.height
+        self.pages = display.height // 8
+        self.frame_ms = 1000 // fps
+        self.col_offset = 0 if self.width == 128 else (128 - self.width) // 2
+
+        self.buffer = memoryview(display.buffer)
+        self.shadow = bytearray(len(display.buffer))
+
+        # dirty column range for every page, x0 == CLEAN means nothing was drawn on the page
+        self.dirty_x0 = bytearray(self.pages)
+        self.dirty_x1 = bytearray(self.pages)
+        self.mark_dirty(0, 0, self.width, self.height)
+
+        # counters
+        self.frames = self.skipped = self.deferred = 0
+        self.bytes_written = self.window_bytes = 0
+        self.bytes_per_second = 0
+        self.last_flush = self.window_start = utime.ticks_ms()
+
+    def __getattr__(self, name):
+        return getattr(self.display, name)
+
+    def mark_dirty(self, x: int, y: int, w: int, h: int):
+        """ Mark rectangle as possibly changed
+        """
+
+        x0 = max(x, 0)
+        x1 = min(x + w, self.width) - 1
+        if x1 < x0 or h <= 0:
+            return
+
+        for page in range(max(y, 0) // 8, min((y + h - 1) // 8, self.pages - 1) + 1):
+            if self.dirty_x0[page] == CLEAN:
+                self.dirty_x0[page] = x0
+                self.dirty_x1[page] = x1
+                continue
+            if x0 < self.dirty_x0[page]:
+                self.dirty_x0[page] = x0
+            if x1 > self.dirty_x1[page]:
+                self.dirty_x1[page] = x1
+
+    def fill(self, color: int):
+        self.display.fill(color)
+        self.mark_dirty(0, 0, self.width, self.height)
+
+    def pixel(self, x: int, y: int, color: int = None):
+        if color is None:
+            return self.display.pixel(x, y)
+        self.display.pixel(x, y, color)
+        self.mark_dirty(x, y, 1, 1)
+
+    def text(self, string: str, x: int, y: int, color: int = 1):
+        self.display.text(string, x, y, color)
+        self.mark_dirty(x, y, len(string) * 8, 8)
+
+    def rect(self, x: int, y: int, w: int, h: int, color: int):
+        self.display.rect(x, y, w, h, color)
+        self.mark_dirty(x, y, w, h)
+
+    def fill_rect(self, x: int, y: int, w: int, h: int, color: int):
+        self.display.fill_rect(x, y, w, h, color)
+        self.mark_dirty(x, y, w, h)
+
+    def hline(self, x: int, y: int, w: int, color: int):
+        self.display.hline(x, y, w, color)
+        self.mark_dirty(x, y, w, 1)
+
+    def vline(self, x: int, y: int, h: int, color: int):
+        self.display.vline(x, y, h, color)
+        self.mark_dirty(x, y, 1, h)
+
+    def line(self, x1: int, y1: int, x2: int, y2: int, color: int):
+        self.display.line(x1, y1, x2, y2, color)
+        self.mark_dirty(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1, abs(y2 - y1) + 1)
+
+    def blit(self, fbuf, x: int, y: int, key: int = -1):
+        self.display.blit(fbuf, x, y, key)
+        self.mark_dirty(0, 0, self.width, self.height)
+
+    def scroll(self, xstep: int, ystep: int):
+        self.display.scroll(xstep, ystep)
+        self.mark_dirty(0, 0, self.width, self.height)
+
+    def show(self, force: bool = False) -> bool:
+        """ Send changed parts of frame buffer to the display. Returns False if flush was skipped, because of frame-rate
+        cap or nothing changed.
+        """
+
+        now = utime.ticks_ms()
+        if not force and utime.ticks_diff(now, self.last_flush) < self.frame_ms:
+            self.deferred += 1
+            return False
+
+        written = 0
+        for page in range(self.pages):
+            if self.dirty_x0[page] != CLEAN:
+                written += self.flush_page(page, self.dirty_x0[page], self.dirty_x1[page])
+                self.dirty_x0[page] = CLEAN
+
+        self.update_counters(now, written)
+
+        if not written:
+            self.skipped += 1
+            return False
+
+        self.frames += 1
+        self.last_flush = now
+        return True
+
+    def flush_page(self, page: int, x0: int, x1: int) -> int:
+        """ Narrow dirty range to columns which really differ from the last frame and send them, returns bytes written
+        """
+
+        start = page * self.width
+        buffer = self.buffer
+        shadow = self.shadow
+
+        while x0 <= x1 and buffer[start + x0] == shadow[start + x0]:
+            x0 += 1
+        while x1 >= x0 and buffer[start + x1] == shadow[start + x1]:
+            x1 -= 1
+
+        if x1 < x0:
+            return 0
+
+        self.display.write_cmd(SET_COL_ADDR)
+        self.display.write_cmd(x0 + self.col_offset)
+        self.display.write_cmd(x1 + self.col_offset)
+        self.display.write_cmd(SET_PAGE_ADDR)
+        self.display.write_cmd(page)
+        self.display.write_cmd(page)
+        self.display.write_data(buffer[start + x0:start + x1 + 1])
+        shadow[start + x0:start + x1 + 1] = buffer[start + x0:start + x1 + 1]
+
+        # each command goes with control byte
+        return x1 - x0 + 1 + 6 * 2
+
+    def update_counters(self, now: int, written: int):
+        self.bytes_written += written
+        self.window_bytes += written
+
+        elapsed = utime.ticks_diff(now, self.window_start)
+        if elapsed >= 1000:
+            self.bytes_per_second = self.window_bytes * 1000 // elapsed
+            self.window_bytes = 0
+            self.window_start = now
+
+    def stats(self) -> dict:
+        return {
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'deferred': self.deferred,
+            'bytes': self.bytes_written,
+            'bytes_per_second': self.bytes_per_second,
+        }
@@ -7,7 +7,10 @@ class Dolly:
     """ Actual dolly position """
     current_position = 0
 
-    """ Change
+    """ Position is known since dolly hit left endstop """
+    homed = False
+
+    """ Change position by value in specified direction (1 or -1)
     """
     def change_position(self, value, direction):
         self.current_position += direction * value
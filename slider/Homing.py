@@ -0,0 +1,78 @@
+from slider.Lock import *
+from slider.Motor import Motor
+from slider.MotorDriver import MotorDriver
+import uasyncio as asyncio
+import utime
+
+
+class Homing:
+    """ Two-phase homing: fast approach with acceleration ramp, back-off (done by endstop handler), then slow approach
+    with high microstepping, so zero doesn't depend on the speed of the first approach.
+
+    Speeds are in mm/s. Last result is cached, when dolly is homed already start position is reached by regular move.
+    """
+
+    """ Amount of slow approaches kept to compute repeatability
+    """
+    history_size = 8
+
+    def __init__(self, motor: Motor, fast_speed: float = 150, slow_speed: float = 5, slow_resolution: int = 16,
+                 slow_limit_mm: float = 10):
+        self.motor = motor
+        self.fast_speed = fast_speed
+        self.slow_speed = slow_speed
+        self.slow_resolution = slow_resolution
+        self.slow_limit_mm = slow_limit_mm
+
+        self.result = None
+        self.history = []
+
+    def run(self, force: bool = True, token: int = None):
+        """ Home dolly at left edge, without force homed dolly just moves to the cached zero position
+        """
+
+        motor = self.motor
+        owned = token is None
+        if owned:
+            token = yield from motor.lock.acquire('homing', Lock.HOMING)
+        elif not motor.lock.owns(token):
+            raise LockedProcessException('Motor is working!')
+
+        try:
+            if not force and motor.dolly.homed and self.result is not None:
+                position = motor.dolly.get_position() - self.result['zero']
+                if position > 0:
+                    yield from motor.move(MotorDriver.LEFT, position, None, token)
+                return
+
+            yield from self.home()
+        finally:
+            if owned:
+                motor.lock.release(token)
+
+    def home(self):
+        motor = self.motor
+        start = utime.ticks_ms()
+
+        # fast approach, endstop handler backs off and waits till switch settles
+        yield from motor.follow_edge(MotorDriver.LEFT, 1, round(self.fast_speed * motor.steps_per_mm))
+        yield from asyncio.sleep_ms(motor.endstop_debounce_ms)
+        fast_ms = utime.ticks_diff(utime.ticks_ms(), start)
+
+        # slow approach counts steps to the switch, endstop sets the final position after second back-off
+        steps = yield from motor.find_edge(MotorDriver.LEFT, self.slow_resolution,
+                                           round(self.slow_speed * motor.steps_per_mm * self.slow_resolution),
+                                           self.slow_limit_mm)
+        slow_mm = steps / (motor.steps_per_mm * self.slow_resolution)
+
+        self.history.append(slow_mm)
+        if len(self.history) > self.history_size:
+            self.history.pop(0)
+
+        self.result = {
+            'time_ms': utime.ticks_diff(utime.ticks_ms(), start),
+            'fast_ms': fast_ms,
+            'slow_mm': slow_mm,
+            'repeatability_mm': max(self.history) - min(self.history),
+            'zero': motor.dolly.get_position(),
+        }
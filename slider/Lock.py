@@ -1,23 +1,126 @@
+from uasyncio import core
+import uasyncio as asyncio
+import utime
+
+
 class Lock:
-    """ Locker to avoid race condition in access to motor
+    """ Awaitable lock of motor. Every acquisition gets its own owner token, so only the owner can release it.
+    Waiting processes are queued FIFO within the same priority, higher priority (homing, calibration) takes the lock
+    over from the current owner instead of waiting. Stop doesn't take the lock, it cancels the owner and the waiters.
+
+    Waiting task is parked (yields False) and release() schedules the first one in queue, like Lock of uasyncio v2.
+    Cancelled waiter gets its CancelledError when it's woken, then passes the wakeup on to the next one.
     """
 
-    is_lock = False
-    locked_by = None
+    """ Priorities
+    """
+    MOVE = 0
+    HOMING = 1
+
+    def __init__(self):
+        self.owner = self.locked_by = self.priority = None
+        self.locked_at = None
+        self.tokens = 0
+
+        # (priority, token) of waiters in order they get the lock, and parked tasks by token
+        self.queue = []
+        self.waiters = {}
+
+        # instrumentation: wait and hold times in ms
+        self.acquisitions = self.contended = self.preemptions = 0
+        self.wait_total_ms = self.wait_max_ms = 0
+        self.hold_total_ms = self.hold_max_ms = 0
+
+    def acquire(self, process: str, priority: int = MOVE):
+        """ Wait for the lock and return owner token, use as: token = yield from lock.acquire('move')
+        """
+
+        self.tokens += 1
+        token = self.tokens
+        start = utime.ticks_ms()
+
+        if self.owner is not None and priority > self.priority:
+            self.preemptions += 1
+            self.release(self.owner)
+
+        elif self.owner is not None or self.queue:
+            self.contended += 1
 
-    def lock(self, process: str = None):
-        if self.is_lock and self.locked_by != process:
-            raise LockedProcessException('Motor is working!')
+            # keep FIFO order within priority, higher priorities are served first
+            index = len(self.queue)
+            while index and self.queue[index - 1][0] < priority:
+                index -= 1
+            self.queue.insert(index, (priority, token))
 
-        self.is_lock = True
+            acquired = False
+            try:
+                while self.owner is not None or self.queue[0][1] != token:
+                    self.waiters[token] = core.cur_task
+                    # lock can be free if a waiter with higher priority came after release() woke this one
+                    self.wake()
+                    yield False
+                acquired = True
+            finally:
+                # also when waiting task is cancelled
+                self.waiters.pop(token, None)
+                self.queue.remove((priority, token))
+                if not acquired:
+                    self.wake()
+
+        wait = utime.ticks_diff(utime.ticks_ms(), start)
+        self.wait_total_ms += wait
+        self.wait_max_ms = max(self.wait_max_ms, wait)
+        self.acquisitions += 1
+
+        self.owner = token
         self.locked_by = process
+        self.priority = priority
+        self.locked_at = utime.ticks_ms()
+
+        return token
+
+    def release(self, token: int) -> bool:
+        """ Release lock, token of preempted owner is ignored
+        """
+
+        if token is None or token != self.owner:
+            return False
 
-    def unlock(self, process: str = None):
-        if self.locked_by == process:
-            self.is_lock = False
+        hold = utime.ticks_diff(utime.ticks_ms(), self.locked_at)
+        self.hold_total_ms += hold
+        self.hold_max_ms = max(self.hold_max_ms, hold)
+
+        self.owner = self.locked_by = self.priority = None
+        self.wake()
+        return True
+
+    def wake(self):
+        """ Schedule the first waiter when lock is free, every waiter is woken only once
+        """
+
+        if self.owner is None and self.queue:
+            task = self.waiters.pop(self.queue[0][1], None)
+            if task is not None:
+                asyncio.get_event_loop().call_soon(task)
+
+    def owns(self, token: int) -> bool:
+        return token is not None and token == self.owner
 
     def is_locked(self):
-        return self.is_lock
+        return self.owner is not None
+
+    def stats(self) -> dict:
+        return {
+            'locked_by': self.locked_by,
+            'waiting': len(self.queue),
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'preemptions': self.preemptions,
+            'wait_avg_ms': self.wait_total_ms // self.acquisitions if self.acquisitions else 0,
+            'wait_max_ms': self.wait_max_ms,
+            'hold_avg_ms': self.hold_total_ms // self.acquisitions if self.acquisitions else 0,
+            'hold_max_ms': self.hold_max_ms,
+        }
 
 
 class LockedProcessException(Exception):
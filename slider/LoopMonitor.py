@@ -0,0 +1,140 @@
+from array import array
+import logging
+import uasyncio as asyncio
+import utime
+
+log = logging.getLogger('loop')
+
+
+class LoopMonitor:
+    """ Watchdog of event loop. Sleeps for fixed interval and measures how late it wakes up, late wakeup means that some
+    task, IRQ or scheduled callback held the loop. Every step of tasks started through watch() is timed too, so a stall
+    is attributed to the task which ran the longest step since the previous wakeup.
+    """
+
+    """ Upper bounds of lag histogram buckets in ms, the last bucket counts everything above them
+    """
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+    """ Name of stall which wasn't caused by any watched task (connection handlers, IRQ, scheduled callbacks)
+    """
+    OTHER = 'other'
+
+    def __init__(self, interval_ms: int = 100, stall_ms: int = 50, active: bool = True):
+        self.interval_ms = interval_ms
+        self.stall_ms = stall_ms
+        self.active = active
+
+        self.histogram = array('L', [0] * (len(self.BUCKETS) + 1))
+        self.samples = 0
+        self.lag_ms = self.max_ms = 0
+
+        # the longest step of watched task since the last wakeup, and the longest step of every task in us
+        self.slowest = None
+        self.slowest_us = 0
+        self.steps_max_us = {}
+
+        # amount of stalls and the last one (lag ms, task)
+        self.stalls = 0
+        self.stall = None
+
+    def watch(self, name: str, coro):
+        """ Time every step of coroutine, use as: loop.create_task(monitor.watch('display', status.display_status()))
+        """
+
+        return self.timed(name, coro) if self.active else coro
+
+    def timed(self, name: str, coro):
+        value = error = None
+
+        while True:
+            start = utime.ticks_us()
+            try:
+                request = coro.send(value) if error is None else coro.throw(error)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self.step(name, utime.ticks_diff(utime.ticks_us(), start))
+
+            value = error = None
+            try:
+                value = yield request
+            except GeneratorExit:
+                coro.close()
+                raise
+            except Exception as e:
+                # cancellation and errors of awaited objects go into the coroutine
+                error = e
+
+    def step(self, name: str, us: int):
+        if us > self.slowest_us:
+            self.slowest = name
+            self.slowest_us = us
+
+        if us > self.steps_max_us.get(name, 0):
+            self.steps_max_us[name] = us
+
+    def record(self, lag_us: int):
+        """ Put lag of one wakeup into histogram, log it if it is a stall
+        """
+
+        lag_ms = lag_us // 1000
+        self.samples += 1
+        self.lag_ms = lag_ms
+        if lag_ms > self.max_ms:
+            self.max_ms = lag_ms
+
+        i = 0
+        while i < len(self.BUCKETS) and lag_ms > self.BUCKETS[i]:
+            i += 1
+        self.histogram[i] += 1
+
+        if lag_ms >= self.stall_ms:
+            # step shorter than half of the lag didn't cause it
+            name = self.slowest if self.slowest_us * 2 >= lag_us else self.OTHER
+            self.stalls += 1
+            self.stall = (lag_ms, name)
+            log.warning('Loop stalled for %d ms by %s (longest step %d ms in %s)', lag_ms, name,
+                        self.slowest_us // 1000, self.slowest)
+
+        self.slowest = None
+        self.slowest_us = 0
+
+    def percentile(self, q: float = 0.99) -> int:
+        """ Lag in ms which q of wakeups didn't exceed, upper bound of its bucket
+        """
+
+        if not self.samples:
+            return 0
+
+        count = 0
+        for i in range(len(self.BUCKETS)):
+            count += self.histogram[i]
+            if count >= q * self.samples:
+                return min(self.BUCKETS[i], self.max_ms)
+
+        return self.max_ms
+
+    async def run(self):
+        """ Measure how late own wakeups come, runs as long as monitor is active
+        """
+
+        if not self.active:
+            return
+
+        while True:
+            due = utime.ticks_add(utime.ticks_us(), self.interval_ms * 1000)
+            await asyncio.sleep_ms(self.interval_ms)
+            self.record(max(0, utime.ticks_diff(utime.ticks_us(), due)))
+
+    def stats(self) -> dict:
+        return {
+            'lag_ms': self.lag_ms,
+            'max_ms': self.max_ms,
+            'p99_ms': self.percentile(),
+            'buckets_ms': self.BUCKETS,
+            'histogram': list(self.histogram),
+            'stalls': self.stalls,
+            'stall': self.stall,
+            'steps_max_us': self.steps_max_us,
+        }
@@ -1,8 +1,11 @@
-import copy
 from math import pi, ceil
 from machine import Pin
+import machine
+import micropython
+from slider.Dolly import Dolly
 from slider.Lock import *
 from slider.MotorDriver import MotorDriver
+from slider.Profile import Profile
 import uasyncio as asyncio
 import utime
 
@@ -11,6 +14,33 @@ class Motor:
     """ Motor knows about resolution of itself as well as how to calculate frequency and time needed to move a dolly.
     """
 
+    """ Move modes: PWM stopped after time, exact amount of steps from timer, single steps for very slow moves
+    """
+    PWM = 'pwm'
+    EXACT = 'exact'
+    CREEP = 'creep'
+
+    """ Frequency used for moves without specified time
+    """
+    default_frequency = 800
+
+    """ Back-off move which releases endstop
+    """
+    backoff_frequency = 1000
+    backoff_resolution = 4
+    backoff_ms = 43
+
+    """ Endstop states: waiting for hit, hit (driver stopped in IRQ), backing off, settling after release
+    """
+    EDGE_ARMED = 0
+    EDGE_HIT = 1
+    EDGE_BACKOFF = 2
+    EDGE_SETTLE = 3
+
+    """ Edges of the switch are ignored for this time after back-off, till it stops bouncing
+    """
+    endstop_debounce_ms = 100
+
     """
     Motor knows:
      # diameter of used pulley
@@ -18,118 +48,576 @@ class Motor:
      # distance by step
     """
 
-    def __init__(self, driver: MotorDriver, resolution: int = 200, pulley: float = 10.2):
+    def __init__(self, driver: MotorDriver, resolution: int = 200, pulley: float = 10.2, profile: str = Profile.NONE,
+                 acceleration: float = None, jerk: float = None, update_ms: int = 20, exact: bool = False,
+                 lightsleep_ms: int = 0, dolly: Dolly = None, lock: Lock = None):
 
         self.driver = driver
+        self.dolly = Dolly() if dolly is None else dolly
+        self.lock = Lock() if lock is None else lock
+
+        # dolly position at start of current move, position is tracked only while motor runs a move
+        self.origin = 0
+        self.tracking = False
+        self.rail_length = None
+
+        # callbacks fired on motor start, stop and endstop hit
+        self.listeners = []
 
         self.microsteps = self.frequency = self.direction = None
         self.time_ms = self.start_time = self.end_time = None
-        self.last_interrupt = None
+
+        # endstop state machine, times of hit and release, and measurements of the last hit
+        self.edge_state = self.EDGE_ARMED
+        self.edge_hits = self.move_hits = 0
+        self.edge = self.edge_time = self.backoff_start = None
+        self.isr_us = self.schedule_us = self.backoff_duration_ms = None
+        self.endstop_handler = self.endstop_hit
+        self.backoff_handler = self.backoff_done
+        self.profile = None
+
+        # motion profile settings, acceleration in mm/s^2 and jerk in mm/s^3
+        self.profile_kind = profile
+        self.acceleration = acceleration
+        self.jerk = jerk
+        self.update_ms = update_ms
+
+        # send exact amount of steps from timer instead of PWM stopped after time
+        self.exact = exact
+        self.mode = self.steps = self.steps_issued = None
+
+        # for single steps mode go into light sleep if there is more time than this till next step (0 disables)
+        self.lightsleep_ms = lightsleep_ms
 
         # calculate defaults
         self.full_rotate_distance = 2 * pi * (pulley / 2)
         self.step_distance = self.full_rotate_distance / resolution
         self.steps_per_mm = 1 / self.step_distance
+        self.speed_table = self.build_speed_table()
 
         # configure pins
         self.driver.endstop.irq(trigger=Pin.IRQ_FALLING, handler=self.endstop)
 
+    def calibrate(self, steps_per_mm: float, rail_length: float = None):
+        """ Set measured steps per mm and rail length (mm between endstops), speed table is built again
+        """
+
+        self.steps_per_mm = steps_per_mm
+        self.step_distance = 1 / steps_per_mm
+        self.speed_table = self.build_speed_table()
+        self.rail_length = rail_length
+
+    def limits(self) -> tuple:
+        """ Range (mm) in which dolly can move without hitting endstop, None when rail isn't measured or dolly homed
+        """
+
+        if self.rail_length is None or not self.dolly.homed:
+            return None
+
+        backoff = self.backoff_distance()
+        return backoff, self.rail_length - backoff
+
+    def clamp(self, direction: int, distance: float) -> float:
+        """ Shorten move so dolly stays on rail
+        """
+
+        limits = self.limits()
+        if limits is None or distance is None:
+            return distance
+
+        position = self.dolly.get_position()
+        room = limits[1] - position if direction == MotorDriver.RIGHT else position - limits[0]
+        return max(0, min(distance, room))
+
+    def build_speed_table(self) -> tuple:
+        """ Precompute speed bands (mm/s) for each resolution, ordered from the slowest. Dolly speed fits into first band
+        which upper limit is not exceeded, so the highest possible microstepping is used.
+        """
+
+        resolutions = sorted(MotorDriver.resolutions, reverse=True)
+        return tuple((MotorDriver.max_frequency / (self.steps_per_mm * r), r) for r in resolutions)
+
     def calculate(self, distance: int, time: int) -> tuple:
         """ Calculate frequency and resolution for specified distance and time.
         """
 
-        frequency = microsteps = None
-        time_ms = time * 1000
-        steps_to_move = distance * self.steps_per_mm
+        speed = distance / time
 
-        resolutions = copy.copy(MotorDriver.resolutions)
-        resolutions.reverse()
-
-        for resolution in resolutions:
-            frequency = ceil((steps_to_move / time) * resolution)
-            if 1 < frequency <= 1000:
-                microsteps = resolution
-                time_ms = int(ceil(distance / (self.step_distance / resolution) / frequency * 1000))
+        for max_speed, microsteps in self.speed_table:
+            if speed <= max_speed:
                 break
+        else:
+            raise RuntimeError('Speed out of range!')
 
-        if microsteps is None:
+        frequency = min(ceil(speed * self.steps_per_mm * microsteps), MotorDriver.max_frequency)
+        if frequency < MotorDriver.min_frequency:
             raise RuntimeError('Speed out of range!')
 
+        time_ms = int(ceil(distance * self.steps_per_mm * microsteps / frequency * 1000))
+
         return frequency, microsteps, time_ms
 
-    def move(self, direction: int, distance: int = None, time: int = None) -> int:
-        """ Move belt by distance on specified direction in time.
+    def speed_envelope(self) -> tuple:
+        """ Get (min, max) dolly speed in mm/s, minimal speed is exclusive (moves below PWM floor creep)
         """
 
-        # only one motor process can be used
-        Lock().lock('motor')
+        return 0, self.speed_table[-1][0]
 
-        # max available speed
-        self.direction = direction
+    def min_time(self, distance: float) -> int:
+        """ Shortest move time (s) for distance: cruise at max frequency with ramps of profile, jerk limit of S-curve
+        can make it longer, so the time is searched up to the one which compile() accepts
+        """
 
-        # default values for move without time
-        self.microsteps = 1
-        self.frequency = 800
-        self.time_ms = (distance / self.frequency) * 1000
+        acceleration = None if self.acceleration is None else self.acceleration * self.steps_per_mm
+        low = max(1, int(ceil(Profile.shortest(distance * self.steps_per_mm, MotorDriver.max_frequency,
+                                               self.profile_kind, acceleration))))
+
+        high = low
+        while not self.validate(distance, high):
+            low = high + 1
+            high *= 2
+
+        while low < high:
+            middle = (low + high) // 2
+            if self.validate(distance, middle):
+                high = middle
+            else:
+                low = middle + 1
+
+        return high
+
+    def envelope(self, distance: int = None) -> dict:
+        """ Speed envelope with allowed move time range for specified distance, to validate move before sending it.
+        Slow moves creep, so time has no upper bound (None).
+        """
+
+        min_speed, max_speed = self.speed_envelope()
+        envelope = {'speed': [min_speed, max_speed]}
+
+        if distance:
+            envelope['time'] = [self.min_time(distance), None]
+
+        return envelope
+
+    def validate(self, distance: int, time: int) -> bool:
+        """ Check if dolly is able to move by distance in specified time
+        """
+
+        try:
+            self.compile(distance, time)
+        except RuntimeError:
+            return False
+        return True
+
+    def make_profile(self, steps: float, time_ms: int, microsteps: int, kind: str) -> Profile:
+        """ Build motion profile for amount of steps, acceleration and jerk are converted to current microstepping
+        """
+
+        hz_per_mm = self.steps_per_mm * microsteps
+        return Profile(
+            steps,
+            time_ms,
+            kind,
+            None if self.acceleration is None else self.acceleration * hz_per_mm,
+            None if self.jerk is None else self.jerk * hz_per_mm
+        )
+
+    def build_profile(self, distance: int, time_ms: int, microsteps: int, kind: str) -> tuple:
+        """ Build motion profile for a move, if cruise speed is too high for current microstepping try lower one.
+        """
+
+        while True:
+            profile = self.make_profile(distance * self.steps_per_mm * microsteps, time_ms, microsteps, kind)
+            if profile.cruise <= MotorDriver.max_frequency or microsteps == 1:
+                break
+            microsteps //= 2
+
+        if profile.cruise > MotorDriver.max_frequency:
+            raise RuntimeError('Speed out of range!')
+
+        return microsteps, profile
+
+    def compile(self, distance: int, time: int = None, kind: str = None) -> tuple:
+        """ Resolve move into (mode, microsteps, steps, time_ms, profile kind), raise RuntimeError if dolly can't do it.
+        """
+
+        kind = self.profile_kind if kind is None else kind
+
+        # default values for move without time, ramps of profile make it longer
+        microsteps = 1
+        acceleration = None if self.acceleration is None else self.acceleration * self.steps_per_mm
+        time_ms = int(ceil(Profile.duration(distance * self.steps_per_mm, self.default_frequency, kind,
+                                            acceleration) * 1000))
 
         if time is not None:
-            self.frequency, self.microsteps, self.time_ms = self.calculate(distance, time)
+            # PWM and timer can't go below min_frequency even with the finest microstepping, such move is stepped
+            microsteps = max(MotorDriver.resolutions)
+            if distance and distance * self.steps_per_mm * microsteps / time < MotorDriver.min_frequency:
+                return self.CREEP, microsteps, round(distance * self.steps_per_mm * microsteps), time * 1000, Profile.NONE
+
+            microsteps = self.calculate(distance, time)[1]
+            time_ms = time * 1000
+
+        microsteps, profile = self.build_profile(distance, time_ms, microsteps, kind)
+
+        return self.EXACT if self.exact else self.PWM, microsteps, round(profile.steps), time_ms, kind
+
+    def move(self, direction: int, distance: int = None, time: int = None, token: int = None) -> int:
+        """ Move belt by distance on specified direction in time. Without token of the caller which already holds
+        the lock, move waits for the lock itself.
+        """
+
+        # only one motor process can be used
+        owned = token is None
+        if owned:
+            token = yield from self.lock.acquire('move')
+        elif not self.lock.owns(token):
+            raise LockedProcessException('Motor is working!')
+
+        try:
+            # dolly position is known only after the moves queued before this one are done
+            distance = self.clamp(direction, distance)
+            if not distance:
+                # dolly is at the end of rail already
+                return
+
+            yield from self.run(direction, *self.compile(distance, time))
+        finally:
+            # after specified time just stop the motor, unless other process took it over already
+            if self.lock.owns(token):
+                self.stop()
+            if owned:
+                self.lock.release(token)
+
+    def run(self, direction: int, mode: str, microsteps: int, steps: int, time_ms: int, kind: str):
+        """ Run compiled move, without locking and stopping motor at the end, so moves can follow one another.
+        """
+
+        self.mode = mode
+        self.direction = direction
+        self.microsteps = microsteps
+        self.time_ms = time_ms
+        self.end_time = None
+        self.steps = steps
+        self.steps_issued = None
+        self.origin = self.dolly.get_position()
+        self.tracking = True
+        self.move_hits = self.edge_hits
 
         self.driver \
             .set_direction(direction) \
-            .set_resolution(self.microsteps) \
-            .start(self.frequency)
+            .set_resolution(microsteps)
+
+        if mode == self.CREEP:
+            self.profile = None
+            self.frequency = round(steps * 1000 / time_ms, 3)
+            self.driver.start_single(steps)
+            self.start_time = utime.ticks_ms()
+            self.notify()
+            yield from self.follow_deadlines()
+            self.update_position()
+            yield from self.check_edge()
+            return
+
+        self.profile = self.make_profile(steps, time_ms, microsteps, kind)
+        self.frequency = round(self.profile.cruise)
+
+        if mode == self.EXACT:
+            self.driver.start_steps(steps, self.profile_frequency(0, self.update_ms))
+        else:
+            self.driver.start(self.profile_frequency(0, self.update_ms))
 
         self.start_time = utime.ticks_ms()
-        yield from asyncio.sleep_ms(self.time_ms)
+        self.notify()
 
-        # after specified time just stop the motor
-        self.stop()
+        yield from self.follow_profile()
+        self.update_position()
+        yield from self.check_edge()
+
+    def check_edge(self):
+        """ Move which reaches endstop can't continue, wait for back-off and abort the rest (plan, batch)
+        """
+
+        if self.interrupted:
+            yield from self.settle()
+            raise RuntimeError('Endstop hit!')
+
+    def follow_profile(self):
+        """ Update PWM frequency on fixed cadence, every interval gets average frequency of the profile, so event loop
+        latency doesn't change the amount of steps.
+        """
+
+        elapsed = 0
+        while elapsed < self.time_ms and not self.interrupted:
+            deadline = min(elapsed + self.update_ms, self.time_ms)
+            self.driver.set_frequency(self.profile_frequency(elapsed, deadline))
+            yield from asyncio.sleep_ms(max(1, int(deadline - elapsed)))
+            elapsed = utime.ticks_diff(utime.ticks_ms(), self.start_time)
+            self.update_position(elapsed)
+
+        # send steps which are left after rounding of frequencies within one more update
+        if self.mode == self.EXACT and self.driver.running and not self.interrupted:
+            remaining = self.driver.generator.remaining()
+            frequency = remaining * 1000 // self.update_ms
+            self.driver.set_frequency(min(MotorDriver.max_frequency, max(MotorDriver.min_frequency, frequency)))
+            while self.driver.running and not self.interrupted:
+                yield from asyncio.sleep_ms(self.update_ms)
+
+    def profile_frequency(self, t0_ms: float, t1_ms: float) -> int:
+        """ Frequency for next update interval, in exact mode it catches up with steps which profile expects at the end
+        of the interval.
+        """
+
+        if self.mode == self.EXACT and t1_ms > t0_ms:
+            missing = self.profile.steps_at(t1_ms) - self.driver.steps_issued()
+            frequency = missing * 1000 / (t1_ms - t0_ms)
+        else:
+            frequency = self.profile.frequency_between(t0_ms, t1_ms)
+
+        return min(MotorDriver.max_frequency, max(MotorDriver.min_frequency, round(frequency)))
+
+    def follow_deadlines(self):
+        """ Move slower than PWM allows: send single steps on deadlines counted from start of the move, so timing error
+        doesn't accumulate even for moves which take days.
+        """
+
+        steps = self.steps
+        for i in range(1, steps + 1):
+            deadline = utime.ticks_add(self.start_time, i * self.time_ms // steps)
+            delay = utime.ticks_diff(deadline, utime.ticks_ms())
+
+            if 0 < self.lightsleep_ms < delay:
+                # whole chip sleeps, wake up a bit earlier to finish waiting in event loop
+                machine.lightsleep(delay - self.update_ms)
+                delay = utime.ticks_diff(deadline, utime.ticks_ms())
+
+            if delay > 0:
+                yield from asyncio.sleep_ms(delay)
+
+            if self.interrupted:
+                break
 
-    def moveto_edge(self, direction: int, resolution: int = None, freq: int = None):
+            self.driver.pulse()
+            self.update_position(0)
+
+    def notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def update_position(self, elapsed_ms: int = None):
+        """ Move dolly by distance passed since start of current move
+        """
+
+        if not self.tracking:
+            return
+
+        if elapsed_ms is None:
+            elapsed_ms = min(self.time_ms, utime.ticks_diff(utime.ticks_ms(), self.start_time))
+
+        distance = self.distance_at(elapsed_ms)
+        self.dolly.set_position(self.origin + (distance if self.direction == MotorDriver.RIGHT else -distance))
+
+    def distance_at(self, elapsed_ms: int) -> float:
+        """ Distance in mm which dolly passed since start of the move
+        """
+
+        if self.mode in (self.EXACT, self.CREEP):
+            return self.driver.steps_issued() / (self.steps_per_mm * self.microsteps)
+
+        if self.profile is None:
+            return self.frequency * (elapsed_ms / 1000) * (self.step_distance / self.microsteps)
+
+        return self.profile.steps_at(elapsed_ms) / (self.steps_per_mm * self.microsteps)
+
+    def moveto_edge(self, direction: int, resolution: int = None, freq: int = None, token: int = None):
         """ Rotate motor as long as limit switch will be reached
         """
 
-        Lock().lock('motor')
+        owned = token is None
+        if owned:
+            token = yield from self.lock.acquire('homing', Lock.HOMING)
+        elif not self.lock.owns(token):
+            raise LockedProcessException('Motor is working!')
+
+        try:
+            yield from self.follow_edge(direction, resolution, freq)
+        finally:
+            if owned:
+                self.lock.release(token)
+
+    def follow_edge(self, direction: int, resolution: int = None, freq: int = None):
+        """ Run driver with ramp up and integrate dolly position till endstop stops it
+        """
+
+        self.mode = self.PWM
+        self.direction = direction
+        self.tracking = False
+        resolution = 1 if resolution is None else resolution
+        freq = 1000 if freq is None else freq
+        mm_per_step = 1 / (self.steps_per_mm * resolution)
+        sign = 1 if direction == MotorDriver.RIGHT else -1
 
         self.driver \
-            .set_resolution(1 if resolution is None else resolution) \
+            .set_resolution(resolution) \
             .set_direction(direction) \
-            .start(1000 if freq is None else freq)
+            .start(freq if self.acceleration is None else MotorDriver.min_frequency)
 
-        yield 0
+        self.notify()
+
+        # ramp up only if acceleration is set, endstop stops the motor
+        acceleration = None if self.acceleration is None else self.acceleration * self.steps_per_mm * resolution
+        frequency = freq if acceleration is None else MotorDriver.min_frequency
+        start = last = utime.ticks_ms()
+
+        while self.driver.running or self.at_edge:
+            yield from asyncio.sleep_ms(self.update_ms)
+
+            now = utime.ticks_ms()
+            if self.driver.running and not self.at_edge:
+                self.dolly.change_position(frequency * utime.ticks_diff(now, last) / 1000 * mm_per_step, sign)
+            last = now
+
+            if frequency < freq and not self.at_edge:
+                elapsed = utime.ticks_diff(now, start)
+                frequency = min(freq, int(MotorDriver.min_frequency + acceleration * elapsed / 1000))
+                self.driver.set_frequency(frequency)
 
     def endstop(self, irq: Pin = None):
-        """ Stop motor by hit in endstop switch. Dolly should go back couple steps to release switch.
+        """ Endstop IRQ: only stop the driver and hand the rest over to endstop_hit(). Switch bounces, so another
+        falling edge is ignored till back-off is finished and switch settles.
         """
 
-        # interrupt send couple signals one after another, to avoid couple reverse moving, wait for a while
-        if 0 < utime.ticks_diff(utime.ticks_ms(), self.last_interrupt) < 750 or irq.value() == 1:
+        now = utime.ticks_us()
+        if self.edge_state == self.EDGE_SETTLE and \
+                utime.ticks_diff(now, self.edge_time) > self.endstop_debounce_ms * 1000:
+            self.edge_state = self.EDGE_ARMED
+
+        if self.edge_state != self.EDGE_ARMED or irq.value() == 1:
             return
 
-        # stop motor, but only the driver (don't unlock a Motor)
         self.driver.stop()
+        self.edge_state = self.EDGE_HIT
+        self.edge_time = now
+        self.edge_hits += 1
+        self.isr_us = utime.ticks_diff(utime.ticks_us(), now)
+
+        try:
+            micropython.schedule(self.endstop_handler, None)
+        except RuntimeError:
+            # schedule queue is full, motor is stopped anyway, let next edge try again
+            self.edge_state = self.EDGE_ARMED
+
+    def endstop_hit(self, arg=None):
+        """ Scheduled after endstop IRQ: stop the move and start back-off which releases the switch. Back-off sends
+        exact amount of steps from timer, so nothing waits here.
+        """
+
+        self.schedule_us = utime.ticks_diff(utime.ticks_us(), self.edge_time)
+
+        self.stop()
+        self.edge = self.direction
+        self.edge_state = self.EDGE_BACKOFF
+        self.backoff_start = utime.ticks_ms()
 
-        # change direction and move couple steps to release endstop
         self.driver \
             .set_opposite_direction() \
-            .set_resolution(4) \
-            .start(1000)
+            .set_resolution(self.backoff_resolution) \
+            .start_steps(self.backoff_steps(), self.backoff_frequency, self.backoff_handler)
 
-        # wait till endstop will be released
-        utime.sleep_ms(43)
+    def backoff_done(self):
+        """ Called from timer when back-off steps are sent, endstop is exact position of the edge
+        """
 
-        # stop motor and release lock
-        self.stop()
+        self.backoff_duration_ms = utime.ticks_diff(utime.ticks_ms(), self.backoff_start)
+
+        backoff = self.driver.steps_issued() / (self.steps_per_mm * self.backoff_resolution)
+        if self.edge == MotorDriver.LEFT:
+            self.dolly.set_position(backoff)
+            self.dolly.homed = True
+        elif self.rail_length is not None:
+            self.dolly.set_position(self.rail_length - backoff)
+
+        self.edge_time = utime.ticks_us()
+        self.edge_state = self.EDGE_SETTLE
+        self.notify()
+
+    def backoff_steps(self) -> int:
+        return round(self.backoff_frequency * self.backoff_ms / 1000)
+
+    def backoff_distance(self) -> float:
+        return self.backoff_steps() / (self.steps_per_mm * self.backoff_resolution)
+
+    def find_edge(self, direction: int, resolution: int, frequency: int, limit_mm: float) -> int:
+        """ Run to endstop by exact steps, so distance to the switch is known. Returns amount of steps sent till hit.
+        """
+
+        self.mode = self.EXACT
+        self.direction = direction
+        self.microsteps = resolution
+        self.tracking = False
+        self.move_hits = self.edge_hits
+
+        self.driver \
+            .set_resolution(resolution) \
+            .set_direction(direction) \
+            .start_steps(round(limit_mm * self.steps_per_mm * resolution), frequency)
+        self.notify()
+
+        while self.driver.running or self.at_edge:
+            yield from asyncio.sleep_ms(self.update_ms)
+
+        if not self.interrupted:
+            self.stop()
+            raise RuntimeError('Endstop not found!')
+
+        # steps of the move are stored by stop() in endstop handler, before back-off starts
+        return self.steps_issued
+
+    @property
+    def at_edge(self) -> bool:
+        """ Endstop was hit and back-off isn't finished yet
+        """
+
+        return self.edge_state in (self.EDGE_HIT, self.EDGE_BACKOFF)
+
+    @property
+    def interrupted(self) -> bool:
+        """ Endstop was hit during current move
+        """
+
+        return self.edge_hits != self.move_hits
+
+    def settle(self):
+        """ Wait till back-off from endstop is finished
+        """
+
+        while self.at_edge:
+            yield from asyncio.sleep_ms(self.update_ms)
+
+    def endstop_stats(self) -> dict:
+        """ Time from IRQ to stopped driver and to scheduled handler (us) and duration of back-off (ms)
+        """
 
-        # update last interrupt
-        self.last_interrupt = utime.ticks_ms()
+        return {
+            'hits': self.edge_hits,
+            'isr_us': self.isr_us,
+            'schedule_us': self.schedule_us,
+            'backoff_ms': self.backoff_duration_ms,
+        }
 
     def stop(self):
-        """ Stop and unlock motor!
+        """ Stop motor! Lock stays with its owner.
         """
 
         self.driver.stop()
-        Lock().unlock('motor')
+        self.update_position()
+        self.tracking = False
+        if self.edge_state == self.EDGE_BACKOFF:
+            # back-off was interrupted, its done callback won't come
+            self.edge_time = utime.ticks_us()
+            self.edge_state = self.EDGE_SETTLE
         if self.start_time:
             self.end_time = utime.ticks_ms()
+        if self.mode in (self.EXACT, self.CREEP):
+            self.steps_issued = self.driver.steps_issued()
+        self.notify()
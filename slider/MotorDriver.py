@@ -1,4 +1,5 @@
-from machine import Pin, PWM
+from machine import Pin, PWM, Timer
+from slider.StepGenerator import StepGenerator
 
 
 class MotorDriver:
@@ -14,6 +15,11 @@ class MotorDriver:
     """
     resolutions = [1, 2, 4, 8, 16]
 
+    """ PWM frequency range which motor can follow
+    """
+    min_frequency = 2
+    max_frequency = 1000
+
     """ Settings for specified resolutions
     """
     resolution_settings = {
@@ -24,10 +30,14 @@ class MotorDriver:
         16: [1, 1, 1]
     }
 
-    def __init__(self, step: Pin, direction: Pin, m1: Pin, m2: Pin, m3: Pin, endstop: Pin):
+    def __init__(self, step: Pin, direction: Pin, m1: Pin, m2: Pin, m3: Pin, endstop: Pin, timer: int = 0):
         self.pwm = PWM(step)
         self.pwm.duty(512)
         self.pwm.deinit()
+        self.pwm_running = False
+
+        self.step_pin = step
+        self.generator = StepGenerator(step, Timer(timer))
 
         self.endstop = endstop
         self.direction = direction
@@ -67,9 +77,54 @@ class MotorDriver:
 
         self.pwm.freq(frequency)
         self.pwm.init()
+        self.pwm_running = True
+
+    def start_steps(self, steps: int, frequency: int, done=None):
+        """ Send exact amount of steps to motor, done is called from timer when all of them are sent
+        """
+
+        self.pwm.deinit()
+        self.pwm_running = False
+        self.generator.start(steps, frequency, done)
+
+    def start_single(self, steps: int):
+        """ Prepare driver to send single steps by pulse()
+        """
+
+        self.pwm.deinit()
+        self.pwm_running = False
+        self.generator.prepare(steps)
+
+    def pulse(self):
+        """ Send single step to motor
+        """
+
+        self.generator.pulse()
+
+    def set_frequency(self, frequency: int):
+        """ Change speed of running motor
+        """
+
+        if self.pwm_running:
+            self.pwm.freq(frequency)
+        elif self.generator.running:
+            self.generator.set_frequency(frequency)
+
+    @property
+    def running(self) -> bool:
+        return self.pwm_running or self.generator.running
+
+    def steps_issued(self) -> int:
+        """ Amount of steps sent in last exact-steps or single-steps move
+        """
+
+        return self.generator.issued
 
     def stop(self):
         """ Stop sending move signal to motor
         """
 
         self.pwm.deinit()
+        self.pwm_running = False
+        if self.generator.running:
+            self.generator.stop()
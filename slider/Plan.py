@@ -0,0 +1,157 @@
+from array import array
+from slider.Lock import *
+from slider.Motor import Motor
+from slider.MotorDriver import MotorDriver
+from slider.Profile import Profile
+import uasyncio as asyncio
+import utime
+
+
+class Plan:
+    """ Motion plan: ordered list of keyframes compiled into segment table and executed back to back under one lock.
+
+    Keyframe is a dict with absolute position (mm), time (s) to reach it from previous keyframe and optional easing.
+    Keyframe with the same position as previous one just holds the dolly for its time.
+    """
+
+    """ Easing names accepted in keyframes mapped to motion profiles
+    """
+    easings = {
+        'linear': Profile.NONE,
+        'trapezoid': Profile.TRAPEZOID,
+        'ease': Profile.SCURVE,
+        'scurve': Profile.SCURVE,
+    }
+
+    """ Codes used in segment table
+    """
+    modes = (Motor.PWM, Motor.EXACT, Motor.CREEP)
+    kinds = (Profile.NONE, Profile.TRAPEZOID, Profile.SCURVE)
+
+    def __init__(self, motor: Motor, keyframes: list, position: float = 0, status: 'Status' = None):
+        self.motor = motor
+        self.keyframes = keyframes
+
+        # status shows progress of the plan only while it runs
+        self.status = status
+
+        self.current = None
+        self.start_time = self.segment_start = None
+
+        self.compile(position)
+
+    def compile(self, position: float):
+        """ Validate keyframes and resolve them into segments from position, raise ValueError or RuntimeError for
+        wrong plan
+        """
+
+        if not self.keyframes:
+            raise ValueError('Empty plan!')
+
+        self.direction = array('b')
+        self.mode = array('b')
+        self.microsteps = array('B')
+        self.steps = array('l')
+        self.time_ms = array('l')
+        self.kind = array('b')
+        self.total_ms = 0
+
+        limits = self.motor.limits()
+
+        for keyframe in self.keyframes:
+            try:
+                target = float(keyframe['position'])
+                time = int(keyframe['time'])
+                easing = keyframe.get('easing')
+                kind = self.motor.profile_kind if easing is None else self.easings[easing]
+            except (KeyError, TypeError, ValueError, AttributeError):
+                raise ValueError('Wrong keyframe!')
+
+            if target < 0 or time <= 0:
+                raise ValueError('Wrong keyframe!')
+
+            if limits is not None and not limits[0] <= target <= limits[1]:
+                raise ValueError('Keyframe out of rail!')
+
+            distance = abs(target - position)
+            direction = MotorDriver.RIGHT if target > position else MotorDriver.LEFT
+
+            if distance:
+                mode, microsteps, steps, time_ms, kind = self.motor.compile(distance, time, kind)
+            else:
+                mode, microsteps, steps, time_ms = Motor.PWM, 1, 0, time * 1000
+
+            self.direction.append(direction)
+            self.mode.append(self.modes.index(mode))
+            self.microsteps.append(microsteps)
+            self.steps.append(steps)
+            self.time_ms.append(time_ms)
+            self.kind.append(self.kinds.index(kind))
+
+            self.total_ms += time_ms
+            position = target
+
+    def __len__(self):
+        return len(self.steps)
+
+    def run(self, token: int = None):
+        """ Execute all segments one after another without releasing the motor
+        """
+
+        lock = self.motor.lock
+        owned = token is None
+        if owned:
+            token = yield from lock.acquire('plan')
+        elif not lock.owns(token):
+            raise LockedProcessException('Motor is working!')
+
+        try:
+            # moves queued before the plan changed dolly position since it was compiled
+            self.compile(self.motor.dolly.get_position())
+            self.start_time = utime.ticks_ms()
+            if self.status is not None:
+                self.status.plan = self
+
+            for i in range(len(self)):
+                self.current = i
+                self.segment_start = utime.ticks_ms()
+
+                if not self.steps[i]:
+                    # PWM of previous segment runs till it's stopped
+                    self.motor.stop()
+                    yield from asyncio.sleep_ms(self.time_ms[i])
+                    continue
+
+                yield from self.motor.run(
+                    self.direction[i],
+                    self.modes[self.mode[i]],
+                    self.microsteps[i],
+                    self.steps[i],
+                    self.time_ms[i],
+                    self.kinds[self.kind[i]]
+                )
+        finally:
+            self.current = None
+            if self.status is not None and self.status.plan is self:
+                self.status.plan = None
+            if lock.owns(token):
+                self.motor.stop()
+            if owned:
+                lock.release(token)
+
+    def progress(self) -> dict:
+        """ Current segment with time left in segment and whole plan
+        """
+
+        if self.current is None:
+            return {'segment': None, 'segments': len(self), 'eta': 0, 'segment_eta': 0}
+
+        now = utime.ticks_ms()
+        segment_left = self.time_ms[self.current] - utime.ticks_diff(now, self.segment_start)
+
+        return {
+            'segment': self.current + 1,
+            'segments': len(self),
+            'eta': max(0, self.total_ms - utime.ticks_diff(now, self.start_time)),
+            'segment_eta': max(0, segment_left),
+        }
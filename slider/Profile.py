@@ -0,0 +1,117 @@
+from math import sqrt
+
+
+class Profile:
+    """ Frequency schedule for one move: ramp-up, cruise and ramp-down. Ramps are linear (trapezoid) or smoothstep
+    shaped (S-curve), both symmetric, so whole move always issues the same amount of steps in requested time.
+    """
+
+    """ Available profile types
+    """
+    NONE = 'none'
+    TRAPEZOID = 'trapezoid'
+    SCURVE = 'scurve'
+
+    def __init__(self, steps: float, time_ms: int, kind: str = TRAPEZOID, acceleration: float = None,
+                 jerk: float = None):
+        """ Acceleration in Hz/s and jerk in Hz/s^2 for current microstepping
+        """
+
+        self.steps = steps
+        self.time_ms = time_ms
+        self.kind = kind if acceleration else self.NONE
+
+        total = time_ms / 1000
+        self.cruise, self.ramp = self.solve(steps, total, self.kind, acceleration, jerk)
+        self.ramp_ms = self.ramp * 1000
+
+    @staticmethod
+    def duration(steps: float, frequency: float, kind: str = TRAPEZOID, acceleration: float = None) -> float:
+        """ Time (s) of move which cruises at frequency and has room for both ramps, shorter moves cruise slower
+        """
+
+        if kind == Profile.NONE or not acceleration:
+            return steps / frequency
+
+        return steps / frequency + (1.5 if kind == Profile.SCURVE else 1) * frequency / acceleration
+
+    @staticmethod
+    def shortest(steps: float, frequency: float, kind: str = TRAPEZOID, acceleration: float = None) -> float:
+        """ Shortest time (s) of move which doesn't exceed frequency, short moves only ramp up and down
+        """
+
+        if kind == Profile.NONE or not acceleration:
+            return steps / frequency
+
+        k = (1.5 if kind == Profile.SCURVE else 1) / acceleration
+        if steps < k * frequency * frequency:
+            return 2 * sqrt(k * steps)
+
+        return steps / frequency + k * frequency
+
+    @staticmethod
+    def solve(steps: float, total: float, kind: str, acceleration: float, jerk: float) -> tuple:
+        """ Find cruise frequency and ramp time, so area under frequency curve is equal to amount of steps
+        """
+
+        if kind == Profile.NONE or not steps:
+            return steps / total, 0
+
+        # peak acceleration of smoothstep ramp is 1.5 times higher than average
+        k = (1.5 if kind == Profile.SCURVE else 1) / acceleration
+        delta = total * total - 4 * k * steps
+        if delta < 0:
+            raise RuntimeError('Acceleration out of range!')
+
+        cruise = (total - sqrt(delta)) / (2 * k)
+        ramp = k * cruise
+
+        # smoothstep ramp has peak jerk 6 * cruise / ramp^2, make ramp longer if it's too high
+        if kind == Profile.SCURVE and jerk:
+            for _ in range(8):
+                jerk_ramp = sqrt(6 * cruise / jerk)
+                if jerk_ramp <= ramp or 2 * jerk_ramp > total:
+                    break
+                ramp = jerk_ramp
+                cruise = steps / (total - ramp)
+
+            if 2 * ramp > total or 6 * cruise / (ramp * ramp) > jerk * 1.01:
+                raise RuntimeError('Jerk out of range!')
+
+        return cruise, ramp
+
+    def shape(self, u: float) -> float:
+        """ Integral of normalized ramp from 0 to u
+        """
+
+        if self.kind == self.SCURVE:
+            return u * u * u - u * u * u * u / 2
+        return u * u / 2
+
+    def steps_at(self, t_ms: float) -> float:
+        """ Amount of steps issued from start of the move till specified time
+        """
+
+        if t_ms <= 0:
+            return 0
+        if t_ms >= self.time_ms:
+            return self.steps
+
+        t = t_ms / 1000
+        total = self.time_ms / 1000
+
+        if t < self.ramp:
+            return self.cruise * self.ramp * self.shape(t / self.ramp)
+        if t <= total - self.ramp:
+            return self.cruise * (t - self.ramp / 2)
+
+        return self.steps - self.cruise * self.ramp * self.shape((total - t) / self.ramp)
+
+    def frequency_between(self, t0_ms: float, t1_ms: float) -> float:
+        """ Average frequency between two points of time, it keeps amount of steps exact for any update cadence
+        """
+
+        if t1_ms <= t0_ms:
+            return self.cruise
+
+        return (self.steps_at(t1_ms) - self.steps_at(t0_ms)) * 1000 / (t1_ms - t0_ms)
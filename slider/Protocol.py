@@ -0,0 +1,97 @@
+import ustruct
+
+
+class Protocol:
+    """ Binary command protocol, sent in WebSocket binary frames next to JSON commands.
+
+    Frame: version byte, opcode byte and little-endian int32 fields of the opcode. First byte of JSON command is
+    always '{' or '[', so both formats can share one connection.
+    """
+
+    VERSION = 1
+
+    """ Opcodes
+    """
+    MOVE = 0x01
+    STOP = 0x02
+    RESOLUTION = 0x03
+    DRIVER = 0x04
+    MOVE_TO = 0x05
+    ENVELOPE = 0x06
+    SUBSCRIBE = 0x07
+    PLAN = 0x08
+
+    """ Fields of every opcode: move (direction, distance mm, time s, 0 = no time), resolution (microsteps),
+    driver (microsteps, direction), move to (position um, time s), envelope (distance mm),
+    subscribe (group mask, binary), plan (amount of keyframes, followed by KEYFRAME for each of them)
+    """
+    FORMATS = {
+        MOVE: '<iii',
+        STOP: '',
+        RESOLUTION: '<i',
+        DRIVER: '<ii',
+        MOVE_TO: '<ii',
+        ENVELOPE: '<i',
+        SUBSCRIBE: '<ii',
+        PLAN: '<i',
+    }
+
+    """ Keyframe of plan: position um, time s, easing (index of EASINGS)
+    """
+    KEYFRAME = '<iii'
+    EASINGS = ('linear', 'trapezoid', 'ease')
+
+    HEADER_SIZE = 2
+
+    @staticmethod
+    def is_binary(msg) -> bool:
+        return msg[0] == Protocol.VERSION
+
+    @staticmethod
+    def decode(msg) -> tuple:
+        """ Decode (opcode, fields) straight from received buffer, raise ValueError for malformed frame
+        """
+
+        if len(msg) < Protocol.HEADER_SIZE or msg[0] != Protocol.VERSION:
+            raise ValueError('Wrong protocol version!')
+
+        opcode = msg[1]
+        if opcode not in Protocol.FORMATS:
+            raise ValueError('Unknown opcode!')
+
+        fmt = Protocol.FORMATS[opcode]
+        if not fmt:
+            return opcode, ()
+
+        if len(msg) < Protocol.HEADER_SIZE + ustruct.calcsize(fmt):
+            raise ValueError('Frame too short!')
+
+        return opcode, ustruct.unpack_from(fmt, msg, Protocol.HEADER_SIZE)
+
+    @staticmethod
+    def keyframes(msg, count: int) -> list:
+        """ Decode keyframes of plan which follow its header, raise ValueError when frame doesn't hold all of them
+        """
+
+        keyframes = []
+        offset = Protocol.HEADER_SIZE + ustruct.calcsize(Protocol.FORMATS[Protocol.PLAN])
+        size = ustruct.calcsize(Protocol.KEYFRAME)
+
+        if count < 0 or offset + count * size > len(msg):
+            raise ValueError('Frame too short!')
+
+        for i in range(count):
+            position, time, easing = ustruct.unpack_from(Protocol.KEYFRAME, msg, offset + i * size)
+            if not 0 <= easing < len(Protocol.EASINGS):
+                raise ValueError('Unknown easing!')
+            keyframes.append({'position': position / 1000, 'time': time, 'easing': Protocol.EASINGS[easing]})
+
+        return keyframes
+
+    @staticmethod
+    def encode(opcode: int, *fields) -> bytes:
+        """ Build command frame, used by clients and tests on host
+        """
+
+        fmt = Protocol.FORMATS[opcode]
+        return bytes((Protocol.VERSION, opcode)) + (ustruct.pack(fmt, *fields) if fmt else b'')
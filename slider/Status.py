@@ -1,13 +1,11 @@
-import framebuf
-from slider.Config import *
-from slider.Dolly import *
-from slider.Motor import *
-from ssd1306 import SSD1306_I2C
-import ujson
+from slider.Battery import Battery
+from slider.Dolly import Dolly
+from slider.Motor import Motor
+from slider.MotorDriver import MotorDriver
+from slider.StatusFrame import StatusFrame
+import uasyncio as asyncio
 import utime
 
-from uwebsocket import WebSocketConnection
-
 
 class Status:
     """ Display and send actual slider status (battery, motor position, time left etc.)
@@ -15,17 +13,113 @@ class Status:
 
     slider_length = None
     dolly_position = None
-    socket = None
+    plan = None
 
-    def __init__(self, motor: Motor, dolly: Dolly, display: SSD1306_I2C = None):
+    def __init__(self, motor: Motor, dolly: Dolly, display: 'Display' = None, battery: Battery = None,
+                 heartbeat_ms: int = 2000, moving_ms: int = 500, poll_ms: int = 20, monitor: 'LoopMonitor' = None,
+                 debug: bool = False):
         self.motor = motor
         self.dolly = dolly
         self.display = display
+        self.battery = battery
+
+        # event loop lag is sent in status, debug page shows it on display instead of move progress
+        self.monitor = monitor
+        self.debug = debug
+
+        # connections which receive status frames with their subscription (groups, binary) and encoders
+        self.sockets = []
+        self.subscriptions = {}
+        self.frames = {}
+        self.values = StatusFrame.values()
+
+        # push status immediately on change, or after heartbeat (moving_ms while motor runs)
+        self.changed = True
+        self.heartbeat_ms = heartbeat_ms
+        self.moving_ms = moving_ms
+        self.poll_ms = poll_ms
+
+        self.motor.listeners.append(self.notify)
+
+    def add_socket(self, connection: 'WebSocketConnection'):
+        """ Register socket connection to receive status frames
+        """
+
+        if connection not in self.sockets:
+            self.subscribe(connection)
+
+    def remove_socket(self, connection: 'WebSocketConnection'):
+        """ Stop sending status frames to connection
+        """
+
+        if connection in self.sockets:
+            self.sockets.remove(connection)
+            del self.subscriptions[connection]
 
-    def set_socket(self, connection: WebSocketConnection):
-        """ Setup socket connection handler
+    def subscribe(self, connection: 'WebSocketConnection', groups: int = StatusFrame.ALL, binary: bool = False):
+        """ Set which field groups and in which format connection receives
         """
-        self.socket = connection
+
+        if connection not in self.sockets:
+            self.sockets.append(connection)
+
+        key = groups << 1 | binary
+        if key not in self.frames:
+            self.frames[key] = StatusFrame(groups, binary)
+
+        self.subscriptions[connection] = (groups, binary)
+        self.changed = True
+
+    def collect(self):
+        """ Fill values array with live motor, dolly, battery and plan data
+        """
+
+        values = self.values
+        motor = self.motor
+
+        values[StatusFrame.RUNNING] = motor.driver.running
+        values[StatusFrame.LOCKED] = self.motor.lock.is_locked()
+        values[StatusFrame.DIRECTION] = motor.direction or 0
+        values[StatusFrame.MICROSTEPS] = motor.microsteps or 0
+        values[StatusFrame.FREQUENCY] = int((motor.frequency or 0) * 100)
+
+        total = elapsed = 0
+        if motor.start_time and motor.time_ms:
+            total = int(motor.time_ms)
+            elapsed = utime.ticks_diff(motor.end_time if motor.end_time else utime.ticks_ms(), motor.start_time)
+        values[StatusFrame.TOTAL] = total
+        values[StatusFrame.LEFT] = max(0, total - elapsed)
+
+        self.dolly_position = self.dolly.get_position()
+        values[StatusFrame.POSITION_UM] = int(self.dolly_position * 1000)
+        values[StatusFrame.HOMED] = self.dolly.homed
+        values[StatusFrame.LENGTH_UM] = int((self.slider_length or 0) * 1000)
+
+        voltage, percent = self.battery_level()
+        values[StatusFrame.VOLTAGE] = int(voltage * 1000)
+        values[StatusFrame.PERCENT] = percent
+
+        segment = segments = eta = segment_eta = 0
+        if self.plan is not None and self.plan.current is not None:
+            progress = self.plan.progress()
+            segment, segments, eta = progress['segment'], progress['segments'], progress['eta']
+            segment_eta = progress['segment_eta']
+        values[StatusFrame.SEGMENT] = min(segment, 0xffff)
+        values[StatusFrame.SEGMENTS] = min(segments, 0xffff)
+        values[StatusFrame.ETA] = eta
+        values[StatusFrame.SEGMENT_ETA] = segment_eta
+
+        lag_max = lag_p99 = 0
+        if self.monitor is not None:
+            lag_max, lag_p99 = self.monitor.max_ms, self.monitor.percentile()
+        values[StatusFrame.LAG_MAX] = min(lag_max, 0xffff)
+        values[StatusFrame.LAG_P99] = min(lag_p99, 0xffff)
+
+    def notify(self):
+        """ Mark status as changed, it's sent to all clients on next broadcaster tick. Safe to call from IRQ.
+        """
+
+        self.changed = True
 
     def send(self, msg: str):
         ...
@@ -61,19 +155,23 @@ class Status:
             b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
         )
 
+        import framebuf
+
         logo = framebuf.FrameBuffer(slider_logo, 64, 48, framebuf.MONO_HLSB)
         self.display.blit(logo, 32, 4)
         self.display.text('SliderMCU', 28, 52)
-        self.display.show()
+        self.display.show(True)
 
         await asyncio.sleep(2)
 
         self.display.fill(0)
-        self.display.show()
-        asyncio.get_event_loop().call_soon(self.display_status())
+        self.display.show(True)
 
-    async def draw_battery(self, level, show_value=True):
-        """
+        # the same task goes on with status, so it stays watched by loop monitor
+        await self.display_status()
+
+    def draw_battery(self, level, show_value=True):
+        """ Draw battery icon with level in top right corner
         """
         bat_w = 15
         status_bar = 11
@@ -94,8 +192,6 @@ class Status:
             self.display.fill_rect(self.display.width - bat_w - 27, 0, 24, 7, 0)
             self.display.text(str(level), self.display.width - bat_w - 2 - 17 - extra_space, 0)
 
-        await asyncio.sleep(30)
-
     async def display_status(self):
         """ Display status information on the screen
         """
@@ -103,62 +199,96 @@ class Status:
         if self.display is None:
             return
 
+        level = self.battery_level()[1]
         self.display.fill(0)
         self.display.text('Ready!', 0, 0)
-        self.draw_battery(self.battery_level()[1])
+        self.draw_battery(level)
         self.display.show()
 
+        # values on screen, page is drawn again only when they change (slow move changes them once per second)
+        drawn = None
+
         while True:
 
-            # todo: baterie odpytywac co kilka(nascie) sekund)
-            self.draw_battery(self.battery_level()[1])
+            battery = self.battery_level()[1]
+            if battery != level:
+                level = battery
+                self.draw_battery(level)
+
+            if self.debug and self.monitor is not None:
+                monitor = self.monitor
+                page = (monitor.lag_ms, monitor.max_ms, monitor.percentile(), monitor.stalls, monitor.stall)
+                if page != drawn:
+                    drawn = page
+                    self.draw_debug()
 
-            if self.motor.start_time or self.motor.end_time:
+            elif self.motor.start_time or self.motor.end_time:
 
                 total_time = (0 if self.motor.time_ms is None else self.motor.time_ms) / 1000
                 time_for_delta = self.motor.end_time if self.motor.end_time else utime.ticks_ms()
                 time_elapsed = utime.ticks_diff(time_for_delta, self.motor.start_time)
                 time_left = round(total_time - (time_elapsed / 1000), 2)
-                distance_elapsed = self.motor.frequency * (time_elapsed / 1000) * (
-                        self.motor.step_distance / self.motor.microsteps)
+                distance_elapsed = self.motor.distance_at(time_elapsed)
+                segment = None if self.plan is None else self.plan.current
 
-                self.display.fill_rect(0, 9, 128, 64, 0)
-                self.display.line(0, 9, 128, 9, 1)
-                self.display.text('<<<<<<<' if MotorDriver.LEFT == self.motor.direction else '>>>>>>>', 36, 12)
-                self.display.text('TOTAL: ' + str(self.nice_time(int(total_time))), 0, 23)
-                self.display.text('LEFT:  ' + str(self.nice_time(int(time_left))), 0, 32)
-
-                self.display.text('DIST:  ' + str(int(distance_elapsed)) + ' mm', 0, 41)
-
-                self.display.line(0, 54, 128, 54, 1)
-                self.display.text('R/Hz: ' + str(self.motor.microsteps) + '/' + str(self.motor.frequency), 0, 56)
-                self.display.show()
+                page = (self.motor.direction, segment, int(total_time), int(time_left), int(distance_elapsed),
+                        self.motor.microsteps, self.motor.frequency)
+                if page != drawn:
+                    drawn = page
+                    self.draw_move(*page)
 
                 # if finished reset timers
                 if self.motor.end_time:
                     self.motor.start_time = self.motor.end_time = None
 
-            await asyncio.sleep_ms(10)
+            # only changed pages are sent, nothing at all if frame is the same
+            self.display.show()
 
-    @staticmethod
-    def battery_level() -> tuple:
+            await asyncio.sleep_ms(self.display.frame_ms)
 
-        adc = Config.adc
+    def draw_move(self, direction: int, segment: int, total: int, left: int, distance: int, microsteps: int,
+                  frequency: int):
+        """ Move page: direction, plan segment, total and left time, passed distance, resolution and frequency
+        """
 
-        probe = i = 0
-        while i < Config.battery_probes_amount:
-            probe = probe + adc.read()
-            i = i + 1
+        self.display.fill_rect(0, 9, 128, 64, 0)
+        self.display.line(0, 9, 128, 9, 1)
+        self.display.text('<<<<<<<' if MotorDriver.LEFT == direction else '>>>>>>>', 36, 12)
+        if segment is not None:
+            self.display.text(str(segment + 1) + '/' + str(len(self.plan)), 0, 12)
+        self.display.text('TOTAL: ' + str(self.nice_time(total)), 0, 23)
+        self.display.text('LEFT:  ' + str(self.nice_time(left)), 0, 32)
 
-        adc_value = int(probe / Config.battery_probes_amount)
-        percent = adc_value / 4095
+        self.display.text('DIST:  ' + str(distance) + ' mm', 0, 41)
 
-        battery_voltage = percent * Config.battery_max_voltage
-        battery_range = Config.battery_max_voltage - Config.battery_min_voltage
-        battery_percent = int((battery_voltage - Config.battery_min_voltage) / battery_range * 100)
-        battery_percent = 0 if battery_percent < 0 else battery_percent
+        self.display.line(0, 54, 128, 54, 1)
+        self.display.text('R/Hz: ' + str(microsteps) + '/' + str(frequency), 0, 56)
 
-        return battery_voltage, battery_percent, adc_value, percent
+    def draw_debug(self):
+        """ Debug page with event loop lag: last, maximal and 99th percentile, amount of stalls and the last one
+        """
+
+        monitor = self.monitor
+
+        self.display.fill_rect(0, 9, 128, 64, 0)
+        self.display.line(0, 9, 128, 9, 1)
+        self.display.text('LAG:   ' + str(monitor.lag_ms) + ' ms', 0, 12)
+        self.display.text('MAX:   ' + str(monitor.max_ms) + ' ms', 0, 23)
+        self.display.text('P99:   ' + str(monitor.percentile()) + ' ms', 0, 32)
+        self.display.text('STALL: ' + str(monitor.stalls), 0, 41)
+
+        self.display.line(0, 54, 128, 54, 1)
+        if monitor.stall is not None:
+            self.display.text(str(monitor.stall[0]) + ' ' + monitor.stall[1], 0, 56)
+
+    def battery_level(self) -> tuple:
+        """ Get cached battery (voltage, percent), sampling is done in background by Battery.run()
+        """
+
+        if self.battery is None:
+            return 0.0, 0
+
+        return self.battery.level()
 
     @staticmethod
     def nice_time(seconds: int) -> str:
@@ -167,40 +297,35 @@ class Status:
         return "%02d:%02d:%02d" % (h, m, s)
 
     async def send_status(self):
+        """ Single broadcaster: encode status once and send it to every connected client
+        """
 
-        if self.socket is None:
-            return
-
-        # motor.__dict__
+        last = utime.ticks_ms()
 
         while True:
-            status = {
-                'errors': None,
-                'motor': {
-                    'locked': True,
-                    'speed': 12,
-                    'frequency': 1000,
-                    'microsteps': 4,
-                    'start_time': 121345,
-                    'current_time': 123423,
-                    'direction': 'left',
-                },
-                'slider': {
-                    'duration': {
-                        'set': 3600,
-                        'nice': '01:00:00',
-                        'left': 2560
-                    },
-                    'distance': {
-                        'set': 1000,
-                        'left': 532
-                    }
-                },
-                'battery': {
-                    'voltage': 12.4,
-                    'percent': 100
-                }
-            }
-            self.socket.write(ujson.dumps(status))
-
-            await asyncio.sleep_ms(500)
+            await asyncio.sleep_ms(self.poll_ms)
+
+            # drop closed connections
+            for connection in [connection for connection in self.sockets if connection.is_closed()]:
+                self.remove_socket(connection)
+            if not self.sockets:
+                continue
+
+            now = utime.ticks_ms()
+            interval = self.moving_ms if self.motor.driver.running else self.heartbeat_ms
+            if not self.changed and utime.ticks_diff(now, last) < interval:
+                continue
+
+            self.changed = False
+            last = now
+
+            self.collect()
+
+            # every distinct subscription is encoded only once
+            encoded = {}
+            for connection in self.sockets:
+                groups, binary = self.subscriptions[connection]
+                key = groups << 1 | binary
+                if key not in encoded:
+                    encoded[key] = self.frames[key].encode(self.values)
+                connection.write(encoded[key], binary)
@@ -0,0 +1,118 @@
+from array import array
+import ustruct
+
+
+class StatusFrame:
+    """ Encoder of status values for one subscription (group mask and format). Binary frame is packed in place into
+    preallocated buffer: version, mask and fields of selected groups in FIELDS order. JSON frame is flat dictionary
+    with selected fields, reused between frames.
+    """
+
+    """ Field groups which client can subscribe to
+    """
+    MOTOR = 0x01
+    TIME = 0x02
+    POSITION = 0x04
+    BATTERY = 0x08
+    PLAN = 0x10
+    LOOP = 0x20
+    ALL = 0x3f
+
+    GROUPS = {
+        'motor': MOTOR,
+        'time': TIME,
+        'position': POSITION,
+        'battery': BATTERY,
+        'plan': PLAN,
+        'loop': LOOP,
+    }
+
+    """ Binary frame version, first byte of every binary frame
+    """
+    VERSION = 4
+
+    """ All status fields: name, group and binary format. Values are integers, units: frequency in 1/100 Hz, time in ms,
+    position and rail length in um (0 when rail isn't calibrated), voltage in mV, event loop lag in ms.
+    """
+    FIELDS = (
+        ('running', MOTOR, 'B'),
+        ('locked', MOTOR, 'B'),
+        ('direction', MOTOR, 'B'),
+        ('microsteps', MOTOR, 'B'),
+        ('frequency', MOTOR, 'I'),
+        ('total', TIME, 'I'),
+        ('left', TIME, 'I'),
+        ('position', POSITION, 'i'),
+        ('homed', POSITION, 'B'),
+        ('length', POSITION, 'I'),
+        ('voltage', BATTERY, 'H'),
+        ('percent', BATTERY, 'B'),
+        ('segment', PLAN, 'H'),
+        ('segments', PLAN, 'H'),
+        ('eta', PLAN, 'I'),
+        ('segment_eta', PLAN, 'I'),
+        ('lag_max', LOOP, 'H'),
+        ('lag_p99', LOOP, 'H'),
+    )
+
+    """ Indexes of fields in values array
+    """
+    RUNNING, LOCKED, DIRECTION, MICROSTEPS, FREQUENCY, TOTAL, LEFT, POSITION_UM, HOMED, LENGTH_UM, VOLTAGE, PERCENT, \
+        SEGMENT, SEGMENTS, ETA, SEGMENT_ETA, LAG_MAX, LAG_P99 = range(18)
+
+    def __init__(self, groups: int = ALL, binary: bool = False):
+        self.groups = groups
+        self.binary = binary
+
+        self.layout = []
+        self.data = {}
+        offset = 2
+
+        for i in range(len(self.FIELDS)):
+            name, group, code = self.FIELDS[i]
+            if not group & groups:
+                continue
+            self.layout.append((i, name, '<' + code, offset))
+            self.data[name] = 0
+            offset += ustruct.calcsize(code)
+
+        self.buffer = bytearray(offset)
+        self.buffer[0] = self.VERSION
+        self.buffer[1] = groups
+
+        # JSON is loaded only when some client wants it
+        if not binary:
+            import ujson
+            self.dumps = ujson.dumps
+
+    @staticmethod
+    def values() -> array:
+        """ Preallocated array for live status values
+        """
+
+        return array('l', [0] * len(StatusFrame.FIELDS))
+
+    @staticmethod
+    def mask(groups: list) -> int:
+        """ Build group mask from list of group names
+        """
+
+        result = 0
+        for name in groups:
+            result |= StatusFrame.GROUPS[name]
+        return result
+
+    def encode(self, status: array):
+        """ Encode status values, binary frame is returned as the same buffer every time
+        """
+
+        if self.binary:
+            buffer = self.buffer
+            for i, name, code, offset in self.layout:
+                ustruct.pack_into(code, buffer, offset, status[i])
+            return buffer
+
+        data = self.data
+        for i, name, code, offset in self.layout:
+            data[name] = status[i]
+        return self.dumps(data)
@@ -0,0 +1,77 @@
+from machine import Pin, Timer
+
+
+class StepGenerator:
+    """ Emits exact amount of step pulses from hardware timer callback. Every callback sends one pulse and counts it,
+    so distance doesn't depend on event loop latency, only the rate does.
+    """
+
+    def __init__(self, pin: Pin, timer: Timer):
+        self.pin = pin
+        self.timer = timer
+
+        self.steps = self.issued = 0
+        self.frequency = 0
+        self.running = False
+        self.done = None
+
+    def prepare(self, steps: int):
+        """ Reset counters and switch step pin into output mode
+        """
+
+        self.steps = steps
+        self.issued = 0
+
+        self.pin.init(Pin.OUT)
+        self.pin.value(0)
+
+    def start(self, steps: int, frequency: int, done=None):
+        """ Start sending specified amount of pulses, done is called when all of them are sent
+        """
+
+        self.prepare(steps)
+        self.done = done
+        self.running = steps > 0
+        self.set_frequency(frequency)
+
+    def set_frequency(self, frequency: int):
+        """ Change pulse rate, amount of steps stays untouched
+        """
+
+        self.frequency = frequency
+        if self.running:
+            self.timer.init(freq=frequency, mode=Timer.PERIODIC, callback=self.tick)
+
+    def tick(self, timer: Timer = None):
+        """ Timer callback, send one pulse
+        """
+
+        if self.issued >= self.steps:
+            self.stop()
+            return
+
+        self.pulse()
+
+        if self.issued >= self.steps:
+            self.stop()
+            if self.done is not None:
+                self.done()
+
+    def pulse(self):
+        """ Send and count single pulse
+        """
+
+        self.pin.value(1)
+        self.issued += 1
+        self.pin.value(0)
+
+    def remaining(self) -> int:
+        return self.steps - self.issued
+
+    def stop(self) -> int:
+        """ Stop sending pulses, returns amount of steps issued
+        """
+
+        self.timer.deinit()
+        self.running = False
+        return self.issued
@@ -1,65 +1,161 @@
-from slider.Dolly import *
-from slider.Motor import *
-from slider.MotorDriver import *
-from slider.Status import *
+from slider.Homing import Homing
+from slider.Lock import Lock, LockedProcessException
+from slider.Motor import Motor
+from slider.MotorDriver import MotorDriver
+from slider.Plan import Plan
+from slider.Status import Status
+import logging
 import uasyncio as asyncio
 
+log = logging.getLogger('slider')
+
 
 class Slider:
     """ Main class of Slider. Class can delegate tasks for motor or direct for driver.
     """
 
-    working_task = None  # define current working task to kill it after fire stop method.
-
-    def __init__(self, motor: Motor, status: Status):
+    def __init__(self, motor: Motor, status: Status, homing: Homing = None, calibration: 'Calibration' = None):
         self.motor = motor
         self.status = status
+        self.lock = motor.lock
+        self.homing = Homing(motor) if homing is None else homing
+
+        if calibration is None:
+            # rail calibration is loaded only for slider which doesn't get it from main.py
+            from slider.Calibration import Calibration
+            calibration = Calibration(motor, self.homing)
+        self.calibration = calibration
+
+        # rail length is known from stored calibration
+        self.status.slider_length = motor.rail_length
+
+        # running and queued tasks, to kill them after fire stop method
+        self.tasks = []
+        self.monitor = status.monitor
 
     async def reset(self):
-        """ Reset slider, so move dolly on start position
+        """ Reset slider, so home dolly again and leave it on start position
         """
 
-        self.__do_action(self.motor.moveto_edge(MotorDriver.LEFT))
+        self.__do_action(self.homing.run(True), Lock.HOMING)
 
     def goto_start(self):
-        """ Move dolly to start position
+        """ Move dolly to start position, dolly is homed only if it wasn't yet
         """
 
-        self.__do_action(self.motor.moveto_edge(MotorDriver.LEFT))
+        self.__do_action(self.homing.run(False), Lock.HOMING)
 
     def goto_end(self):
         """ Move dolly to end position
         """
 
-        self.__do_action(self.motor.moveto_edge(MotorDriver.RIGHT))
+        self.__do_action(self.motor.moveto_edge(MotorDriver.RIGHT), Lock.HOMING)
 
-    def stop(self):
-        """ Force stop motor
+    def calibrate(self):
+        """ Measure rail length and steps per mm
         """
 
-        if self.working_task:
-            # cancel current working task
-            asyncio.cancel(self.working_task)
-            self.working_task = None
+        self.__do_action(self.measure_rail(), Lock.HOMING)
+
+    def measure_rail(self, token: int = None):
+        yield from self.calibration.run(token)
+        self.status.slider_length = self.motor.rail_length
 
+    def stop(self):
+        """ Force stop motor, running and queued tasks are cancelled
+        """
+
+        self.cancel()
         self.motor.stop()
 
+    def cancel(self):
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            asyncio.cancel(task)
+
     def move_dolly(self, distance: int, direction: int, time: int = None):
         """ Move dolly by direction in time
         """
 
         self.__do_action(self.motor.move(direction, distance, time))
 
-    def __do_action(self, generator):
+    def move_to(self, position: float, time: int = None):
+        """ Move dolly to absolute position (mm from left edge)
+        """
+
+        self.__do_action(self.go_to(position, time))
+
+    def go_to(self, position: float, time: int = None, token: int = None):
+        """ Generator of move to absolute position, direction is taken from dolly position when it gets the motor
+        """
+
+        owned = token is None
+        if owned:
+            token = yield from self.lock.acquire('move')
 
         try:
-            self.working_task = generator
-            asyncio.get_event_loop().call_soon(self.working_task)
-        except LockedProcessException as e:
-            self.stop()
-            # todo: send error message to client
-            # self.status.write('motor locked')
-            print('motor locked')
-            print(e)
-        except RuntimeError as e:
-            print(e)
+            current = self.status.dolly.get_position()
+            if position != current:
+                direction = MotorDriver.RIGHT if position > current else MotorDriver.LEFT
+                yield from self.motor.move(direction, abs(position - current), time, token)
+        finally:
+            if owned:
+                self.lock.release(token)
+
+    def run_plan(self, keyframes: list, reply=None) -> bool:
+        """ Compile keyframes into motion plan and run all its segments back to back. Errors of wrong plan and of its
+        run are passed to reply (e.g. write of client connection), returns False when plan can't be compiled.
+        """
+
+        try:
+            plan = self.plan(keyframes)
+        except (RuntimeError, ValueError) as e:
+            self.report(reply, str(e))
+            return False
+
+        self.__do_action(plan.run(), reply=reply)
+        return True
+
+    def plan(self, keyframes: list) -> Plan:
+        """ Compile keyframes from current dolly position, raise RuntimeError when plan can't be driven. Plan is
+        compiled again from the position where it gets the motor, status shows its progress while it runs.
+        """
+
+        return Plan(self.motor, keyframes, self.status.dolly.get_position(), self.status)
+
+    def run(self, generator, priority: int = Lock.MOVE, reply=None):
+        """ Run generator (motion or batch of commands) as a task, it waits for the motor lock in queue. Error which
+        stops the task is passed to reply.
+        """
+
+        self.__do_action(generator, priority, reply)
+
+    @staticmethod
+    def report(reply, message: str):
+        if reply is None:
+            log.error(message)
+        else:
+            reply(message)
+
+    def __do_action(self, generator, priority: int = Lock.MOVE, reply=None):
+
+        # homing and calibration preempt whatever is running or waiting, cancelled owner doesn't own the lock when
+        # its task gets the error, so the motor is stopped here
+        if priority > Lock.MOVE:
+            self.cancel()
+            self.motor.stop()
+
+        def task():
+            try:
+                yield from generator
+            except (LockedProcessException, RuntimeError, ValueError) as e:
+                self.report(reply, str(e))
+            finally:
+                if current in self.tasks:
+                    self.tasks.remove(current)
+
+        current = task()
+        if self.monitor is not None:
+            current = self.monitor.watch('motion', current)
+        self.tasks.append(current)
+        asyncio.get_event_loop().call_soon(current)
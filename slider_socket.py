@@ -1,47 +1,222 @@
 from slider import Slider
-import ujson
+from slider.Commands import Commands
+from slider.Config import Config
+from slider.Lock import Lock, LockedProcessException
+from slider.MotorDriver import MotorDriver
+from slider.Protocol import Protocol
+from slider.StatusFrame import StatusFrame
 from uwebsocket import *
-import uasyncio as asyncio
 
 
 class SliderClient(WebSocketClient):
 
-    def __init__(self, conn, slider: Slider):
+    def __init__(self, conn, slider: Slider, server: WebSocketServer = None):
         self.slider = slider
+        self.server = server
         super().__init__(conn)
 
+        # status is broadcast also to clients which only watch and never send a command
+        slider.status.add_socket(conn)
+
     def process(self):
         try:
 
-            msg = self.connection.read().decode("utf-8")
-            command = ujson.loads(msg)
-
-            self.slider.status.set_socket(self.connection)
-
-            if command['action'] == 'move':
-                self.slider.move_dolly(
-                    int(command['distance']),
-                    self.slider.motor.driver.LEFT if command['direction'] == 'left' else self.slider.motor.driver.RIGHT,
-                    int(command['time'])
-                )
-            elif command['action'] == 'driver':
-                self.slider.motor.driver \
-                    .set_resolution(int(command['value'])) \
-                    .set_direction(command['direction'])
-            elif command['action'] == 'resolution':
-                self.slider.motor.driver.set_resolution(int(command['value']))
-            elif command['action'] == 'stop':
-                self.slider.stop()
-
-            # todo: check if other send_status coro already running
-            asyncio.get_event_loop().create_task(self.slider.status.send_status())
-
-        except ValueError:
+            msg = self.connection.read()
+            if not msg:
+                return
+
+            if Protocol.is_binary(msg):
+                self.execute(*commands.parse_binary(msg))
+                return
+
+            # JSON is loaded with the first JSON command, not on boot
+            import ujson
+            command = ujson.loads(msg.decode("utf-8"))
+
+            if isinstance(command, list):
+                self.process_batch(command)
+            else:
+                self.execute(*commands.parse(command))
+
+        except (ValueError, KeyError, IndexError, TypeError):
             self.connection.write('Wrong command!')
 
+        except RuntimeError as e:
+            self.connection.write(str(e))
+
         except ClientClosedError:
             self.connection.close()
 
+    def execute(self, action: str, args: tuple):
+        """ Execute single command, motion is started as working task of slider
+        """
+
+        if commands.is_motion(action):
+            self.slider.run(commands.call(self, action, args), commands.priority(action), self.report)
+            return
+
+        result = commands.call(self, action, args)
+        if result is not None:
+            import ujson
+            self.connection.write(ujson.dumps(result))
+
+    def report(self, message: str):
+        """ Send error of motion which stopped after its command was accepted
+        """
+
+        if not self.connection.is_closed():
+            self.connection.write(message)
+
+    def process_batch(self, batch: list):
+        """ Validate all commands of batch first, then run them in order in one working task
+        """
+
+        calls = [commands.parse(command) for command in batch]
+
+        for action, args in calls:
+            if commands.is_motion(action):
+                self.slider.run(self.run_batch(calls))
+                return
+
+        for _ in self.execute_batch(calls):
+            pass
+
+    def run_batch(self, calls: list):
+        """ Hold motor lock for the whole batch, so no other client's move gets between its commands
+        """
+
+        lock = self.slider.lock
+        token = yield from lock.acquire('batch')
+        try:
+            yield from self.execute_batch(calls, token)
+        finally:
+            lock.release(token)
+
+    def execute_batch(self, calls: list, token: int = None):
+        """ Run commands one after another, waiting for every motion to finish. Batch is stopped on first error and
+        results of all commands are sent back in one frame, also when batch is cancelled.
+        """
+
+        results = []
+        try:
+            for action, args in calls:
+                if results and 'error' in results[-1]:
+                    results.append({'action': action, 'error': 'Skipped'})
+                    continue
+
+                try:
+                    if commands.is_motion(action):
+                        yield from commands.call(self, action, args + (token,))
+                        result = None
+                    else:
+                        result = commands.call(self, action, args)
+                    results.append({'action': action, 'result': 'ok' if result is None else result})
+                except (RuntimeError, LockedProcessException, ValueError) as e:
+                    results.append({'action': action, 'error': str(e)})
+                except (KeyError, IndexError, TypeError):
+                    results.append({'action': action, 'error': 'Wrong command!'})
+        finally:
+            # batch cancelled by stop or homing reports commands which didn't finish
+            for action, args in calls[len(results):]:
+                results.append({'action': action, 'error': 'Cancelled'})
+            import ujson
+            self.connection.write(ujson.dumps(results))
+
+    def move(self, distance: int, direction: int, time: int, token: int = None):
+        return self.slider.motor.move(direction, distance, time, token)
+
+    def move_to(self, position: float, time: int, token: int = None):
+        return self.slider.go_to(position, time, token)
+
+    def plan(self, keyframes: list, token: int = None):
+        return self.slider.plan(keyframes).run(token)
+
+    def start(self, token: int = None):
+        return self.slider.homing.run(False, token)
+
+    def home(self, token: int = None):
+        return self.slider.homing.run(True, token)
+
+    def calibrate(self, token: int = None):
+        return self.slider.measure_rail(token)
+
+    def end(self, token: int = None):
+        return self.slider.motor.moveto_edge(MotorDriver.RIGHT, token=token)
+
+    def stop(self):
+        self.slider.stop()
+
+    def driver(self, resolution: int, direction):
+        self.slider.motor.driver \
+            .set_resolution(resolution) \
+            .set_direction(direction)
+
+    def resolution(self, resolution: int):
+        self.slider.motor.driver.set_resolution(resolution)
+
+    def subscribe(self, groups: int, binary: bool):
+        self.slider.status.subscribe(self.connection, groups, binary)
+
+    def envelope(self, distance: int) -> dict:
+        return self.slider.motor.envelope(distance)
+
+    def config(self, values: dict) -> dict:
+        """ Change and store settings, they are applied on next boot. Returns all settings.
+        """
+
+        if values:
+            # nothing is changed when any of values is wrong
+            values = {name: Config.check(name, values[name]) for name in values}
+            for name in values:
+                Config.set(name, values[name])
+            Config.save()
+
+        return Config.settings()
+
+    def stats(self) -> dict:
+        if self.server is not None:
+            stats = self.server.stats()
+            stats['lock'] = self.slider.lock.stats()
+            stats['endstop'] = self.slider.motor.endstop_stats()
+            stats['homing'] = self.slider.homing.result
+            stats['calibration'] = self.slider.calibration.result
+            if self.slider.monitor is not None:
+                stats['loop'] = self.slider.monitor.stats()
+            return stats
+
+
+def direction(value) -> int:
+    return MotorDriver.LEFT if value in ('left', MotorDriver.LEFT) else MotorDriver.RIGHT
+
+
+def optional(value):
+    return None if value is None else int(value)
+
+
+""" Commands: action, handler, JSON fields with converters and defaults, binary opcode with decoder of its fields
+"""
+commands = Commands()
+commands.register('move', SliderClient.move, (('distance', int), ('direction', direction), ('time', int)),
+                  Protocol.MOVE, lambda fields, msg: (fields[1], MotorDriver.RIGHT if fields[0] else MotorDriver.LEFT,
+                                                      fields[2] or None), motion=True)
+commands.register('moveto', SliderClient.move_to, (('position', float), ('time', optional, None)),
+                  Protocol.MOVE_TO, lambda fields, msg: (fields[0] / 1000, fields[1] or None), motion=True)
+commands.register('plan', SliderClient.plan, (('keyframes', list),),
+                  Protocol.PLAN, lambda fields, msg: (Protocol.keyframes(msg, fields[0]),), motion=True)
+commands.register('start', SliderClient.start, motion=True, priority=Lock.HOMING)
+commands.register('home', SliderClient.home, motion=True, priority=Lock.HOMING)
+commands.register('calibrate', SliderClient.calibrate, motion=True, priority=Lock.HOMING)
+commands.register('end', SliderClient.end, motion=True, priority=Lock.HOMING)
+commands.register('stop', SliderClient.stop, (), Protocol.STOP)
+commands.register('driver', SliderClient.driver, (('value', int), ('direction', direction)), Protocol.DRIVER)
+commands.register('resolution', SliderClient.resolution, (('value', int),), Protocol.RESOLUTION)
+commands.register('subscribe', SliderClient.subscribe,
+                  (('fields', StatusFrame.mask, StatusFrame.ALL), ('format', lambda value: value == 'binary', False)),
+                  Protocol.SUBSCRIBE, lambda fields, msg: (fields[0], bool(fields[1])))
+commands.register('envelope', SliderClient.envelope, (('distance', int, 0),), Protocol.ENVELOPE)
+commands.register('stats', SliderClient.stats)
+commands.register('config', SliderClient.config, (('values', dict, None),))
+
 
 class SliderServer(WebSocketServer):
 
@@ -50,4 +225,16 @@ class SliderServer(WebSocketServer):
         super().__init__(2)
 
     def _make_client(self, conn):
-        return SliderClient(conn, self.slider)
+        return SliderClient(conn, self.slider, self)
+
+    def remove_connection(self, conn):
+        super().remove_connection(conn)
+        self.slider.status.remove_socket(conn)
+
+    def _handle_stream(self, reader, writer):
+        """ Every connection runs as a task of its own, loop monitor times its command processing
+        """
+
+        handler = super()._handle_stream(reader, writer)
+        monitor = self.slider.monitor
+        return handler if monitor is None else monitor.watch('client', handler)
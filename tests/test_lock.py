@@ -0,0 +1,147 @@
+""" Motor lock on simulated hardware: queued moves run in order from the position the previous one left, homing
+preempts whatever runs or waits and stop cancels all of it.
+
+Run from the repository root:  pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sim import hardware
+from sim.stack import Stack
+
+""" Exact mode sends steps of the coarsest resolution which fits the speed
+"""
+STEP_MM = 0.2
+
+
+@pytest.fixture
+def stack():
+    stack = Stack(hardware.VirtualClock(), 1000, 250, display=False)
+    stack.start(False)
+    stack.run(stack.homing.run(True))
+    return stack
+
+
+def run_tasks(stack, limit_s: float = 3600):
+    """ Run event loop till all tasks of slider are finished
+    """
+
+    clock = hardware.clock
+    end = clock.now_us() + limit_s * 1000000
+    while stack.slider.tasks and clock.now_us() < end:
+        stack.loop.run_once()
+    assert not stack.slider.tasks
+
+
+def run_for(stack, ms: float):
+    end = hardware.clock.now_us() + ms * 1000
+    while hardware.clock.now_us() < end:
+        stack.loop.run_once()
+
+
+def test_queue(stack):
+    slider = stack.slider
+    lock = stack.slider.lock
+    start = stack.dolly.get_position()
+
+    # positions of queued moves are taken when they get the motor
+    slider.move_to(start + 200, 10)
+    slider.move_to(start + 100, 10)
+    slider.move_to(start + 150, 10)
+    run_for(stack, 100)
+
+    assert lock.locked_by == 'move'
+    assert lock.stats()['waiting'] == 2
+
+    run_tasks(stack)
+
+    assert abs(stack.rail.position_mm - start - 150) < STEP_MM
+    assert abs(stack.dolly.get_position() - start - 150) < STEP_MM
+    assert not lock.is_locked() and not lock.queue and not lock.waiters
+    assert lock.stats()['contended'] == 2
+    assert len(stack.loop.errors) == 0
+
+
+def test_wakeup(stack):
+    import uasyncio as asyncio
+
+    lock = stack.slider.lock
+    acquired = []
+
+    def holder():
+        token = yield from lock.acquire('first')
+        yield from asyncio.sleep_ms(7)
+        lock.release(token)
+
+    def waiter():
+        token = yield from lock.acquire('second')
+        acquired.append(hardware.clock.now_us())
+        lock.release(token)
+
+    start = hardware.clock.now_us()
+    stack.loop.call_soon(holder())
+    stack.loop.call_soon(waiter())
+    while not acquired:
+        stack.loop.run_once()
+
+    # waiter gets the lock when it's released, not on its next poll
+    assert acquired[0] - start == 7000
+    assert not lock.is_locked() and not lock.waiters
+
+
+def test_preempt(stack):
+    slider = stack.slider
+    lock = stack.slider.lock
+    start = stack.dolly.get_position()
+
+    slider.move_to(start + 500, 60)
+    slider.move_to(start + 600, 10)
+    run_for(stack, 5000)
+    assert stack.driver.running
+
+    # homing stops the move at once, queued move is cancelled
+    slider.goto_start()
+    assert not stack.driver.running
+    position = stack.rail.position_mm
+    assert position - start > 10
+
+    run_for(stack, 1)
+    assert lock.locked_by == 'homing'
+
+    run_tasks(stack)
+
+    assert stack.dolly.homed
+    assert stack.rail.position_mm < position
+    assert abs(stack.dolly.get_position() - stack.rail.position_mm) < STEP_MM
+    assert not lock.is_locked() and not lock.queue and not lock.waiters
+    assert len(stack.loop.errors) == 0
+
+
+def test_stop(stack):
+    slider = stack.slider
+    lock = stack.slider.lock
+    start = stack.dolly.get_position()
+
+    for i in range(1, 4):
+        slider.move_to(start + 100 * i, 10)
+    run_for(stack, 1000)
+    assert lock.stats()['waiting'] == 2
+
+    slider.stop()
+    assert not stack.driver.running
+    position = stack.rail.position_mm
+
+    run_tasks(stack, 1)
+    run_for(stack, 1000)
+
+    assert stack.rail.position_mm == position
+    assert not lock.is_locked() and not lock.queue and not lock.waiters
+
+    # lock is free for the next move
+    slider.move_to(start, 10)
+    run_tasks(stack)
+    assert abs(stack.rail.position_mm - start) < STEP_MM
+    assert len(stack.loop.errors) == 0
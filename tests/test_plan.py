@@ -0,0 +1,123 @@
+""" Motion plans on simulated hardware: segments follow one another and hold keyframes keep the dolly still.
+
+Run from the repository root:  pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sim import hardware
+from sim.stack import Stack
+
+""" PWM mode stops after time, so it's off by rounding of frequencies
+"""
+PWM_MM = 0.5
+
+
+@pytest.fixture
+def stack():
+    stack = Stack(hardware.VirtualClock(), 1000, 250, display=False)
+    stack.recorder = stack.start()
+    stack.run(stack.homing.run(True))
+    return stack
+
+
+@pytest.mark.parametrize('exact', [False, True])
+def test_hold(stack, exact):
+    stack.motor.exact = exact
+    rail = stack.rail
+    start = stack.dolly.get_position()
+    start_mm = rail.position_mm
+
+    plan = stack.slider.plan([
+        {'position': start + 100, 'time': 10},
+        {'position': start + 100, 'time': 20},
+    ])
+    stack.run(plan.run())
+    held_mm = rail.position_mm
+
+    assert not stack.driver.running
+    assert abs(held_mm - start_mm - 100) < PWM_MM
+    assert abs(stack.dolly.get_position() - start - 100) < PWM_MM
+
+    # dolly stays where the hold left it, next plan goes on from there
+    plan = stack.slider.plan([
+        {'position': start + 100, 'time': 5},
+        {'position': start + 50, 'time': 10},
+    ])
+    stack.run(plan.run())
+
+    assert abs(rail.position_mm - held_mm + 50) < PWM_MM
+    assert len(stack.loop.errors) == 0
+
+
+def test_status(stack):
+    import json
+
+    slider = stack.slider
+    status = stack.status
+    recorder = stack.recorder
+    start = stack.dolly.get_position()
+
+    slider.run_plan([{'position': start + 10, 'time': 10}, {'position': start + 20, 'time': 10}])
+    slider.run_plan([{'position': start, 'time': 5}])
+
+    while status.plan is None:
+        stack.loop.run_once()
+    running = status.plan
+    assert len(running) == 2
+
+    # status shows the running plan, not the queued one
+    while len(slider.tasks) == 2:
+        assert status.plan is running
+        stack.loop.run_once()
+
+    while slider.tasks:
+        assert status.plan is None or len(status.plan) == 1
+        stack.loop.run_once()
+    assert status.plan is None
+
+    # broadcaster sends the change on its next tick
+    end = hardware.clock.now_us() + 100000
+    while hardware.clock.now_us() < end:
+        stack.loop.run_once()
+
+    frames = [json.loads(frame) for frame in recorder.frames]
+    segments = [frame for frame in frames if frame['segments'] == 2]
+    assert segments
+    assert all(0 < frame['segment_eta'] <= 10000 for frame in segments)
+    assert all(frame['segment_eta'] <= frame['eta'] for frame in segments)
+    assert frames[-1]['segments'] == 0
+
+
+@pytest.mark.parametrize('keyframes, error', [
+    ([], 'Empty plan!'),
+    ([{'position': 10}], 'Wrong keyframe!'),
+    ([{'position': 'left', 'time': 10}], 'Wrong keyframe!'),
+    ([{'position': -10, 'time': 10}], 'Wrong keyframe!'),
+    ([{'position': 10, 'time': 10, 'easing': 'bounce'}], 'Wrong keyframe!'),
+])
+def test_wrong_plan(stack, keyframes, error):
+    replies = []
+
+    assert not stack.slider.run_plan(keyframes, replies.append)
+    assert replies == [error]
+    assert not stack.slider.tasks
+
+
+def test_run_error(stack):
+    slider = stack.slider
+    start = stack.dolly.get_position()
+    replies = []
+
+    # plan fits from current position, but not from where the queued move leaves the dolly
+    slider.move_to(start + 500, 10)
+    assert slider.run_plan([{'position': start + 10, 'time': 1}], replies.append)
+
+    while slider.tasks:
+        stack.loop.run_once()
+
+    assert replies == ['Speed out of range!']
+    assert not stack.slider.lock.is_locked()
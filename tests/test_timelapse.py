@@ -0,0 +1,34 @@
+""" Timelapse moves on simulated hardware in virtual time: every step is sent, the move ends on time and the firmware
+doesn't wake up more often than it used to.
+
+Run from the repository root:  pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sim.timelapse import timelapse
+
+""" Distance in mm passed within one microstep of the finest resolution
+"""
+STEP_MM = 0.01
+
+
+@pytest.mark.parametrize('distance, hours, mode, task_steps_per_hour', [
+    # timer sends exact amount of steps, profile is followed every update_ms
+    (100, 0.25, 'exact', 515000),
+    # slower than PWM can go, single steps on deadlines
+    (10, 666 / 3600, 'creep', 325000),
+])
+def test_timelapse(distance, hours, mode, task_steps_per_hour):
+    report = timelapse(distance, hours, display=True)
+
+    assert report['errors'] == 0
+    assert report['mode'] == mode
+    assert report['steps_sent'] == report['steps_expected']
+    assert abs(report['distance_mm'] - distance) < STEP_MM
+    assert abs(report['position_error_mm']) < STEP_MM
+    assert abs(report['drift_ms']) < 1
+    assert report['task_steps_per_hour'] < task_steps_per_hour
@@ -1,21 +1,156 @@
 import os
 import socket
 import network
-from time import sleep
+import ubinascii
+import uhashlib
 import uselect
+import ustruct
 import uasyncio as asyncio
-import websocket_helper
+import utime
 from websocket import websocket
 
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+HTTP_CODES = {
+    200: 'OK',
+    304: 'Not Modified',
+    404: 'Not Found',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+MIME_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'html': 'text/html',
+    'htm': 'text/html',
+    'css': 'text/css',
+    'js': 'application/javascript'
+}
+
+FRAME_TXT = 0x1
+FRAME_BIN = 0x2
+
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xa
+
 
 class ClientClosedError(Exception):
     pass
 
 
+class Asset:
+    """ Static file with prebuilt response headers, small files keep their content in memory
+    """
+
+    def __init__(self, path: str, length: int, etag: str, headers: bytes, not_modified: bytes, body: bytes = None):
+        self.path = path
+        self.length = length
+        self.etag = etag
+        self.headers = headers
+        self.not_modified = not_modified
+        self.body = body
+
+
+class AssetCache:
+    """ Cache of web directory. Gzip variants (file.html.gz) are served with Content-Encoding to clients which accept
+    it, files bigger than max_bytes are streamed from flash through one reused buffer.
+    """
+
+    def __init__(self, web_dir: str = 'www', max_bytes: int = 8192, max_age: int = 3600, chunk: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.assets = {}
+        self.gzip = {}
+
+        self.buffer = bytearray(chunk)
+        self.busy = False
+
+        self.load(web_dir, '')
+
+    def load(self, directory: str, url: str):
+        for name in os.listdir(directory):
+            path = directory + '/' + name
+            stat = os.stat(path)
+
+            # directory
+            if stat[0] & 0x4000:
+                self.load(path, url + '/' + name)
+                continue
+
+            if name.endswith('.gz'):
+                self.gzip[url + '/' + name[:-3]] = self.build(path, name[:-3], stat, True)
+            else:
+                self.assets[url + '/' + name] = self.build(path, name, stat, False)
+
+    def build(self, path: str, name: str, stat: tuple, gzip: bool) -> Asset:
+        length = stat[6]
+        etag = '"%x-%x%s"' % (length, stat[8], '-gz' if gzip else '')
+
+        ext = name.split('.')[-1]
+        headers = 'HTTP/1.1 200 OK\r\n'
+        headers += 'Content-Type: {}\r\n'.format(MIME_TYPES.get(ext, 'text/html'))
+        headers += 'Content-Length: {}\r\n'.format(length)
+        if gzip:
+            headers += 'Content-Encoding: gzip\r\n'
+        headers += 'ETag: {}\r\n'.format(etag)
+        headers += 'Cache-Control: max-age={}\r\n'.format(self.max_age)
+        headers += 'Server: ESPServer\r\n'
+        headers += 'Connection: close\r\n\r\n'
+
+        # revalidated file is cached for the same time again
+        not_modified = 'HTTP/1.1 304 Not Modified\r\n'
+        not_modified += 'ETag: {}\r\n'.format(etag)
+        not_modified += 'Cache-Control: max-age={}\r\n'.format(self.max_age)
+        not_modified += 'Connection: close\r\n\r\n'
+
+        body = None
+        if length <= self.max_bytes:
+            with open(path, 'rb') as f:
+                body = f.read()
+
+        return Asset(path, length, etag, headers.encode(), not_modified.encode(), body)
+
+    def get(self, url: str, gzip: bool = False) -> Asset:
+        if gzip and url in self.gzip:
+            return self.gzip[url]
+        return self.assets.get(url)
+
+    async def send(self, writer, asset: Asset):
+        """ Send headers and content in few large writes, cached content is written as it is without copying
+        """
+
+        await writer.awrite(asset.headers)
+
+        if asset.body is not None:
+            await writer.awrite(asset.body)
+            return
+
+        # shared buffer can be used only by one transfer at once
+        buffer = bytearray(len(self.buffer)) if self.busy else self.buffer
+        shared = buffer is self.buffer
+        self.busy = self.busy or shared
+
+        try:
+            with open(asset.path, 'rb') as f:
+                while True:
+                    size = f.readinto(buffer)
+                    if not size:
+                        break
+                    await writer.awrite(buffer, 0, size)
+        finally:
+            if shared:
+                self.busy = False
+
+
 class WebSocketConnection:
     def __init__(self, addr: str, s: socket, close_callback):
         self.client_close = False
         self._need_check = False
+        self.received = 0
 
         self.address = addr
         self.socket = s
@@ -47,11 +182,17 @@ class WebSocketConnection:
         if not msg_bytes or self.client_close:
             raise ClientClosedError()
 
+        self.received += 1
         return msg_bytes
 
-    def write(self, msg):
+    def write(self, msg, binary: bool = False):
         try:
-            self.ws.write(msg)
+            if binary:
+                self.ws.ioctl(9, FRAME_BIN)
+                self.ws.write(msg)
+                self.ws.ioctl(9, FRAME_TXT)
+            else:
+                self.ws.write(msg)
         except OSError:
             self.client_close = True
 
@@ -68,6 +209,79 @@ class WebSocketConnection:
             self.close_callback(self)
 
 
+class StreamConnection(WebSocketConnection):
+    """ WebSocket connection driven by uasyncio streams. Frames are decoded when data arrives and handed to client
+    through read(), so WebSocketClient.process() works the same way as with polled connection. Socket belongs to the
+    task which reads from it, the task closes it when connection is closed.
+    """
+
+    def __init__(self, addr: str, reader, writer, close_callback):
+        self.client_close = False
+        self._need_check = False
+
+        self.address = addr
+        self.reader = reader
+        self.writer = writer
+        self.socket = writer.s
+        self.ws = websocket(self.socket, True)
+        self.close_callback = close_callback
+        self.message = None
+        self.received = 0
+
+    async def _read(self, size: int) -> bytes:
+        # stream of uasyncio returns less data when client disconnects
+        data = await self.reader.readexactly(size)
+        if len(data) < size:
+            raise EOFError()
+        return data
+
+    async def receive(self):
+        """ Wait for next frame, returns payload or None for control frames
+        """
+
+        header = await self._read(2)
+        opcode = header[0] & 0x0f
+        length = header[1] & 0x7f
+
+        if length == 126:
+            length = ustruct.unpack('>H', await self._read(2))[0]
+        elif length == 127:
+            length = ustruct.unpack('>Q', await self._read(8))[0]
+
+        mask = await self._read(4) if header[1] & 0x80 else None
+        payload = bytearray(await self._read(length))
+
+        if mask:
+            for i in range(length):
+                payload[i] ^= mask[i & 3]
+
+        if opcode == OP_CLOSE:
+            raise ClientClosedError()
+
+        if opcode == OP_PING:
+            self.socket.write(bytes((0x80 | OP_PONG, length)) + payload)
+            return None
+
+        if opcode == OP_PONG:
+            return None
+
+        return payload
+
+    def read(self):
+        msg_bytes = self.message
+        self.message = None
+        if msg_bytes:
+            self.received += 1
+        return msg_bytes
+
+    def close(self):
+        print("Closing connection.")
+        self.socket = None
+        self.ws = None
+        if self.close_callback:
+            self.close_callback(self)
+
+
 class WebSocketClient:
     def __init__(self, conn: WebSocketConnection):
         self.connection = conn
@@ -78,13 +292,24 @@ class WebSocketClient:
 
 class WebSocketServer:
 
-    def __init__(self, max_connections: int = 1):
+    def __init__(self, max_connections: int = 1, cache_bytes: int = 8192, max_age: int = 3600):
         self._listen_s = None
         self._listen_poll = None
         self._clients = []
         self._max_connections = max_connections
         self._web_dir = 'www'
 
+        # static files are loaded into cache on first request
+        self._assets = None
+        self._cache_bytes = cache_bytes
+        self._max_age = max_age
+
+        # counters to compare polled and event-driven core, ready_ms is time since boot when server listens
+        self.started = utime.ticks_ms()
+        self.ready_ms = None
+        self.wakeups = self.commands = 0
+        self.latency_us = self.latency_max_us = self.latency_total_us = 0
+
     def _make_client(self, conn: WebSocketConnection) -> WebSocketClient:
         return WebSocketClient(conn)
 
@@ -113,96 +338,132 @@ class WebSocketServer:
         cl, remote_addr = self._listen_s.accept()
         print("Client connection from:", remote_addr)
 
+        # request is read in background, client which sends it slowly (or not at all) doesn't block the loop
+        cl.setblocking(False)
+        self._spawn(self._accept_request(cl, remote_addr))
+
+    async def _accept_request(self, cl, remote_addr):
+        """ Read whole request head before deciding, browsers send Upgrade header far from its beginning
+        """
+
+        writer = asyncio.StreamWriter(cl, {})
+        try:
+            request, headers = await self._read_request(asyncio.StreamReader(cl))
+        except OSError:
+            await self._close(writer)
+            return
+
         if len(self._clients) >= self._max_connections:
             # Maximum connections limit reached
-            cl.setblocking(True)
-            self._generate_static_page(cl, 503, '503 Too Many Connections')
+            await self._send_page(writer, 503, '503 Too Many Connections')
             return
 
-        data = cl.recv(64).decode()
-        if data and 'Upgrade: websocket' not in data.split('\r\n') and 'GET' == data.split(' ')[0]:
-            # data should looks like GET /index.html HTTP/1.1\r\nHost: 19'
-            # requested file is on second position in data, ignore all get parameters after question mark
-            requested_file = data.split(' ')[1].split('?')[0]
-            requested_file = "/index.html" if requested_file in [None, '/'] else requested_file
-
-            cl.setblocking(True)
-            self._serve_file(requested_file, cl)
+        if headers.get('upgrade', '').lower() != 'websocket':
+            try:
+                await self._serve_request(writer, request, headers)
+            except OSError:
+                pass
             return
 
-        try:
-            websocket_helper.server_handshake(cl)
+        if await self._handshake(writer, headers):
             self._clients.append(self._make_client(WebSocketConnection(remote_addr, cl, self.remove_connection)))
-        except OSError:
-            self._generate_static_page(cl, 500, '500 Internal Server Error [2]')
 
-    def _serve_file(self, file: str, sock: socket):
-        try:
-            # check if file exists in web directory
-            path = file.split('/')
-            filename = path[-1]
-            subdir = '/' + '/'.join(path[1:-1]) if len(path) > 2 else ''
+    @staticmethod
+    def _spawn(coro):
+        asyncio.get_event_loop().create_task(coro)
 
-            if filename not in os.listdir(self._web_dir + subdir):
-                self._generate_static_page(sock, 404, '404 Not Found')
-                return
+    @staticmethod
+    async def _read_request(reader) -> tuple:
+        """ Read request line and headers
+        """
 
-            file_path = self._web_dir + file
-            length = os.stat(file_path)[6]
-            sock.sendall(self._generate_headers(200, file_path, length))
-            # Process page by lines to avoid large strings
-            with open(file_path, 'r') as f:
-                for line in f:
-                    sock.sendall(line)
-            sleep(0.1)
-            sock.close()
-        except OSError:
-            self._generate_static_page(sock, 500, '500 Internal Server Error [2]')
+        data = b''
+        lines = []
+        while True:
+            while b'\r\n' not in data:
+                chunk = await reader.readline()
+                if not chunk:
+                    break
+                data += chunk
+            line, _, data = data.partition(b'\r\n')
+            if not line:
+                break
+            lines.append(line)
+
+        headers = {}
+        for line in lines[1:]:
+            key, _, value = line.decode().partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        return lines[0].decode() if lines else '', headers
 
     @staticmethod
-    def _generate_headers(code: int, file_name: str = None, length: int = None) -> str:
+    async def _handshake(writer, headers: dict) -> bool:
+        """ Answer WebSocket upgrade, returns False when request was wrong and error page was sent
+        """
 
-        header = ''
-        content_type = 'text/html'
+        try:
+            accept = ubinascii.b2a_base64(uhashlib.sha1(headers['sec-websocket-key'].encode() + WEBSOCKET_GUID).digest())
+            await writer.awrite(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                                b'Sec-WebSocket-Accept: ' + accept[:-1] + b'\r\n\r\n')
+        except (KeyError, OSError):
+            await WebSocketServer._send_page(writer, 500, '500 Internal Server Error [2]')
+            return False
+
+        return True
+
+    async def _serve_request(self, writer, request: str, headers: dict):
+        parts = request.split(' ')
+        if len(parts) < 2 or parts[0] != 'GET':
+            await self._send_page(writer, 404, '404 Not Found')
+            return
 
-        http_codes = {
-            200: 'OK',
-            404: 'Not Found',
-            500: 'Internal Server Error',
-            503: 'Service Unavailable'
-        }
+        # requested file is on second position in request, ignore all get parameters after question mark
+        requested_file = parts[1].split('?')[0]
+        requested_file = "/index.html" if requested_file in [None, '/'] else requested_file
 
-        mime_types = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'html': 'text/html',
-            'htm': 'text/html',
-            'css': 'text/css',
-            'js': 'application/javascript'
-        }
+        if self._assets is None:
+            self._assets = AssetCache(self._web_dir, self._cache_bytes, self._max_age)
 
-        if code in http_codes:
-            header = 'HTTP/1.1 {} {}\n'.format(code, http_codes[code])
+        asset = self._assets.get(requested_file, 'gzip' in headers.get('accept-encoding', ''))
+        if asset is None:
+            await self._send_page(writer, 404, '404 Not Found')
+            return
 
-        if file_name is not None:
-            ext = file_name.split('.')[1]
-            if ext in mime_types:
-                content_type = mime_types[ext]
+        try:
+            if headers.get('if-none-match') == asset.etag:
+                await writer.awrite(asset.not_modified)
+            else:
+                await self._assets.send(writer, asset)
+        finally:
+            await writer.aclose()
+
+    @staticmethod
+    def _generate_headers(code: int, file_name: str = None, length: int = None) -> bytes:
+
+        content_type = 'text/html'
 
-        header += 'Content-Type: {}\n'.format(content_type)
-        header += 'Content-Length: {}\n'.format(length)
-        header += 'Server: ESPServer\n'
-        header += 'Connection: close\n\n'  # Close connection after completing the request
-        return header
+        if file_name is not None:
+            ext = file_name.split('.')[-1]
+            if ext in MIME_TYPES:
+                content_type = MIME_TYPES[ext]
+
+        header = 'HTTP/1.1 {} {}\r\n'.format(code, HTTP_CODES.get(code, ''))
+        header += 'Content-Type: {}\r\n'.format(content_type)
+        if length is not None:
+            header += 'Content-Length: {}\r\n'.format(length)
+        header += 'Server: ESPServer\r\n'
+        header += 'Connection: close\r\n\r\n'  # Close connection after completing the request
+        return header.encode()
 
     @staticmethod
-    def _generate_static_page(sock: socket, code: int, message: str):
-        sock.sendall(WebSocketServer._generate_headers(code))
-        sock.sendall('<html><body><h1>' + message + '</h1></body></html>')
-        sleep(0.1)
-        sock.close()
+    async def _send_page(writer, code: int, message: str):
+        try:
+            await writer.awrite(WebSocketServer._generate_headers(code))
+            await writer.awrite('<html><body><h1>' + message + '</h1></body></html>')
+            await writer.aclose()
+        except OSError:
+            pass
 
     def stop(self):
         if self._listen_poll:
@@ -212,25 +473,138 @@ class WebSocketServer:
             self._listen_s.close()
         self._listen_s = None
 
-        for client in self._clients:
-            client.connection.close()
+        for client in self._clients[:]:
+            conn = client.connection
+            conn.close()
+            if isinstance(conn, StreamConnection):
+                # loop doesn't run any more, so reading task won't close the socket
+                conn.writer.s.close()
         print("Stopped WebSocket server.")
 
     def start(self, port: int = 80):
         if self._listen_s:
             self.stop()
         self._setup_conn(port)
+        self.ready_ms = utime.ticks_ms()
         print("Started WebSocket server.")
 
     async def process_all(self):
         while True:
+            self.wakeups += 1
             self._check_new_connections(self._accept_conn)
 
             for client in self._clients:
+                start = utime.ticks_us()
+                received = client.connection.received
                 client.process()
+                if client.connection.received != received:
+                    self._record(start)
 
             await asyncio.sleep_ms(10)
 
+    def serve(self, port: int = 80):
+        """ Event-driven alternative to start() and process_all(), wakes up only when client connects or sends data.
+        Accept loop of uasyncio v2 (start_server() of v2 never returns, so the server couldn't be stopped), it ends
+        when stop() closes listening socket.
+        """
+
+        self.start(port)
+        listen_s = self._listen_s
+        listen_s.setblocking(False)
+
+        while listen_s is self._listen_s:
+            yield asyncio.IORead(listen_s)
+            try:
+                cl, remote_addr = listen_s.accept()
+            except OSError:
+                continue
+            cl.setblocking(False)
+            writer = asyncio.StreamWriter(cl, {'peername': remote_addr})
+            self._spawn(self._handle_stream(asyncio.StreamReader(cl), writer))
+
+    async def _handle_stream(self, reader, writer):
+        self.wakeups += 1
+        remote_addr = writer.get_extra_info('peername')
+        print("Client connection from:", remote_addr)
+
+        # exception left in a task stops the whole loop of uasyncio v2
+        try:
+            request, headers = await self._read_request(reader)
+        except OSError:
+            await self._close(writer)
+            return
+
+        if len(self._clients) >= self._max_connections:
+            # Maximum connections limit reached
+            await self._send_page(writer, 503, '503 Too Many Connections')
+            return
+
+        if headers.get('upgrade', '').lower() != 'websocket':
+            try:
+                await self._serve_request(writer, request, headers)
+            except OSError:
+                pass
+            return
+
+        if not await self._handshake(writer, headers):
+            return
+
+        conn = StreamConnection(remote_addr, reader, writer, self.remove_connection)
+        client = self._make_client(conn)
+        self._clients.append(client)
+
+        try:
+            while not conn.is_closed():
+                msg = await conn.receive()
+                self.wakeups += 1
+                if msg is None:
+                    continue
+
+                start = utime.ticks_us()
+                conn.message = msg
+                client.process()
+                self._record(start)
+        except (EOFError, OSError, ClientClosedError):
+            pass
+
+        if not conn.is_closed():
+            conn.close()
+        await self._close(writer)
+
+    @staticmethod
+    async def _close(writer):
+        """ Close socket of stream, aclose() also takes it out of poller of uasyncio
+        """
+
+        try:
+            await writer.aclose()
+        except OSError:
+            pass
+
+    def _record(self, start: int):
+        latency = utime.ticks_diff(utime.ticks_us(), start)
+        self.commands += 1
+        self.latency_us = latency
+        self.latency_total_us += latency
+        if latency > self.latency_max_us:
+            self.latency_max_us = latency
+
+    def stats(self) -> dict:
+        """ Wakeups per second show idle cost of server core, latency is time of processing one client read
+        """
+
+        uptime = utime.ticks_diff(utime.ticks_ms(), self.started)
+        return {
+            'ready_ms': self.ready_ms,
+            'uptime_ms': uptime,
+            'wakeups': self.wakeups,
+            'wakeups_per_second': self.wakeups * 1000 // uptime if uptime else 0,
+            'commands': self.commands,
+            'latency_us': self.latency_us,
+            'latency_max_us': self.latency_max_us,
+            'latency_avg_us': self.latency_total_us // self.commands if self.commands else 0,
+        }
+
     def remove_connection(self, conn):
         for client in self._clients:
             if client.connection is conn: